@@ -0,0 +1,14 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Host-side collector that polls a fleet of sensortech boards
+
+Runs on a regular computer, not on the boards. See collector/__main__.py
+for the command line.
+"""
+
+from collector.poller import Collector
+from collector.store import Store
+
+__all__ = ["Collector", "Store"]
@@ -0,0 +1,121 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Poll sensortech boards and report what was collected
+
+    python -m collector http://sensortech-1.local http://sensortech-2.local --duration 60
+
+--emulate N polls N emulated boards (see collector/emulator.py) instead.
+The emulator runs in a separate process, so the two don't share a CPU.
+--scale polls a growing fleet of emulated boards, one run per count, and
+reports how throughput grows with it:
+
+    python -m collector --scale 10,50,100,200 --duration 20
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+from urllib.parse import urlsplit
+
+from collector import emulator
+from collector.poller import Collector
+from collector.store import Store
+
+# First port the emulated boards listen on
+EMULATOR_PORT = 19000
+
+
+def emulate(devices, port, close, ready):
+    async def main():
+        await emulator.serve(devices, port, close=close)
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def start_emulator(devices, port, close):
+    """Run devices emulated boards in another process; returns it once they're listening"""
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=emulate, args=(devices, port, close, ready), daemon=True)
+    process.start()
+    if not ready.wait(30):
+        process.terminate()
+        raise RuntimeError("emulator didn't start")
+    return process
+
+
+def collect(targets, duration, min_interval, max_interval):
+    """Poll targets, a list of (name, host, port), for duration seconds; returns the stats"""
+    store = Store()
+    collector = Collector(store)
+    for name, host, port in targets:
+        collector.add(name, host, port, min_interval=min_interval, max_interval=max_interval)
+    started = time.monotonic()
+    asyncio.run(collector.run(duration))
+    elapsed = time.monotonic() - started
+    stats = collector.stats()
+    stats["elapsed"] = elapsed
+    stats["stored"] = len(store)
+    return stats
+
+
+def report(stats):
+    elapsed = stats["elapsed"]
+    print(f"{stats['devices']} devices: {stats['polls'] / elapsed:.1f} polls/s, "
+          f"{stats['samples'] / elapsed:.1f} samples/s ({stats['backfilled']} backfilled), "
+          f"{stats['not_modified']} not modified, {stats['errors']} errors, "
+          f"{stats['requests']} requests on {stats['connects']} connections")
+
+
+def emulated(devices, port):
+    return [(f"emulated-{index}", "127.0.0.1", port + index) for index in range(devices)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("urls", nargs="*", help="boards to poll, as http://host[:port]")
+    parser.add_argument("--emulate", type=int, metavar="N", help="poll N emulated boards")
+    parser.add_argument("--scale", metavar="COUNTS", help="comma-separated emulated board counts to compare")
+    parser.add_argument("--close", action="store_true",
+                        help="emulated boards close every connection, as the real board does")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to poll for")
+    parser.add_argument("--min-interval", type=float, default=1, help="shortest seconds between polls")
+    parser.add_argument("--max-interval", type=float, default=10, help="longest seconds between polls")
+    args = parser.parse_args()
+
+    if args.scale:
+        counts = [int(count) for count in args.scale.split(",")]
+    elif args.emulate:
+        counts = [args.emulate]
+    else:
+        counts = []
+        if not args.urls:
+            parser.error("give some board URLs, --emulate or --scale")
+
+    if not counts:
+        targets = []
+        for url in args.urls:
+            parts = urlsplit(url if "//" in url else "http://" + url)
+            targets.append((parts.hostname, socket.gethostbyname(parts.hostname), parts.port or 80))
+        report(collect(targets, args.duration, args.min_interval, args.max_interval))
+        return
+
+    port = EMULATOR_PORT
+    for count in counts:
+        process = start_emulator(count, port, args.close)
+        try:
+            report(collect(emulated(count, port), args.duration, args.min_interval, args.max_interval))
+        finally:
+            process.terminate()
+            process.join()
+        # Fresh ports for each run, in case the last run's are slow to free up
+        port += count
+
+
+if __name__ == "__main__":
+    main()
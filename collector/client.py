@@ -0,0 +1,107 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Just enough HTTP/1.1 over asyncio streams to poll the boards
+
+One Connection per device, kept open between requests when the server
+allows it. The board's own server closes every connection after its
+response, so a closed connection is expected and quietly reopened.
+Understands Content-Length and chunked bodies, which is what the demo
+sends.
+"""
+
+import asyncio
+
+# Longest a request may take, connecting included
+TIMEOUT = 5
+
+
+class HTTPError(Exception):
+    pass
+
+
+class Connection:
+    """A reusable connection to one host and port"""
+
+    def __init__(self, host, port, timeout=TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        # Requests sent, and how many of them needed a new connection
+        self.requests = 0
+        self.connects = 0
+
+    async def _open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.connects += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def get(self, path, headers=None):
+        """GET path; returns (status, headers with lowercase names, body bytes)"""
+        return await asyncio.wait_for(self._get(path, headers), self.timeout)
+
+    async def _get(self, path, headers):
+        lines = ["GET %s HTTP/1.1" % path, "Host: %s:%d" % (self.host, self.port),
+                 "Connection: keep-alive"]
+        for name, value in (headers or {}).items():
+            lines.append("%s: %s" % (name, value))
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+        # A kept-alive connection the server has since closed fails on first use; retry once on a new one
+        reused = self.writer is not None
+        for attempt in range(2):
+            if self.writer is None:
+                await self._open()
+            try:
+                self.writer.write(request)
+                await self.writer.drain()
+                response = await self._read_response()
+                break
+            except (ConnectionError, asyncio.IncompleteReadError, HTTPError):
+                self.close()
+                if not reused or attempt:
+                    raise
+        self.requests += 1
+        status, response_headers, body = response
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, response_headers, body
+
+    async def _read_response(self):
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ", 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise HTTPError("Bad status line %r" % lines[0])
+        status = int(parts[1])
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+
+        if status in (204, 304):
+            return status, headers, b""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if not size:
+                    await self.reader.readuntil(b"\r\n")
+                    break
+                body += await self.reader.readexactly(size)
+                await self.reader.readexactly(2)
+            return status, headers, bytes(body)
+        if "content-length" in headers:
+            return status, headers, await self.reader.readexactly(int(headers["content-length"]))
+        # No length: the body runs to the end of the connection
+        body = await self.reader.read()
+        headers["connection"] = "close"
+        return status, headers, body
@@ -0,0 +1,210 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Many stand-in boards on loopback ports, for trying the collector without hardware
+
+Each emulated board serves /data and /history the way demo/code.py does. The
+JSON has the same shape, with ETags and 304s, and /history supports
+since=. The field list and the /history paging and JSON are the demo's own
+(demo/wire.py), and readings come from its simulated sensors, so the two
+can't drift apart. Every board measures the one simulated room, each with
+its own noise. Samples go into the demo's History class, so their sequence
+numbers behave the same. Boards only generate samples when asked, so a
+thousand idle ones cost nothing.
+
+    python -m collector.emulator --devices 200 --port 9000
+
+--close makes every response close its connection, as the real board's
+server does; by default connections are kept alive.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+# At the end, so demo/code.py can't shadow the standard library's code module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "demo"))
+
+from history import History  # noqa: E402
+from wire import FIELDS, history_json  # noqa: E402
+import simulated  # noqa: E402
+
+# Seconds between samples of each field, as the demo's performance profile
+# takes them at its fastest; fields missing here never get a sample
+PERIODS = {
+    'co2': 5,
+    'temperature': 5,
+    'humidity': 5,
+    'eco2': 1,
+    'tvoc': 1,
+    'ens_aqi': 1,
+    'ens_tvoc': 1,
+    'ens_eco2': 1,
+    'aht21_temperature': 1,
+    'aht21_humidity': 1,
+}
+# Same as the demo's raw history budget and /history limit
+HISTORY_BUDGET = 16 * 1024
+HISTORY_MAX_POINTS = 300
+
+
+class EmulatedDevice:
+    """One board's readings, generated on demand up to the current second"""
+
+    def __init__(self):
+        self.history = History(FIELDS, HISTORY_BUDGET)
+        self.started = time.monotonic()
+        self.boot_id = random.getrandbits(24)
+        self.version = 0
+        self.values = {field: None for field, _ in FIELDS}
+        self.times = {field: None for field, _ in FIELDS}
+        self.seqs = {field: 0 for field, _ in FIELDS}
+        self.now = 0
+        self.next_sample = dict(PERIODS)
+
+    def uptime(self):
+        return int(time.monotonic() - self.started)
+
+    def catch_up(self):
+        """Take every sample that's come due since the last request"""
+        now = self.uptime()
+        for field, period in PERIODS.items():
+            due = self.next_sample[field]
+            # No point generating more than the ring can hold
+            due = max(due, now - self.history.capacity * period)
+            while due <= now:
+                value = simulated.reading(field)
+                self.history.record(field, value, due)
+                self.values[field] = value
+                self.times[field] = due
+                self.seqs[field] = self.history.ring(field).appended
+                self.version += 1
+                self.now = due
+                due += period
+            self.next_sample[field] = due
+
+    def data(self):
+        data = dict(self.values)
+        data['sensors'] = {"SCD40": "ready", "CCS811": "ready", "ENS160": "ready", "AHT21": "ready"}
+        data['time'] = self.times
+        data['seq'] = self.seqs
+        data['now'] = self.now
+        data['boot'] = self.boot_id
+        return json.dumps(data).encode()
+
+    def history_page(self, field, since=None, n=None, limit=HISTORY_MAX_POINTS):
+        """/history for field, paged as the demo pages it: since= is limited, n= isn't"""
+        ring = self.history.ring(field)
+        if since is not None:
+            n = ring.after(since)
+        else:
+            n = self.history.capacity if n is None else n
+            limit = None
+        return "".join(history_json(field, ring, n, self.uptime(), limit=limit)).encode()
+
+
+def parse_query(target):
+    path, _, query = target.partition("?")
+    params = {}
+    for pair in query.split("&"):
+        name, _, value = pair.partition("=")
+        if name:
+            params[name] = value
+    return path, params
+
+
+async def respond(writer, status, body=b"", headers=(), close=False):
+    reasons = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found"}
+    lines = ["HTTP/1.1 %d %s" % (status, reasons[status]), "Content-Length: %d" % len(body),
+             "Connection: %s" % ("close" if close else "keep-alive")]
+    lines.extend("%s: %s" % header for header in headers)
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+
+
+def handler(device, close_always, stats):
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                target = lines[0].split(" ")[1]
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                close = close_always or headers.get("connection", "").lower() == "close"
+                stats["requests"] += 1
+
+                device.catch_up()
+                path, params = parse_query(target)
+                if path == "/data":
+                    etag = '"%x-%x"' % (device.boot_id, device.version)
+                    if headers.get("if-none-match") == etag:
+                        await respond(writer, 304, headers=[("ETag", etag)], close=close)
+                    else:
+                        await respond(writer, 200, device.data(),
+                                      [("ETag", etag), ("Content-Type", "application/json")], close)
+                elif path == "/history" and params.get("field") not in device.values:
+                    await respond(writer, 400, b"Unknown field", close=close)
+                elif path == "/history":
+                    try:
+                        since = int(params["since"]) if "since" in params else None
+                        n = int(params["n"]) if "n" in params else None
+                        limit = min(int(params.get("limit", HISTORY_MAX_POINTS)), HISTORY_MAX_POINTS)
+                    except ValueError:
+                        await respond(writer, 400, b"Bad sample count", close=close)
+                    else:
+                        await respond(writer, 200, device.history_page(params["field"], since, n, limit),
+                                      [("Content-Type", "application/json")], close)
+                else:
+                    await respond(writer, 404, b"Not found", close=close)
+                if close:
+                    return
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(devices, port, host="127.0.0.1", close=False, stats=None):
+    """Start devices emulated boards on consecutive ports from port; returns the servers"""
+    if stats is None:
+        stats = {"requests": 0}
+    servers = []
+    for index in range(devices):
+        servers.append(await asyncio.start_server(handler(EmulatedDevice(), close, stats), host, port + index))
+    return servers
+
+
+async def run(devices, port, close):
+    stats = {"requests": 0}
+    await serve(devices, port, close=close, stats=stats)
+    print(f"{devices} boards on ports {port} to {port + devices - 1}")
+    while True:
+        before = stats["requests"]
+        await asyncio.sleep(10)
+        print(f"{(stats['requests'] - before) / 10:.1f} requests/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--devices", type=int, default=100, help="boards to emulate")
+    parser.add_argument("--port", type=int, default=9000, help="port of the first board")
+    parser.add_argument("--close", action="store_true", help="close the connection after every response")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.devices, args.port, args.close))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Poll many boards' /data concurrently, backfilling from /history
+
+Each device has its own task and its own connection. Every poll is a
+conditional GET of /data, so a board with nothing new costs a 304.
+
+The per-field sample counts in "seq" show when a field has had more than
+one new sample since the last poll. The samples in between are then
+fetched with /history?since=, so polling can be slow without losing
+anything. Boards with older firmware, without "seq" or /history, only get
+their latest readings stored.
+
+Sample counts start again from 0 when a board restarts. A new "boot" id
+in /data (or, from firmware without one, a count going backwards) resets
+where the device is up to, so nothing after the restart is skipped.
+
+The interval adapts per device:
+- it stretches while polls come back 304
+- it shrinks when samples are being missed and there's no /history to
+  fill the gap
+- failures back off exponentially, with jitter, and the next success
+  resets the backoff
+"""
+
+import asyncio
+import json
+import random
+import time
+
+from collector.client import Connection, HTTPError
+
+# Seconds between polls of one device: where they start, and the range they adapt over
+MIN_INTERVAL = 1
+MAX_INTERVAL = 10
+# Failure backoff doubles from the device's interval up to this many seconds
+MAX_BACKOFF = 60
+# Samples asked for per /history page
+HISTORY_PAGE = 300
+
+
+class Device:
+    """One board: its connection, where it's up to in each field, and its polling interval"""
+
+    def __init__(self, name, host, port, store, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        self.name = name
+        self.number = store.device(name)
+        self.store = store
+        self.connection = Connection(host, port)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.etag = None
+        # The board's boot id, and field -> sequence number of the newest sample stored since then
+        self.boot = None
+        self.seqs = {}
+        self.has_history = True
+        self.failures = 0
+        self.polls = 0
+        self.not_modified = 0
+        self.errors = 0
+        self.samples = 0
+        self.backfilled = 0
+        self.reboots = 0
+
+    def delay(self):
+        """Seconds until the next poll"""
+        if not self.failures:
+            return self.interval
+        backoff = min(MAX_BACKOFF, self.interval * 2 ** self.failures)
+        return backoff * random.uniform(0.5, 1)
+
+    async def poll(self):
+        """Fetch /data, and /history for anything it skipped; adapts the interval"""
+        self.polls += 1
+        headers = {"Accept": "application/json"}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        status, response_headers, body = await self.connection.get("/data", headers)
+        if status == 304:
+            self.not_modified += 1
+            self.interval = min(self.max_interval, self.interval * 1.25)
+            return
+        if status != 200:
+            raise HTTPError("/data returned %d" % status)
+        self.etag = response_headers.get("etag")
+        data = json.loads(body)
+        received = time.time()
+        now = data.get("now")
+        seqs = data.get("seq")
+        times = data.get("time") or {}
+
+        if not seqs:
+            # Older firmware: no way to tell new samples from repeats
+            for field, value in data.items():
+                if field not in ("now", "boot") and isinstance(value, (int, float)):
+                    self.store.append(self.number, field, received, 0, value)
+                    self.samples += 1
+            return
+
+        boot = data.get("boot")
+        if boot != self.boot or any(seq < self.seqs.get(field, 0) for field, seq in seqs.items()):
+            if self.seqs:
+                self.reboots += 1
+            self.boot = boot
+            self.seqs = {}
+            # It may have come back with different firmware
+            self.has_history = True
+
+        missed = False
+        for field, seq in seqs.items():
+            value = data.get(field)
+            last = self.seqs.get(field, 0)
+            if value is None or seq <= last:
+                continue
+            if seq > last + 1 and self.has_history:
+                missed |= not await self.backfill(field, last, received, now)
+                if self.seqs.get(field, 0) >= seq:
+                    continue
+            elif seq > last + 1 and last:
+                missed = True
+            when = received if now is None or times.get(field) is None else received - (now - times[field])
+            self.store.append(self.number, field, when, seq, value)
+            self.seqs[field] = seq
+            self.samples += 1
+        if missed:
+            self.interval = max(self.min_interval, self.interval / 2)
+
+    async def backfill(self, field, since, received, now):
+        """Store field's samples after since from /history; returns False if the device has no /history"""
+        while True:
+            status, _, body = await self.connection.get(
+                "/history?field=%s&since=%d&limit=%d" % (field, since, HISTORY_PAGE),
+                {"Accept": "application/json"})
+            if status == 404:
+                self.has_history = False
+                return False
+            if status != 200:
+                raise HTTPError("/history returned %d" % status)
+            history = json.loads(body)
+            if "seq" not in history:
+                # /history from before since= existed answers with the newest samples instead
+                self.has_history = False
+                return False
+            samples = history["samples"]
+            first = history["seq"] - len(samples) + 1
+            offset = received - history["now"] if now is None else received - now
+            for index, (timestamp, value) in enumerate(samples):
+                self.store.append(self.number, field, timestamp + offset, first + index, value)
+            self.samples += len(samples)
+            self.backfilled += len(samples)
+            if samples:
+                since = self.seqs[field] = history["seq"]
+            if not history.get("more") or not samples:
+                return True
+
+
+class Collector:
+    """Polls every device in its own task, at most concurrency requests at a time"""
+
+    def __init__(self, store, concurrency=256):
+        self.store = store
+        self.devices = []
+        self.limit = asyncio.Semaphore(concurrency)
+
+    def add(self, name, host, port, **kwargs):
+        device = Device(name, host, port, self.store, **kwargs)
+        self.devices.append(device)
+        return device
+
+    async def run_device(self, device, deadline=None):
+        # Spread the first polls out so a big fleet doesn't start in lockstep
+        await asyncio.sleep(random.uniform(0, device.interval))
+        while deadline is None or time.monotonic() < deadline:
+            try:
+                async with self.limit:
+                    await device.poll()
+                device.failures = 0
+            # A malformed body is this device's problem; it mustn't stop the others
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, HTTPError,
+                    ValueError, KeyError, TypeError, AttributeError):
+                device.errors += 1
+                device.failures += 1
+                device.connection.close()
+            await asyncio.sleep(device.delay())
+        device.connection.close()
+
+    async def run(self, duration=None):
+        """Poll until cancelled, or for duration seconds"""
+        deadline = None if duration is None else time.monotonic() + duration
+        await asyncio.gather(*(self.run_device(device, deadline) for device in self.devices))
+
+    def stats(self):
+        """Totals across all devices"""
+        totals = {"devices": len(self.devices)}
+        for name in ("polls", "not_modified", "errors", "samples", "backfilled", "reboots"):
+            totals[name] = sum(getattr(device, name) for device in self.devices)
+        totals["requests"] = sum(device.connection.requests for device in self.devices)
+        totals["connects"] = sum(device.connection.connects for device in self.devices)
+        return totals
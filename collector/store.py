@@ -0,0 +1,108 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Columnar store of readings from many devices
+
+Each field gets four parallel typed arrays: device number, time, sample
+sequence number and value. Appending is cheap, and a bulk query walks
+only the columns of the field it asks for. Times are host seconds since
+the epoch. Each sample's device uptime is moved onto the host clock
+through the device's "now" at the moment it was fetched.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class Column:
+    """One field's readings from every device, in the order they arrived"""
+
+    def __init__(self):
+        self.devices = array('H')
+        self.times = array('d')
+        self.seqs = array('L')
+        self.values = array('d')
+        # Times usually arrive in order; if one doesn't, queries fall back to a scan
+        self.sorted = True
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, device, timestamp, seq, value):
+        if self.times and timestamp < self.times[-1]:
+            self.sorted = False
+        self.devices.append(device)
+        self.times.append(timestamp)
+        self.seqs.append(seq)
+        self.values.append(value)
+
+    def span(self, start, end):
+        """Range of indexes that may hold times from start to end"""
+        if not self.sorted:
+            return 0, len(self.times)
+        return bisect_left(self.times, start), bisect_right(self.times, end)
+
+
+class Store:
+    """Readings by field and device; devices are numbered as they're added"""
+
+    def __init__(self):
+        self.columns = {}
+        self.device_names = []
+        self._device_numbers = {}
+
+    def device(self, name):
+        """The number of the device called name, adding it if it's new"""
+        number = self._device_numbers.get(name)
+        if number is None:
+            number = self._device_numbers[name] = len(self.device_names)
+            self.device_names.append(name)
+        return number
+
+    def append(self, device, field, timestamp, seq, value):
+        column = self.columns.get(field)
+        if column is None:
+            column = self.columns[field] = Column()
+        column.append(device, timestamp, seq, value)
+
+    def __len__(self):
+        return sum(len(column) for column in self.columns.values())
+
+    def query(self, field, start=0, end=float("inf"), devices=None):
+        """Columns (devices, times, seqs, values) of field's readings from start to end
+
+        devices, if given, is a collection of device numbers to keep. Comes
+        back as four arrays, in arrival order.
+        """
+        result = (array('H'), array('d'), array('L'), array('d'))
+        column = self.columns.get(field)
+        if column is None:
+            return result
+        first, last = column.span(start, end)
+        out_devices, out_times, out_seqs, out_values = result
+        for index in range(first, last):
+            timestamp = column.times[index]
+            if not start <= timestamp <= end:
+                continue
+            device = column.devices[index]
+            if devices is not None and device not in devices:
+                continue
+            out_devices.append(device)
+            out_times.append(timestamp)
+            out_seqs.append(column.seqs[index])
+            out_values.append(column.values[index])
+        return result
+
+    def latest(self, field):
+        """device number -> (time, value) of its newest reading of field"""
+        latest = {}
+        column = self.columns.get(field)
+        if column is None:
+            return latest
+        for index in range(len(column)):
+            device = column.devices[index]
+            timestamp = column.times[index]
+            if device not in latest or timestamp >= latest[device][0]:
+                latest[device] = (timestamp, column.values[index])
+        return latest
@@ -0,0 +1,199 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Running comparison of the eCO2 estimates against the SCD4x's measured CO2
+
+Every new sample is fed in as it arrives, and nothing is kept but running
+sums, so memory is fixed however long the board runs:
+- each field's mean and spread since boot, by Welford's method
+- per eCO2 sensor, its error against the true CO2 since boot (bias and
+  spread), and over a rolling window: mean absolute error, RMS error and
+  Pearson correlation
+- an estimate of how far each eCO2 sensor lags behind the true CO2
+
+The rolling window is exponentially weighted: a window of N samples
+weights each new one 2/(N+1), which averages over about the last N
+samples without having to keep them. Every CO2 sample pairs with each
+eCO2 sensor's latest reading, so the lag is found in steps of the CO2
+sampling period. It's the delay, up to LAGS CO2 samples, at which the
+two correlate best.
+"""
+
+import math
+from array import array
+
+# eCO2 estimates, and the measured CO2 they're compared with
+REFERENCE = 'co2'
+CANDIDATES = ('eco2', 'ens_eco2')
+
+# Samples in the rolling window
+WINDOW = 60
+
+# CO2 samples of delay tried when looking for the lag
+LAGS = 12
+
+# Ignore an eCO2 reading older than this many seconds when a CO2 sample arrives
+MAX_AGE = 30
+
+# Pairs a delay needs before its correlation counts toward the lag
+MIN_PAIRS = 10
+
+# Running sums kept per lag: mean x, mean y, var x, var y, covariance
+SUMS = 5
+
+
+class Welford:
+    """Count, mean and variance since the first value, without losing precision to big sums"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+    def report(self):
+        variance = self.variance()
+        return {"count": self.count, "mean": self.mean if self.count else None,
+                "stdev": math.sqrt(variance) if variance is not None else None}
+
+
+def correlation(sums, offset=0):
+    """Pearson r from the running sums at offset, or None until both sides have varied"""
+    var_x, var_y = sums[offset + 2], sums[offset + 3]
+    if var_x <= 0 or var_y <= 0:
+        return None
+    return sums[offset + 4] / math.sqrt(var_x * var_y)
+
+
+def add_pair(sums, offset, alpha, x, y):
+    """Fold (x, y) into the exponentially weighted means, variances and covariance at offset"""
+    dx = x - sums[offset]
+    dy = y - sums[offset + 1]
+    sums[offset] += alpha * dx
+    sums[offset + 1] += alpha * dy
+    keep = 1 - alpha
+    sums[offset + 2] = keep * (sums[offset + 2] + alpha * dx * dx)
+    sums[offset + 3] = keep * (sums[offset + 3] + alpha * dy * dy)
+    sums[offset + 4] = keep * (sums[offset + 4] + alpha * dx * dy)
+
+
+class Comparison:
+    """One eCO2 sensor against the true CO2"""
+
+    def __init__(self, candidate, window=WINDOW, lags=LAGS):
+        self.candidate = candidate
+        self.alpha = 2 / (window + 1)
+        self.error = Welford()
+        self.pairs = 0
+        self.mae = 0.0
+        self.mse = 0.0
+        # Sums for the correlation of this eCO2 reading with the CO2 reading k samples earlier,
+        # at k * SUMS; lag 0 is the plain rolling correlation
+        self.sums = array('f', bytes(4 * SUMS * lags))
+        self.lags = lags
+
+    def add(self, history, filled, value):
+        """Pair value with the newest CO2 sample; history[k] is the CO2 sample k before it"""
+        error = value - history[0]
+        self.error.add(error)
+        if self.pairs:
+            self.mae += self.alpha * (abs(error) - self.mae)
+            self.mse += self.alpha * (error * error - self.mse)
+        else:
+            self.mae = abs(error)
+            self.mse = error * error
+            # Start every mean at the first pair rather than at 0
+            for lag in range(self.lags):
+                self.sums[lag * SUMS] = history[0]
+                self.sums[lag * SUMS + 1] = value
+        self.pairs += 1
+        for lag in range(min(filled, self.lags)):
+            add_pair(self.sums, lag * SUMS, self.alpha, history[lag], value)
+
+    def lag(self):
+        """(lag in CO2 samples, its correlation) for the best-correlated delay"""
+        best, best_r = None, None
+        for lag in range(min(self.lags, self.pairs - MIN_PAIRS + 1)):
+            r = correlation(self.sums, lag * SUMS)
+            if r is not None and (best_r is None or r > best_r):
+                best, best_r = lag, r
+        return best, best_r
+
+    def report(self, reference_period):
+        bias = self.error.report()
+        lag, lag_r = self.lag()
+        return {
+            "pairs": self.pairs,
+            "bias": bias["mean"],
+            "error_stdev": bias["stdev"],
+            "mae": self.mae if self.pairs else None,
+            "rmse": math.sqrt(self.mse) if self.pairs else None,
+            "pearson": correlation(self.sums),
+            "lag_samples": lag,
+            "lag_seconds": None if lag is None or reference_period is None else lag * reference_period,
+            "lag_pearson": lag_r,
+        }
+
+
+class Analytics:
+    """Feeds each new sample into the statistics; report() is what /stats serves"""
+
+    def __init__(self, fields=(REFERENCE,) + CANDIDATES, window=WINDOW, lags=LAGS):
+        self.window = window
+        self.fields = {field: Welford() for field in fields}
+        self.comparisons = tuple(Comparison(candidate, window, lags) for candidate in CANDIDATES
+                                 if candidate in self.fields)
+        # Latest reading and its time for each eCO2 sensor
+        self.latest = {candidate: (None, None) for candidate in CANDIDATES}
+        # The newest CO2 samples, newest first, for the lag estimate
+        self.history = array('f', bytes(4 * lags))
+        self.filled = 0
+        self.last_reference = None
+        self.reference_period = None
+
+    def add(self, field, value, timestamp):
+        stats = self.fields.get(field)
+        if stats is None:
+            return
+        stats.add(value)
+        if field in self.latest:
+            self.latest[field] = (value, timestamp)
+        elif field == REFERENCE:
+            self._add_reference(value, timestamp)
+
+    def _add_reference(self, value, timestamp):
+        if self.last_reference is not None and timestamp > self.last_reference:
+            interval = timestamp - self.last_reference
+            if self.reference_period is None:
+                self.reference_period = interval
+            else:
+                self.reference_period += 2 / (self.window + 1) * (interval - self.reference_period)
+        self.last_reference = timestamp
+        history = self.history
+        for index in range(len(history) - 1, 0, -1):
+            history[index] = history[index - 1]
+        history[0] = value
+        self.filled = min(self.filled + 1, len(history))
+        for comparison in self.comparisons:
+            candidate, when = self.latest[comparison.candidate]
+            if candidate is not None and timestamp - when <= MAX_AGE:
+                comparison.add(history, self.filled, candidate)
+
+    def report(self):
+        return {
+            "reference": REFERENCE,
+            "window": self.window,
+            "reference_period": self.reference_period,
+            "fields": {field: stats.report() for field, stats in self.fields.items()},
+            "compare": {comparison.candidate: comparison.report(self.reference_period)
+                        for comparison in self.comparisons},
+        }
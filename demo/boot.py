@@ -0,0 +1,31 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Make CIRCUITPY writable by code.py when the flash log is turned on
+
+CircuitPython only lets one side write to CIRCUITPY: normally that's the
+computer over USB. With SENSORTECH_LOG = 1 in settings.toml, code.py gets
+it instead, so it can log readings. Hold the BOOT button while resetting to
+leave it writable over USB, to edit files or turn the log back off.
+"""
+
+import storage
+from config import setting
+
+if setting("LOG", False):
+    usb_writable = False
+    try:
+        import board
+        import digitalio
+        button = digitalio.DigitalInOut(board.BUTTON)
+        button.switch_to_input(pull=digitalio.Pull.UP)
+        usb_writable = not button.value
+        button.deinit()
+    except (ImportError, AttributeError):
+        pass
+
+    if usb_writable:
+        print("BOOT button held, CIRCUITPY left writable over USB and the log is off")
+    else:
+        storage.remount("/", readonly=False)
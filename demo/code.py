@@ -3,63 +3,81 @@
 # SPDX-License-Identifier: CC0-1.0
 
 import time
-import board
-import busio
-import adafruit_scd4x
-import adafruit_ccs811
-import adafruit_ens160
-import adafruit_ahtx0
-import json
+import asyncio
 import gc
-import wifi
-import socketpool
-from adafruit_httpserver import Request, Response, ChunkedResponse, Server
-
-i2c = busio.I2C(board.IO36, board.IO35)
-
-# Initialize SCD40
-scd4x = None
-try:
-    scd4x = adafruit_scd4x.SCD4X(i2c)
-except Exception as e:
-    print(f"Error initializing SCD40: {e}")
-
-# Initialize CCS811
-ccs = None
-try:
-    ccs = adafruit_ccs811.CCS811(i2c)
-except Exception as e:
-    print(f"Error initializing CCS811: {e}")
-
-# Initialize ENS160
-ens = None
-try:
-    ens = adafruit_ens160.ENS160(i2c)
-    time.sleep(5)
-
-    ens.clear_command()
-    ens.reset()
-    time.sleep(5)
-
-    ens.temperature_compensation = 25
-    ens.humidity_compensation = 50
-
-    print("ENS160 Firmware Vers: ", ens.firmware_version)
-    print("ENS160 part id: ", ens.part_id)
-
-    ens.mode = adafruit_ens160.MODE_IDLE
-    time.sleep(1)
-    ens.mode = adafruit_ens160.MODE_STANDARD
-
-except Exception as e:
-    print(f"Error initializing ENS160: {e}")
-
-# Initialize AHT21
-aht21 = None
-try:
-    aht21 = adafruit_ahtx0.AHTx0(i2c)
-except Exception as e:
-    print(f"Error initializing AHT21: {e}")
+import random
+from adafruit_httpserver import (Request, Response, ChunkedResponse, JSONResponse, Server,
+                                 NO_REQUEST, BAD_REQUEST_400, NOT_FOUND_404, SERVICE_UNAVAILABLE_503)
+from config import ON_DEVICE, setting, mem_free
+from logger import log, level_number
+from history import History, uptime
+from static import StaticFiles, NOT_MODIFIED_304
+from sensors import start_sensors, detect, load_drivers, REGISTRY, READY
+from metrics import Metrics, now_us
+from power import Power
+from publish import Publisher, EventStream
+from analytics import Analytics
+from heap import Heap
+import wire
+from wire import FIELDS, FIELD_INDEX
+import codec
+
+# What the log keeps and what it echoes to the serial console: debug, info, warning or error
+log.level = level_number(setting("LOGGER_LEVEL", "info"))
+log.console_level = level_number(setting("CONSOLE_LEVEL", "info"))
+
+# Use simulated sensors instead of the I2C bus; always the case off the device
+SIMULATE = setting("SIMULATE", not ON_DEVICE)
+
+if SIMULATE:
+    import simulated
+    # Which sensors the simulated bus has, as I2C addresses; all four by default
+    SIMULATED_ADDRESSES = setting("SIMULATED_ADDRESSES", "")
+    i2c = simulated.I2C(latency=setting("I2C_LATENCY", 0.001),
+                        error_rate=setting("I2C_ERROR_RATE", 0.0))
+    if SIMULATED_ADDRESSES:
+        i2c.addresses = tuple(int(address, 0) for address in SIMULATED_ADDRESSES.split(","))
+
+    def importer(driver):
+        return simulated
+else:
+    import board
+    import busio
+    i2c = busio.I2C(board.IO36, board.IO35)
+    importer = __import__
+
+# Only import the drivers for sensors that answer a bus scan. If nothing
+# answers, or with SCAN turned off, import them all and keep probing.
+found = {}
+if setting("SCAN", True):
+    found = detect(i2c)
+    if not found:
+        log.warning("No sensors found by scanning, trying them all")
+drivers = load_drivers(found or REGISTRY, importer)
+sensors = start_sensors(i2c, drivers, found)
+scd = sensors.get('adafruit_scd4x')
+ens = sensors.get('adafruit_ens160')
+aht21 = sensors.get('adafruit_ahtx0')
+
+# SCD4x CO2 compensation: metres above sea level, or the ambient pressure
+# in hPa if you know it; 0 leaves the sensor's own setting
+ALTITUDE = setting("ALTITUDE", 0)
+AMBIENT_PRESSURE = setting("AMBIENT_PRESSURE", 0)
+if scd and ALTITUDE:
+    scd.altitude = ALTITUDE
+
+# Battery operation: performance, low_power or single_shot, see power.py
+power = Power(setting("POWER_PROFILE", "performance"),
+              interval=setting("POWER_INTERVAL", 300),
+              light_sleep=setting("POWER_LIGHT_SLEEP", False))
+power.configure(sensors)
+log.info("Power profile: %s", power.profile)
+
+metrics = Metrics()
+metrics.power = power
+# Garbage collection in the server loop's idle time
+heap = Heap()
+metrics.heap = heap
 
 # Store latest sensor data
 sensor_data = {
@@ -76,845 +94,559 @@ sensor_data = {
     'aht21_humidity': None
 }
 
-# HTML page with Chart.js graphing
-HTML_PAGE = '''<!DOCTYPE html>
-<html>
-<head>
-    <title>Sensor Dashboard</title>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <script src="/chart.js"></script>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 20px;
-            background-color: #f5f5f5;
-        }
-        .sensor-card {
-            background: white;
-            border-radius: 10px;
-            padding: 20px;
-            margin: 20px 0;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }
-        .sensor-value {
-            font-size: 2em;
-            font-weight: bold;
-            color: #2196F3;
-        }
-        .sensor-label {
-            color: #666;
-            margin-bottom: 10px;
-        }
-
-        .grid {
-            display: grid;
-            grid-template-columns: repeat(2, 1fr);
-            gap: 20px;
-        }
-        .temp-humidity-row {
-            display: grid;
-            grid-template-columns: repeat(2, 1fr);
-            gap: 20px;
-            margin-top: 20px;
-        }
-        .timestamp {
-            text-align: center;
-            color: #666;
-            font-size: 0.9em;
-            margin-top: 20px;
-        }
-        .chart-container {
-            position: relative;
-            height: 300px;
-            margin-top: 20px;
-        }
-        .sensor-info {
-            display: flex;
-            align-items: center;
-            gap: 20px;
-        }
-        .value-display {
-            min-width: 120px;
-        }
-        .bottom-sensors {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-            gap: 20px;
-            margin-top: 20px;
-        }
-    </style>
-</head>
-<body>
-    <h1>Sensor Dashboard <span id="connectionStatus">❌</span></h1>
-    
-    <div class="grid">
-        <div class="sensor-card" id="co2Card" style="display: none;">
-            <div class="sensor-info">
-                <div class="value-display">
-                    <div class="sensor-label">CO2 (SCD40)</div>
-                    <div class="sensor-value" id="co2">--</div>
-                    <div>ppm</div>
-                </div>
-                <div class="chart-container">
-                    <canvas id="co2Chart"></canvas>
-                </div>
-            </div>
-        </div>
-    </div>
-
-    <div class="temp-humidity-row">
-        
-        <div class="sensor-card" id="tvocCard" style="display: none;">
-            <div class="sensor-info">
-                <div class="value-display">
-                    <div class="sensor-label">TVOC (CCS811)</div>
-                    <div class="sensor-value" id="tvoc">--</div>
-                    <div>ppb</div>
-                </div>
-                <div class="chart-container">
-                    <canvas id="tvocChart"></canvas>
-                </div>
-            </div>
-        </div>
-        
-        <div class="sensor-card" id="eco2Card" style="display: none;">
-            <div class="sensor-info">
-                <div class="value-display">
-                    <div class="sensor-label">eCO2 (CCS811)</div>
-                    <div class="sensor-value" id="eco2">--</div>
-                    <div>ppm</div>
-                </div>
-                <div class="chart-container">
-                    <canvas id="eco2Chart"></canvas>
-                </div>
-            </div>
-        </div>
-
-        <div class="sensor-card" id="ensEco2Card" style="display: none;">
-            <div class="sensor-info">
-                <div class="value-display">
-                    <div class="sensor-label">eCO2 (ENS160)</div>
-                    <div class="sensor-value" id="ens_eco2">--</div>
-                    <div>ppm</div>
-                </div>
-                <div class="chart-container">
-                    <canvas id="ensEco2Chart"></canvas>
-                </div>
-            </div>
-        </div>
-
-
-    </div>
-
-    
-    <div class="temp-humidity-row">
-        <div class="sensor-card" id="tempCard" style="display: none;">
-            <div class="sensor-info">
-                <div class="value-display">
-                    <div class="sensor-label">Temperature</div>
-                    <div class="sensor-value" id="temperature">--</div>
-                    <div>°C (SCD40)</div>
-                    <div class="sensor-value" id="aht21_temperature">--</div>
-                    <div>°C (AHT21)</div>
-                </div>
-                <div class="chart-container">
-                    <canvas id="tempChart"></canvas>
-                </div>
-            </div>
-        </div>
-        
-        <div class="sensor-card" id="humidityCard" style="display: none;">
-            <div class="sensor-info">
-                <div class="value-display">
-                    <div class="sensor-label">Humidity</div>
-                    <div class="sensor-value" id="humidity">--</div>
-                    <div>% (SCD40)</div>
-                    <div class="sensor-value" id="aht21_humidity">--</div>
-                    <div>% (AHT21)</div>
-                </div>
-                <div class="chart-container">
-                    <canvas id="humidityChart"></canvas>
-                </div>
-            </div>
-        </div>
-    </div>
-    </div>
-    
-    <div class="bottom-sensors">
-        <div class="sensor-card">
-            <div class="sensor-label">Air Quality Index (ENS160)</div>
-            <div class="sensor-value" id="ens_aqi">--</div>
-            <div>index</div>
-        </div>
-    </div>
-    
-    <div class="timestamp" id="timestamp">Last update: --</div>
-
-    <script>
-        // Initialize charts
-        const maxDataPoints = 120;
-        const timeLabels = [];
-        const co2Data = [];
-        const eco2Data = [];
-        const tvocData = [];
-        const ensTvocData = [];
-        const ensEco2Data = [];
-        const tempData = [];
-        const humidityData = [];
-        const aht21TempData = [];
-        const aht21HumidityData = [];
-        
-        // Chart instances
-        let co2Chart = null;
-        let eco2Chart = null;
-        let tvocChart = null;
-        let ensEco2Chart = null;
-        let tempChart = null;
-        let humidityChart = null;
-        
-        function createCo2Chart() {
-            if (!co2Chart) {
-                co2Chart = new Chart(document.getElementById('co2Chart'), {
-            type: 'line',
-            data: {
-                labels: timeLabels,
-                datasets: [{
-                    label: 'CO2 (ppm)',
-                    data: co2Data,
-                    borderColor: '#2196F3',
-                    backgroundColor: 'rgba(33, 150, 243, 0.1)',
-                    tension: 0.4,
-                    fill: true
-                }]
-            },
-            options: {
-                responsive: true,
-                maintainAspectRatio: false,
-                scales: {
-                    y: {
-                        beginAtZero: false,
-                        grid: {
-                            color: 'rgba(0,0,0,0.1)'
-                        }
-                    },
-                    x: {
-                        display: false
-                    }
-                },
-                plugins: {
-                    legend: {
-                        display: false
-                    }
-                }
-            }
-                });
-            }
-        }
-        
-        function createEco2Chart() {
-            if (!eco2Chart) {
-                eco2Chart = new Chart(document.getElementById('eco2Chart'), {
-            type: 'line',
-            data: {
-                labels: timeLabels,
-                datasets: [{
-                    label: 'eCO2 (ppm)',
-                    data: eco2Data,
-                    borderColor: '#4CAF50',
-                    backgroundColor: 'rgba(76, 175, 80, 0.1)',
-                    tension: 0.4,
-                    fill: true
-                }]
-            },
-            options: {
-                responsive: true,
-                maintainAspectRatio: false,
-                scales: {
-                    y: {
-                        beginAtZero: false,
-                        grid: {
-                            color: 'rgba(0,0,0,0.1)'
-                        }
-                    },
-                    x: {
-                        display: false
-                    }
-                },
-                plugins: {
-                    legend: {
-                        display: false
-                    }
-                }
-            }
-                });
-            }
-        }
-        
-        function createTvocChart() {
-            if (!tvocChart) {
-                tvocChart = new Chart(document.getElementById('tvocChart'), {
-            type: 'line',
-            data: {
-                labels: timeLabels,
-                datasets: [{
-                    label: 'TVOC (CCS811)',
-                    data: tvocData,
-                    borderColor: '#FF9800',
-                    backgroundColor: 'rgba(255, 152, 0, 0.1)',
-                    tension: 0.4,
-                    fill: false
-                }, {
-                    label: 'TVOC (ENS160)',
-                    data: ensTvocData,
-                    borderColor: '#9C27B0',
-                    backgroundColor: 'rgba(156, 39, 176, 0.1)',
-                    tension: 0.4,
-                    fill: false
-                }]
-            },
-            options: {
-                responsive: true,
-                maintainAspectRatio: false,
-                scales: {
-                    y: {
-                        beginAtZero: false,
-                        grid: {
-                            color: 'rgba(0,0,0,0.1)'
-                        }
-                    },
-                    x: {
-                        display: false
-                    }
-                },
-                plugins: {
-                    legend: {
-                        display: true,
-                        position: 'top'
-                    }
-                }
-            }
-                });
-            }
-        }
-        
-                function createEnsEco2Chart() {
-            if (!ensEco2Chart) {
-                ensEco2Chart = new Chart(document.getElementById('ensEco2Chart'), {
-                    type: 'line',
-                    data: {
-                        labels: timeLabels,
-                        datasets: [{
-                            label: 'eCO2 (ENS160)',
-                            data: ensEco2Data,
-                            borderColor: '#E91E63',
-                            backgroundColor: 'rgba(233, 30, 99, 0.1)',
-                            tension: 0.4,
-                            fill: true
-                        }]
-                    },
-                    options: {
-                        responsive: true,
-                        maintainAspectRatio: false,
-                        scales: {
-                            y: {
-                                beginAtZero: false,
-                                grid: {
-                                    color: 'rgba(0,0,0,0.1)'
-                                }
-                            },
-                            x: {
-                                display: false
-                            }
-                        },
-                        plugins: {
-                            legend: {
-                                display: false
-                            }
-                        }
-                    }
-                });
-            }
-        }
-        
-        function createTempChart() {
-            if (!tempChart) {
-                tempChart = new Chart(document.getElementById('tempChart'), {
-                    type: 'line',
-                    data: {
-                        labels: timeLabels,
-                        datasets: [{
-                            label: 'Temperature (SCD40)',
-                            data: tempData,
-                            borderColor: '#FF5722',
-                            backgroundColor: 'rgba(255, 87, 34, 0.1)',
-                            tension: 0.4,
-                            fill: false
-                        }, {
-                            label: 'Temperature (AHT21)',
-                            data: aht21TempData,
-                            borderColor: '#795548',
-                            backgroundColor: 'rgba(121, 85, 72, 0.1)',
-                            tension: 0.4,
-                            fill: false
-                        }]
-                    },
-                    options: {
-                        responsive: true,
-                        maintainAspectRatio: false,
-                        scales: {
-                            y: {
-                                beginAtZero: false,
-                                grid: {
-                                    color: 'rgba(0,0,0,0.1)'
-                                }
-                            },
-                            x: {
-                                display: false
-                            }
-                        },
-                        plugins: {
-                            legend: {
-                                display: true,
-                                position: 'top'
-                            }
-                        }
-                    }
-                });
-            }
-        }
-        
-        function createHumidityChart() {
-            if (!humidityChart) {
-                humidityChart = new Chart(document.getElementById('humidityChart'), {
-                    type: 'line',
-                    data: {
-                        labels: timeLabels,
-                        datasets: [{
-                            label: 'Humidity (SCD40)',
-                            data: humidityData,
-                            borderColor: '#00BCD4',
-                            backgroundColor: 'rgba(0, 188, 212, 0.1)',
-                            tension: 0.4,
-                            fill: false
-                        }, {
-                            label: 'Humidity (AHT21)',
-                            data: aht21HumidityData,
-                            borderColor: '#607D8B',
-                            backgroundColor: 'rgba(96, 125, 139, 0.1)',
-                            tension: 0.4,
-                            fill: false
-                        }]
-                    },
-                    options: {
-                        responsive: true,
-                        maintainAspectRatio: false,
-                        scales: {
-                            y: {
-                                beginAtZero: false,
-                                grid: {
-                                    color: 'rgba(0,0,0,0.1)'
-                                }
-                            },
-                            x: {
-                                display: false
-                            }
-                        },
-                        plugins: {
-                            legend: {
-                                display: true,
-                                position: 'top'
-                            }
-                        }
-                    }
-                });
-            }
-        }
-        
-        function addDataPoint(chart, dataArray, value, timeLabel, datasetIndex = 0) {
-            if (!chart) return;
-            
-            dataArray.push(value);
-            if (dataArray.length > maxDataPoints) {
-                dataArray.shift();
-            }
-            
-            chart.data.labels = timeLabels;
-            chart.data.datasets[datasetIndex].data = dataArray;
-            chart.update('none');
-        }
-        
-        function updateSensorValues() {
-            fetch('/data')
-                .then(response => response.json())
-                .then(data => {
-                    // Update connection status to green checkmark
-                    document.getElementById('connectionStatus').textContent = '✅';
-                    
-                    const now = new Date();
-                    const timeLabel = now.toLocaleTimeString();
-                    
-                    if (data.co2 !== null) {
-                        document.getElementById('co2').textContent = data.co2;
-                        if (!co2Chart) {
-                            document.getElementById('co2Card').style.display = 'block';
-                            setTimeout(() => createCo2Chart(), 100);
-                        }
-                        addDataPoint(co2Chart, co2Data, data.co2, timeLabel);
-                    }
-                    if (data.eco2 !== null) {
-                        document.getElementById('eco2').textContent = data.eco2;
-                        if (!eco2Chart) {
-                            document.getElementById('eco2Card').style.display = 'block';
-                            setTimeout(() => createEco2Chart(), 100);
-                        }
-                        addDataPoint(eco2Chart, eco2Data, data.eco2, timeLabel);
-                    }
-                    if (data.tvoc !== null || data.ens_tvoc !== null) {
-                        if (!tvocChart) {
-                            document.getElementById('tvocCard').style.display = 'block';
-                            setTimeout(() => createTvocChart(), 100);
-                        }
-                        if (data.tvoc !== null) {
-                            document.getElementById('tvoc').textContent = data.tvoc;
-                            addDataPoint(tvocChart, tvocData, data.tvoc, timeLabel, 0);
-                        }
-                        if (data.ens_tvoc !== null) {
-                            addDataPoint(tvocChart, ensTvocData, data.ens_tvoc, timeLabel, 1);
-                        }
-                    }
-                    if (data.ens_eco2 !== null) {
-                        document.getElementById('ens_eco2').textContent = data.ens_eco2.toFixed(1);
-                        if (!ensEco2Chart) {
-                            document.getElementById('ensEco2Card').style.display = 'block';
-                            setTimeout(() => createEnsEco2Chart(), 100);
-                        }
-                        addDataPoint(ensEco2Chart, ensEco2Data, data.ens_eco2, timeLabel);
-                    }
-                    if (data.temperature !== null || data.aht21_temperature !== null) {
-                        if (data.temperature !== null) {
-                            document.getElementById('temperature').textContent = data.temperature.toFixed(1);
-                            addDataPoint(tempChart, tempData, data.temperature, timeLabel, 0);
-                        }
-                        if (data.aht21_temperature !== null) {
-                            document.getElementById('aht21_temperature').textContent = data.aht21_temperature.toFixed(1);
-                            addDataPoint(tempChart, aht21TempData, data.aht21_temperature, timeLabel, 1);
-                        }
-                        if (!tempChart) {
-                            document.getElementById('tempCard').style.display = 'block';
-                            setTimeout(() => createTempChart(), 100);
-                        }
-                    }
-                    if (data.humidity !== null || data.aht21_humidity !== null) {
-                        if (data.humidity !== null) {
-                            document.getElementById('humidity').textContent = data.humidity.toFixed(1);
-                            addDataPoint(humidityChart, humidityData, data.humidity, timeLabel, 0);
-                        }
-                        if (data.aht21_humidity !== null) {
-                            document.getElementById('aht21_humidity').textContent = data.aht21_humidity.toFixed(1);
-                            addDataPoint(humidityChart, aht21HumidityData, data.aht21_humidity, timeLabel, 1);
-                        }
-                        if (!humidityChart) {
-                            document.getElementById('humidityCard').style.display = 'block';
-                            setTimeout(() => createHumidityChart(), 100);
-                        }
-                    }
-                    if (data.ens_aqi !== null) {
-                        document.getElementById('ens_aqi').textContent = data.ens_aqi;
-                    }
-                    
-                    // Update timestamp
-                    document.getElementById('timestamp').textContent = 'Last update: ' + timeLabel;
-                    
-                    // Update time labels for all charts
-                    if (!timeLabels.includes(timeLabel)) {
-                        timeLabels.push(timeLabel);
-                        if (timeLabels.length > maxDataPoints) {
-                            timeLabels.shift();
-                        }
-                    }
-                })
-                .catch(error => {
-                    console.error('Error fetching data:', error);
-                    document.getElementById('connectionStatus').textContent = '❌';
-                });
-        }
-        
-        // Update every second
-        setInterval(updateSensorValues, 1000);
-        
-        // Initial update
-        updateSensorValues();
-    </script>
-</body>
-</html>'''
-
-# Initialize WiFi access point
-try:
-    wifi.radio.start_ap("SensorWorkshop", "password123")
-    print("WiFi AP started: SensorWorkshop")
-    print("Password: password123")
-    print(f"IP Address: {wifi.radio.ipv4_address}")
-except Exception as e:
-    print(f"Error starting WiFi: {e}")
-
-# Create socket pool and HTTP server
-pool = socketpool.SocketPool(wifi.radio)
-server = Server(pool, debug=True)
+# Bring-up state of each sensor by name, reported alongside the readings
+sensor_states = {sensor.name: sensor.state for sensor in sensors.values()}
+sensor_data['sensors'] = sensor_states
+
+# When each field last got a new sample (seconds since boot) and how many
+# it's had, so clients can tell a new sample from a repeat and show how
+# stale a reading is. 'now' is the time of the newest sample of all.
+field_times = {field: None for field, _ in FIELDS}
+field_seqs = {field: 0 for field, _ in FIELDS}
+sensor_data['time'] = field_times
+sensor_data['seq'] = field_seqs
+sensor_data['now'] = 0
+
+# Bytes of RAM set aside for raw history, split evenly across all fields;
+# enough for the last few minutes at one sample a second
+HISTORY_BUDGET = 16 * 1024
+
+# Rollup tiers of min/max/mean/count buckets behind the raw samples, as
+# (seconds per bucket, buckets per field): by default 6 hours of minutes and
+# 2 days of hours. Boards with PSRAM can afford a day of minutes (1440).
+HISTORY_TIERS = (
+    (60, setting("HISTORY_MINUTES", 360)),
+    (3600, setting("HISTORY_HOURS", 48))
+)
+
+# Most points a /history?span= query returns; longer spans use coarser tiers
+HISTORY_MAX_POINTS = 300
+
+# Samples per chunk when streaming /history
+HISTORY_CHUNK_SAMPLES = 32
+
+# Buffer /history.bin is packed into, one chunk at a time
+history_buffer = bytearray(512)
+
+history = History(FIELDS, HISTORY_BUDGET, HISTORY_TIERS)
+gc.collect()
+log.info("History: %d samples per field, %d bytes, %s bytes free", history.capacity, history.size(), mem_free())
+
+# Running statistics of the eCO2 sensors against the measured CO2, for /stats
+analytics = Analytics(window=setting("STATS_WINDOW", 60))
+
+# Compressed once-a-second snapshots of every field, served from /blocks.
+# Temperature and humidity are kept to 0.01, everything else in whole units.
+BLOCK_FIELDS = tuple((field, 100 if typecode == 'f' else 1) for field, typecode in FIELDS)
+BLOCK_STREAM_HEADER = codec.stream_header(BLOCK_FIELDS)
+block_encoder = codec.BlockEncoder(BLOCK_FIELDS)
+block_store = codec.BlockStore(setting("BLOCK_STORE_KB", 16) * 1024)
+
+# Readings logged to flash so they survive a power cycle. Off by default; on
+# the device boot.py has to make CIRCUITPY writable for it.
+datalog = None
+if setting("LOG", False):
+    from datalog import DataLog
+    try:
+        datalog = DataLog(setting("LOG_DIR", "/log" if ON_DEVICE else "log"), len(FIELDS),
+                          interval=setting("LOG_INTERVAL", 30),
+                          flush_seconds=setting("LOG_FLUSH_SECONDS", 300),
+                          segment_size=setting("LOG_SEGMENT_KB", 32) * 1024,
+                          segments=setting("LOG_SEGMENTS", 8))
+    except OSError as e:
+        log.error("Error opening log: %s", str(e))
+
+# Each open /stream connection holds a socket, so keep the count low
+MAX_STREAM_CLIENTS = 4
+
+# Fields that changed since the last event was pushed to /stream clients
+changed_fields = {}
+
+# Open /stream connections, and ones still waiting for their first full snapshot
+stream_clients = []
+new_stream_clients = []
+
+# Bumped whenever a value in sensor_data changes; the published snapshot and ETag follow it
+data_version = 0
+data_updated = 0
+publisher = Publisher(wire.DataEncoder(FIELDS))
+
+# Keeps ETags from one boot from matching the restarted version count of the next
+BOOT_ID = random.getrandbits(24)
+# Sample counts start again from 0 at every boot; this tells pollers when that's happened
+sensor_data['boot'] = BOOT_ID
+
+def update(field, value):
+    """Store a new sample as the latest value, with its time and count, and in its history
+
+    Only called for real new samples, so every call is news to clients even
+    if the value is the same as last time.
+    """
+    global data_version, data_updated
+    if value is None:
+        return
+    now = uptime()
+    sensor_data[field] = value
+    field_times[field] = now
+    field_seqs[field] += 1
+    changed_fields[field] = value
+    # Lets /stream clients keep track of the last sample they have, for /history?since=
+    changed_fields.setdefault('seq', {})[field] = field_seqs[field]
+    data_version += 1
+    data_updated = now
+    sensor_data['now'] = now
+    history.record(field, value, now)
+    analytics.add(field, value, now)
+    if datalog:
+        datalog.append(FIELD_INDEX[field], value)
+    if telemetry:
+        telemetry.append(FIELD_INDEX[field], field_seqs[field], now, value)
+
+def sensor_state_changed(sensor):
+    """Report a sensor's new bring-up state to /data and /stream clients"""
+    global data_version
+    sensor_states[sensor.name] = sensor.state
+    changed_fields['sensors'] = sensor_states
+    data_version += 1
+
+def record_block_row():
+    """Add the current readings to the open block, storing it when it fills up"""
+    if block_encoder.add(uptime(), sensor_data):
+        block_store.append(block_encoder.pack())
+        block_encoder.reset()
+
+def send_event(client, event):
+    """Push one encoded event to a /stream client, dropping the client if its connection is gone"""
+    try:
+        client.send_encoded(event)
+        return True
+    except Exception:
+        try:
+            client.close()
+        except Exception:
+            pass
+        return False
+
+def publish_changes():
+    """Encode the readings once if they've changed, and send the changes to every /stream client"""
+    snapshot = publisher.publish(sensor_data, field_seqs, field_times, data_version, data_updated)
+    if new_stream_clients:
+        for client in new_stream_clients:
+            if send_event(client, snapshot.event):
+                stream_clients.append(client)
+        new_stream_clients.clear()
+
+    if not changed_fields:
+        return
+    if stream_clients:
+        event = publisher.event(changed_fields)
+        for client in stream_clients[:]:
+            if not send_event(client, event):
+                stream_clients.remove(client)
+    changed_fields.clear()
+
+if ON_DEVICE:
+    import wifi
+    import socketpool
+
+    # Initialize WiFi access point
+    try:
+        wifi.radio.start_ap("SensorWorkshop", "password123")
+        log.info("WiFi AP started: SensorWorkshop")
+        log.info("Password: password123")
+        log.info("IP Address: %s", wifi.radio.ipv4_address)
+    except Exception as e:
+        log.error("Error starting WiFi: %s", str(e))
+
+    # Create socket pool and HTTP server
+    pool = socketpool.SocketPool(wifi.radio)
+    host = str(wifi.radio.ipv4_address)
+else:
+    # On a host the standard socket module works as the pool
+    import socket as pool
+    host = setting("HOST", "127.0.0.1")
+
+port = setting("PORT", 80 if ON_DEVICE else 8080)
+server = Server(pool, debug=setting("HTTP_DEBUG", True))
+
+# New samples pushed in batches to a collector, over "udp" or "mqtt". Off by default.
+telemetry = None
+TELEMETRY = setting("TELEMETRY", "")
+if TELEMETRY:
+    from telemetry import Telemetry
+    try:
+        # Looked up once here, as a lookup blocks; the server loop only ever uses the address
+        address = pool.getaddrinfo(setting("TELEMETRY_HOST", "127.0.0.1"),
+                                   setting("TELEMETRY_PORT", 1883 if TELEMETRY == "mqtt" else 9999))[0][-1]
+        telemetry = Telemetry(pool, address, BOOT_ID, protocol=TELEMETRY,
+                              topic=setting("TELEMETRY_TOPIC", "sensortech"),
+                              batch=setting("TELEMETRY_BATCH", 32),
+                              max_age=setting("TELEMETRY_MAX_AGE", 10),
+                              queue=setting("TELEMETRY_QUEUE", 16))
+        metrics.telemetry = telemetry
+    except (ValueError, OSError) as e:
+        log.error("Error starting telemetry: %s", str(e))
+
+# Static files live next to code.py, at the root of CIRCUITPY on the device
+if ON_DEVICE:
+    STATIC_ROOT = "/"
+else:
+    import os
+    STATIC_ROOT = os.path.dirname(os.path.abspath(__file__)) + "/"
+
+# Bytes read from flash per send when serving static files
+STATIC_CHUNK_SIZE = 2048
+
+static = StaticFiles(STATIC_ROOT, STATIC_CHUNK_SIZE)
+index_page = static.asset("index.html", "text/html; charset=utf-8")
+
+# Chart.js is pinned to one version, so browsers can keep it for a year
+chart_js = (static.asset("chart.js", "application/javascript", "public, max-age=31536000")
+            or static.asset("chart-fallback.js", "application/javascript", "no-cache"))
 
 @server.route("/")
+@metrics.route("/")
 def base(request: Request):
     """Serve the main HTML page"""
-    return Response(request, HTML_PAGE, content_type="text/html")
+    return static.serve(request, index_page)
+
+def serve_data(request, binary):
+    """Latest readings as JSON or binary, or 304 if the client already has this version"""
+    snapshot = publisher.snapshot
+    etag = '"%x-%x%s"' % (BOOT_ID, snapshot.version, "-b" if binary else "")
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if request.headers.get("If-None-Match") == etag:
+        return Response(request, status=NOT_MODIFIED_304, headers=headers)
+    if binary:
+        return Response(request, snapshot.binary, content_type=wire.CONTENT_TYPE, headers=headers)
+    return Response(request, snapshot.json, content_type="application/json", headers=headers)
 
 @server.route("/data")
+@metrics.route("/data")
 def data(request: Request):
-    """Serve sensor data as JSON"""
-    return Response(request, json.dumps(sensor_data), content_type="application/json")
-
-@server.route("/chart.js")
-def chartjs(request: Request):
-    """Serve Chart.js library using proper HTTP chunking to save memory"""
+    """Serve sensor data as JSON, or binary if the client's Accept asks for it"""
+    return serve_data(request, wire.wants_binary(request))
+
+@server.route("/data.bin")
+@metrics.route("/data.bin")
+def data_bin(request: Request):
+    """Serve sensor data in the binary wire format"""
+    return serve_data(request, True)
+
+def history_query(request):
+    """Parse the query parameters; returns (field, buffer, n, step, limit) or an error Response
+
+    With span=<seconds> (and optionally points=<max points>) the buffer is
+    picked from the raw samples and rollup tiers. With since=<sequence> it's
+    the raw samples after that one, at most limit=<samples> of them, oldest
+    first; the response says where to continue from. Otherwise it's the
+    newest n raw samples.
+    """
+    field = request.query_params.get("field")
+    ring = history.ring(field)
+    if ring is None:
+        return Response(request, "Unknown field", status=BAD_REQUEST_400)
+    try:
+        span = request.query_params.get("span")
+        if span is not None:
+            points = min(int(request.query_params.get("points", HISTORY_MAX_POINTS)), HISTORY_MAX_POINTS)
+            return (field,) + history.select(field, int(span), points) + (None,)
+        since = request.query_params.get("since")
+        if since is not None:
+            limit = min(int(request.query_params.get("limit", HISTORY_MAX_POINTS)), HISTORY_MAX_POINTS)
+            return field, ring, ring.after(int(since)), 1, limit
+        n = int(request.query_params.get("n", history.capacity))
+    except ValueError:
+        return Response(request, "Bad sample count", status=BAD_REQUEST_400)
+    return field, ring, n, 1, None
+
+def serve_history_binary(request, field, source, n, step, limit):
     def body():
-       # Read an send file in chunks
-        chunk_size = 1024  # 1KB chunks
-        
-        with open("/chart.js", "r") as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                
-                # Send chunk with proper HTTP chunked encoding
-                yield chunk
+        yield from wire.history_chunks(source, FIELD_INDEX[field], n, uptime(), history_buffer, step, limit)
+
+    return ChunkedResponse(request, body, content_type=wire.CONTENT_TYPE)
+
+@server.route("/history")
+@metrics.route("/history")
+def history_route(request: Request):
+    """Stream one field's history as JSON, or binary if Accept asks for it
+
+    Raw samples are [time, value]; rollup buckets are [start, mean, min, max, readings].
+    "seq" is the sequence number of the last raw sample sent (of the newest
+    reading for rollups), and "more" says whether a since= query has more
+    samples after it.
+    """
+    query = history_query(request)
+    if isinstance(query, Response):
+        return query
+    field, source, n, step, limit = query
+    if wire.wants_binary(request):
+        return serve_history_binary(request, field, source, n, step, limit)
 
+    def body():
+        yield from wire.history_json(field, source, n, uptime(), step, limit, HISTORY_CHUNK_SAMPLES)
+
+    return ChunkedResponse(request, body, content_type="application/json")
+
+@server.route("/history.bin")
+@metrics.route("/history.bin")
+def history_bin(request: Request):
+    """Stream one field's history in the binary wire format"""
+    query = history_query(request)
+    if isinstance(query, Response):
+        return query
+    return serve_history_binary(request, *query)
+
+@server.route("/export")
+@metrics.route("/export")
+def export(request: Request):
+    """Stream logged readings between from and to (seconds, time.time()) as CSV, or binary records
+
+    format=bin sends the log's own records, CRCs and all, for any record
+    with a reading in the range. Readings not yet written to flash are
+    included from RAM; exporting doesn't force a write.
+    """
+    if datalog is None:
+        return Response(request, "Logging is off", status=NOT_FOUND_404)
     try:
-        with open("/chart.js", "r") as f:
-            return ChunkedResponse(request, body)
-
-    except OSError:
-        # Fallback to simplified version if file not found
-        chartjs_content = '''
-/* Simplified Chart.js fallback */
-class Chart {
-    constructor(canvas, config) {
-        this.canvas = canvas;
-        this.ctx = canvas.getContext('2d');
-        this.config = config;
-        this.data = config.data;
-        this.options = config.options || {};
-        this.update('none');
-    }
-    
-    update(mode) {
-        this.render();
-    }
-    
-    render() {
-        const width = this.canvas.width;
-        const height = this.canvas.height;
-        
-        // Clear canvas
-        this.ctx.clearRect(0, 0, width, height);
-        
-        // Draw grid
-        this.drawGrid();
-        
-        // Draw datasets
-        this.data.datasets.forEach((dataset, index) => {
-            this.drawDataset(dataset, index);
-        });
-        
-        // Draw legend if enabled
-        if (this.options.plugins && this.options.plugins.legend && this.options.plugins.legend.display) {
-            this.drawLegend();
-        }
-    }
-    
-    drawGrid() {
-        const width = this.canvas.width;
-        const height = this.canvas.height;
-        
-        this.ctx.strokeStyle = 'rgba(0,0,0,0.1)';
-        this.ctx.lineWidth = 1;
-        
-        // Vertical grid lines
-        for (let i = 0; i <= 1; i++) {
-            const x = (width / 10) * i;
-            this.ctx.beginPath();
-            this.ctx.moveTo(x, 0);
-            this.ctx.lineTo(x, height);
-            this.ctx.stroke();
-        }
-        
-        // Horizontal grid lines
-        for (let i = 0; i <= 10; i++) {
-            const y = (height / 10) * i;
-            this.ctx.beginPath();
-            this.ctx.moveTo(0, y);
-            this.ctx.lineTo(width, y);
-            this.ctx.stroke();
-        }
-    }
-    
-    drawDataset(dataset, index) {
-        if (!dataset.data || dataset.data.length === 0) return;
-        
-        const width = this.canvas.width;
-        const height = this.canvas.height;
-        const data = dataset.data;
-        
-        // Find min/max values
-        const min = Math.min(...data.filter(v => v !== null && v !== undefined));
-        const max = Math.max(...data.filter(v => v !== null && v !== undefined));
-        const range = max - min;
-        
-        if (range === 0) return;
-        
-        // Set line style
-        this.ctx.strokeStyle = dataset.borderColor || '#000';
-        this.ctx.fillStyle = dataset.backgroundColor || 'rgba(0,0,0,0.1)';
-        this.ctx.lineWidth = 2;
-        
-        // Draw line
-        this.ctx.beginPath();
-        data.forEach((value, i) => {
-            if (value === null || value === undefined) return;
-            
-            const x = (width / (data.length - 1)) * i;
-            const y = height - ((value - min) / range) * height;
-            
-            if (i === 0) {
-                this.ctx.moveTo(x, y);
-            } else {
-                this.ctx.lineTo(x, y);
-            }
-        });
-        
-        this.ctx.stroke();
-        
-        // Fill area if enabled
-        if (dataset.fill) {
-            this.ctx.lineTo(width, height);
-            this.ctx.lineTo(0, height);
-            this.ctx.closePath();
-            this.ctx.fill();
-        }
-    }
-    
-    drawLegend() {
-        const datasets = this.data.datasets;
-        const legendHeight = 20;
-        const legendY = 10;
-        
-        datasets.forEach((dataset, index) => {
-            const x = 10 + (index * 100);
-            const y = legendY;
-            
-            // Draw color box
-            this.ctx.fillStyle = dataset.borderColor || '#000';
-            this.ctx.fillRect(x, y, 15, 10);
-            
-            // Draw label
-            this.ctx.fillStyle = '#000';
-            this.ctx.font = '12px Arial';
-            this.ctx.fillText(dataset.label || `Dataset ${index}`, x + 20, y + 8);
-        });
-    }
-}
-'''
-        return Response(request, chartjs_content, content_type="application/javascript")
-
-# Display sensor information
-if scd4x:
-    print(f"Serial Number: {scd4x.serial_number}")
-    print(f"Temperature Offset: {scd4x.temperature_offset}°C")
-    print(f"Altitude: {scd4x.altitude} m")
-    print(f"Automatic Self-Calibration: {scd4x.self_calibration_enabled}")
-    print()
+        start = int(request.query_params.get("from", 0))
+        end = int(request.query_params.get("to", 0xFFFFFFFF))
+    except ValueError:
+        return Response(request, "Bad time range", status=BAD_REQUEST_400)
+
+    if request.query_params.get("format") == "bin":
+        def records():
+            yield from datalog.export_records(start, end)
+
+        return ChunkedResponse(request, records, content_type=wire.CONTENT_TYPE)
+
+    def rows():
+        yield 'sequence,time,field,value\n'
+        batch = []
+        for sequence, timestamp, field, value in datalog.export(start, end):
+            batch.append('%d,%d,%s,%s\n' % (sequence, timestamp, FIELDS[field][0], value))
+            if len(batch) == HISTORY_CHUNK_SAMPLES:
+                yield ''.join(batch)
+                batch.clear()
+        if batch:
+            yield ''.join(batch)
+
+    return ChunkedResponse(request, rows, content_type="text/csv")
+
+@server.route("/blocks")
+@metrics.route("/blocks")
+def blocks(request: Request):
+    """Stream compressed history between from and to (seconds since boot); see codec.py
+
+    Decode it on a host with tools/blocks.py.
+    """
+    try:
+        start = int(request.query_params.get("from", 0))
+        end = int(request.query_params.get("to", 0xFFFFFFFF))
+    except ValueError:
+        return Response(request, "Bad time range", status=BAD_REQUEST_400)
 
-    # Start periodic measurements
-    scd4x.start_periodic_measurement()
-    print("Started periodic SCD4x measurements...")
+    def body():
+        yield BLOCK_STREAM_HEADER
+        yield from block_store.blocks(start, end)
+        if block_encoder.rows and block_encoder.first <= end:
+            yield block_encoder.pack()
+
+    return ChunkedResponse(request, body, content_type=wire.CONTENT_TYPE)
+
+@server.route("/stream")
+@metrics.route("/stream")
+def stream(request: Request):
+    """Push changed sensor fields as Server-Sent Events"""
+    if len(stream_clients) + len(new_stream_clients) >= MAX_STREAM_CLIENTS:
+        return Response(request, "Too many streams", status=SERVICE_UNAVAILABLE_503)
+    client = EventStream(request)
+    new_stream_clients.append(client)
+    return client
+
+@server.route("/metrics")
+@metrics.route("/metrics")
+def metrics_route(request: Request):
+    """Serve loop, sensor, route and heap metrics in Prometheus text format"""
+    return ChunkedResponse(request, metrics.render, content_type="text/plain; version=0.0.4")
+
+@server.route("/log")
+@metrics.route("/log")
+def log_route(request: Request):
+    """Serve recent log messages as text, one per line: sequence, seconds since boot, level, message
+
+    since=<sequence> skips older messages and level=<name> quieter ones.
+    """
+    try:
+        since = int(request.query_params.get("since", 0))
+        level = level_number(request.query_params.get("level", "debug"))
+    except ValueError:
+        return Response(request, "Bad since or level", status=BAD_REQUEST_400)
+
+    def lines():
+        for sequence, timestamp, name, message, repeats in log.entries(since, level):
+            if repeats:
+                yield '%d %d %s %s (repeated %d times)\n' % (sequence, timestamp, name, message, repeats)
+            else:
+                yield '%d %d %s %s\n' % (sequence, timestamp, name, message)
 
-print("Starting web server...")
-print("Connect to http://<device-ip> to view sensor dashboard")
+    return ChunkedResponse(request, lines, content_type="text/plain")
 
-# Start the server
-server.start(str(wifi.radio.ipv4_address), 80)
+@server.route("/stats")
+@metrics.route("/stats")
+def stats_route(request: Request):
+    """Serve how far each eCO2 sensor is from the measured CO2: bias, MAE, RMSE, correlation and lag"""
+    return JSONResponse(request, analytics.report())
 
-if ens:
-    ens.mode = adafruit_ens160.MODE_STANDARD
+@server.route("/chart.js")
+@metrics.route("/chart.js")
+def chartjs(request: Request):
+    """Serve Chart.js, gzipped if the build step produced chart.js.gz"""
+    return static.serve(request, chart_js)
 
-# Main reading loop
-while True:
-    # Handle web server requests
-    try:
-        server.poll()
-    except Exception as e:
-        print(f"Web server error: {e}")
-    
-    # Read SCD40 data
-    if scd4x and scd4x.data_ready:
-        try:
-            sensor_data['co2'] = scd4x.CO2
-            sensor_data['temperature'] = scd4x.temperature
-            sensor_data['humidity'] = scd4x.relative_humidity
-            
-        except Exception as e:
-            print(f"Error reading SCD40 data: {e}")
+log.info("Starting web server...")
+log.info("Connect to http://<device-ip> to view sensor dashboard")
 
-    # Read CCS811 data
-    if ccs and ccs.data_ready:
+# Start the server
+server.start(host, port)
+
+# How often to re-check a sensor's data-ready flag once its period is up
+DATA_READY_POLL = 0.1
+
+# How long the server task sleeps between polls, keeps request latency in the ms range
+SERVER_POLL_INTERVAL = 0.005
+
+def store(sensor, values):
+    """Record one sample from a sensor adapter"""
+    for field, value in zip(sensor.fields, values):
+        update(field, value)
+
+    # Both are coalesced, so most of these calls don't touch the bus
+    if sensor is aht21 and ens and ens.state == READY:
+        ens.compensate(sensor_data['aht21_temperature'], sensor_data['aht21_humidity'])
+    if sensor is scd and AMBIENT_PRESSURE:
+        scd.compensate(AMBIENT_PRESSURE)
+
+async def wait_for_slot(sensor, stats, slot):
+    """Sleep until slot, first starting an on-demand measurement early enough to be ready then
+
+    A failed start is counted like a failed read; data_ready() tries again.
+    """
+    lead = sensor.lead
+    if lead:
+        start = slot - lead
+        if start > time.monotonic():
+            power.wake_at(sensor.name, start)
+            await asyncio.sleep(start - time.monotonic())
         try:
-            sensor_data['eco2'] = ccs.eco2
-            sensor_data['tvoc'] = ccs.tvoc
-            
+            sensor.start()
+        except MemoryError:
+            stats.read_failed()
+            heap.memory_error()
         except Exception as e:
-            print(f"Error reading CCS811 data: {e}")
-
-    # Read ENS160 data
-    if ens:
+            stats.read_failed()
+            log.error("Error starting %s measurement: %s", sensor.name, str(e))
+    power.wake_at(sensor.name, slot)
+    await asyncio.sleep(max(0, slot - time.monotonic()))
+
+async def sample_forever(sensor):
+    """Bring one sensor up, then read it once per period, waiting on its data-ready flag
+
+    The period follows the sensor's sampling mode, which adapt() picks from
+    how fast its readings are changing.
+    """
+    while sensor.state != READY:
+        delay = sensor.step()
+        if sensor_states[sensor.name] != sensor.state:
+            sensor_state_changed(sensor)
+        power.wake_at(sensor.name, time.monotonic() + delay)
+        await asyncio.sleep(delay)
+
+    stats = metrics.sensor(sensor.name, sensor)
+    # Battery profiles read every sensor at the same moments, so the board can sleep in between
+    next_due = power.next_slot(sensor.period)
+    await wait_for_slot(sensor, stats, next_due)
+    while True:
+        period = sensor.period
         try:
-            status = ens.data_validity
-            if status == adafruit_ens160.NORMAL_OP:
-                print("Normal operation")
-            if status == adafruit_ens160.WARM_UP:
-                print("Warming up")
-            if status == adafruit_ens160.START_UP:
-                print("Initial startup")
-            if status == adafruit_ens160.INVALID_OUT:
-                print("Invalid output")
-
-            if ens.new_data_available:
-                print("ENS160 new data available")
-            else:
-                print("ENS160 NO new data available")
-
-            sensor_data['ens_aqi'] = ens.AQI
-            sensor_data['ens_tvoc'] = ens.TVOC
-            sensor_data['ens_eco2'] = ens.eCO2
-
-            print(f"ENS AQI {sensor_data['ens_aqi']}")
-            print(f"ENS TVOC {sensor_data['ens_tvoc']}")
-            print(f"ENS eCO2 {sensor_data['ens_eco2']}")
-            
+            # Give the sensor up to one more period to produce a sample
+            give_up = time.monotonic() + period
+            ready = sensor.data_ready()
+            while not ready and time.monotonic() < give_up:
+                # Skip the polling when the sensor has said how long it needs
+                wait = max(DATA_READY_POLL, sensor.ready_at - time.monotonic())
+                power.wake_at(sensor.name, time.monotonic() + wait)
+                await asyncio.sleep(wait)
+                ready = sensor.data_ready()
+            if ready:
+                started = now_us()
+                values = sensor.read()
+                stats.read_ok(started)
+                store(sensor, values)
+                if sensor.adapt(values):
+                    log.info("%s: sampling every %s s", sensor.name, sensor.period)
+        except MemoryError:
+            stats.read_failed()
+            heap.memory_error()
         except Exception as e:
-            print(f"Error reading ENS160 data: {e}")
-
-    # Read AHT21 data
-    if aht21:
+            stats.read_failed()
+            log.error("Error reading %s data: %s", sensor.name, str(e))
+        publish_changes()
+
+        # A switch to a faster mode takes effect now rather than after the old period
+        next_due += min(period, sensor.period)
+        if next_due < time.monotonic():
+            # Fell behind, don't try to catch up with a burst of reads
+            metrics.loop_overruns += 1
+            next_due = time.monotonic()
+        await wait_for_slot(sensor, stats, next_due)
+
+async def serve_forever():
+    """Handle web server requests without waiting on the sensors"""
+    next_housekeeping = 0
+    while True:
+        started = now_us()
+        # Requests always see the latest readings, even ones from a bring-up step
+        publish_changes()
+        handled = False
         try:
-            sensor_data['aht21_temperature'] = aht21.temperature
-            sensor_data['aht21_humidity'] = aht21.relative_humidity
-
-            if ens:
-                ens.temperature_compensation = sensor_data['aht21_temperature']
-                ens.humidity_compensation = sensor_data['aht21_humidity']
-            
+            handled = server.poll() != NO_REQUEST
+            if handled:
+                power.request_seen()
+        except MemoryError:
+            heap.memory_error()
         except Exception as e:
-            print(f"Error reading AHT21 data: {e}")
-
-    time.sleep(1)
+            log.error("Web server error: %s", str(e))
+        metrics.request_finished()
+        metrics.poll_time.observe(now_us() - started)
+        publish_changes()
+        # Never waits on the network, so it can run every time around
+        if telemetry:
+            telemetry.tick()
+
+        # Heap stats walk the heap, so only sample them once a second; the
+        # compressed history and the log batch are kept at the same pace
+        if time.monotonic() >= next_housekeeping:
+            heap.allocated = metrics.sample_heap()
+            record_block_row()
+            if datalog:
+                datalog.tick()
+            next_housekeeping = time.monotonic() + 1
+        # With no request in flight, collect garbage now if it'll be done before a sensor is due
+        if not handled:
+            heap.idle(min(power.wakes.values()) if power.wakes else None)
+        # Only once every sensor task has said when it next needs the CPU
+        if len(power.wakes) == len(sensors):
+            power.sleep()
+        await asyncio.sleep(SERVER_POLL_INTERVAL)
+
+async def main():
+    tasks = [asyncio.create_task(serve_forever())]
+
+    for sensor in sensors.values():
+        tasks.append(asyncio.create_task(sample_forever(sensor)))
+
+    await asyncio.gather(*tasks)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,269 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Compressed column-per-field blocks of sensor_data snapshots
+
+Readings change by small steps from one sample to the next, so each value
+is quantized to a fixed-point integer (temperatures in 0.01 degrees, ppm
+and ppb as they are) and stored as the zigzag varint of its difference
+from the previous row. A steady reading costs one byte a row instead of a
+four-byte timestamp plus a two- or four-byte value.
+
+Block, all little-endian:
+    u8 version, u8 field count, u16 rows, u32 first timestamp,
+    u16 end offset of each column from the start of the block (time column first),
+    time column: varint of each timestamp minus the previous one,
+    one column per field: per row a varint, 0 for a missing value,
+    otherwise zigzag(quantized value - previous quantized value) + 1,
+    where the previous value starts out as 0
+
+Blocks are self-contained, so the same bytes work in a RAM ring buffer, in
+a file or on the wire. The column offsets act as the block's index: a query
+for a time range decodes the time column and only the columns it asked for,
+stopping at the last row in range. A stream of blocks starts with a header
+naming the fields and their scales, see stream_header().
+"""
+
+import struct
+from array import array
+
+VERSION = 1
+BLOCK_HEADER = "<BBHI"
+HEADER_SIZE = struct.calcsize(BLOCK_HEADER)
+# Longest varint for a 32 bit value
+MAX_VARINT = 5
+
+
+def zigzag(n):
+    """Interleave signed as unsigned, 0, -1, 1, -2... so small steps either way stay small"""
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+
+def unzigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def put_varint(buffer, offset, n):
+    """Write n into buffer at offset as a varint; returns the offset after it"""
+    while n >= 0x80:
+        buffer[offset] = (n & 0x7F) | 0x80
+        n >>= 7
+        offset += 1
+    buffer[offset] = n
+    return offset + 1
+
+
+def get_varint(buffer, offset):
+    """Returns (value, offset after it)"""
+    n = 0
+    shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, offset
+        shift += 7
+
+
+def stream_header(fields):
+    """Header for a stream of blocks: u8 version, u8 field count, then per field
+    u8 name length, name, u16 scale. fields is a sequence of (name, scale) pairs.
+    """
+    header = bytearray(struct.pack("<BB", VERSION, len(fields)))
+    for name, scale in fields:
+        header += struct.pack("<B", len(name)) + name.encode() + struct.pack("<H", scale)
+    return bytes(header)
+
+
+def read_stream_header(data):
+    """Returns ((name, scale) pairs, offset of the first block)"""
+    version, count = struct.unpack_from("<BB", data, 0)
+    if version != VERSION:
+        raise ValueError("Unknown block stream version %d" % version)
+    offset = 2
+    fields = []
+    for _ in range(count):
+        length = data[offset]
+        name = bytes(data[offset + 1:offset + 1 + length]).decode()
+        scale = struct.unpack_from("<H", data, offset + 1 + length)[0]
+        fields.append((name, scale))
+        offset += 3 + length
+    return fields, offset
+
+
+class BlockEncoder:
+    """Builds one block at a time from rows of readings, in preallocated columns
+
+    fields is a sequence of (name, scale) pairs; a value is stored as
+    round(value * scale).
+    """
+
+    def __init__(self, fields, rows=64):
+        self.fields = fields
+        self.max_rows = rows
+        self.columns = [bytearray(rows * MAX_VARINT) for _ in range(len(fields) + 1)]
+        self.used = array('H', (0 for _ in range(len(fields) + 1)))
+        self.previous = array('l', (0 for _ in range(len(fields) + 1)))
+        self.block = bytearray(HEADER_SIZE + 2 * (len(fields) + 1) + sum(len(c) for c in self.columns))
+        self.rows = 0
+        self.first = 0
+
+    def add(self, timestamp, values):
+        """Add a row from the values dict; returns True once the block is full"""
+        if not self.rows:
+            self.first = timestamp
+            self.previous[0] = timestamp
+        self.used[0] = put_varint(self.columns[0], self.used[0], timestamp - self.previous[0])
+        self.previous[0] = timestamp
+        for index, (name, scale) in enumerate(self.fields, 1):
+            value = values[name]
+            if value is None:
+                symbol = 0
+            else:
+                quantized = int(round(value * scale))
+                symbol = zigzag(quantized - self.previous[index]) + 1
+                self.previous[index] = quantized
+            self.used[index] = put_varint(self.columns[index], self.used[index], symbol)
+        self.rows += 1
+        return self.rows == self.max_rows
+
+    def pack(self):
+        """The rows so far as a block, a memoryview that's overwritten by the next pack()"""
+        columns = len(self.columns)
+        offset = HEADER_SIZE + 2 * columns
+        struct.pack_into(BLOCK_HEADER, self.block, 0, VERSION, columns - 1, self.rows, self.first)
+        for index, column in enumerate(self.columns):
+            used = self.used[index]
+            self.block[offset:offset + used] = memoryview(column)[:used]
+            offset += used
+            struct.pack_into("<H", self.block, HEADER_SIZE + 2 * index, offset)
+        return memoryview(self.block)[:offset]
+
+    def reset(self):
+        self.rows = 0
+        for index in range(len(self.columns)):
+            self.used[index] = 0
+            self.previous[index] = 0
+
+
+class BlockStore:
+    """Ring buffer of whole blocks in a fixed bytearray, oldest evicted first"""
+
+    def __init__(self, size, max_blocks=64):
+        self.buffer = bytearray(size)
+        self.max_blocks = max_blocks
+        self.starts = array('I', (0 for _ in range(max_blocks)))
+        self.offsets = array('I', (0 for _ in range(max_blocks)))
+        self.lengths = array('H', (0 for _ in range(max_blocks)))
+        self.head = 0
+        self.count = 0
+        self.write = 0
+        self.rows = 0
+
+    def _evict(self):
+        oldest = (self.head - self.count) % self.max_blocks
+        self.rows -= struct.unpack_from("<H", self.buffer, self.offsets[oldest] + 2)[0]
+        self.count -= 1
+
+    def _oldest_offset(self):
+        return self.offsets[(self.head - self.count) % self.max_blocks]
+
+    def append(self, block):
+        length = len(block)
+        if length > len(self.buffer):
+            raise ValueError("Block bigger than the store")
+        if self.write + length > len(self.buffer):
+            # Blocks past the write position are the oldest; give up the tail rather than split a block
+            while self.count and self._oldest_offset() >= self.write:
+                self._evict()
+            self.write = 0
+        while self.count and (self.count == self.max_blocks or
+                              self.write <= self._oldest_offset() < self.write + length):
+            self._evict()
+
+        self.buffer[self.write:self.write + length] = block
+        self.starts[self.head] = struct.unpack_from("<I", block, 4)[0]
+        self.offsets[self.head] = self.write
+        self.lengths[self.head] = length
+        self.head = (self.head + 1) % self.max_blocks
+        self.count += 1
+        self.write += length
+        self.rows += struct.unpack_from("<H", block, 2)[0]
+
+    def blocks(self, start=0, end=0xFFFFFFFF):
+        """Yield each block that may hold rows from start to end as a memoryview, oldest first"""
+        view = memoryview(self.buffer)
+        index = (self.head - self.count) % self.max_blocks
+        for n in range(self.count):
+            following = (index + 1) % self.max_blocks
+            if self.starts[index] > end:
+                return
+            # A block ends before the next one starts
+            if n == self.count - 1 or self.starts[following] >= start:
+                offset = self.offsets[index]
+                yield view[offset:offset + self.lengths[index]]
+            index = following
+
+    def size(self):
+        """Bytes of blocks held"""
+        total = 0
+        index = (self.head - self.count) % self.max_blocks
+        for _ in range(self.count):
+            total += self.lengths[index]
+            index = (index + 1) % self.max_blocks
+        return total
+
+
+def block_length(data, offset=0):
+    """Length of the block starting at offset, from the end of its last column"""
+    count = data[offset + 1]
+    return struct.unpack_from("<H", data, offset + HEADER_SIZE + 2 * count)[0]
+
+
+def decode(block, scales, columns=None, start=0, end=0xFFFFFFFF):
+    """Yield (timestamp, [values]) for the rows of block with start <= timestamp <= end
+
+    scales gives each field's scale, in column order. columns picks which
+    field indexes to decode, all of them by default; the others are never
+    read. Missing values come out as None.
+    """
+    _, count, rows, timestamp = struct.unpack_from(BLOCK_HEADER, block, 0)
+    if columns is None:
+        columns = range(count)
+    ends = struct.unpack_from("<%dH" % (count + 1), block, HEADER_SIZE)
+
+    # The time column says which rows are in range
+    offset = HEADER_SIZE + 2 * (count + 1)
+    times = []
+    first = None
+    for row in range(rows):
+        delta, offset = get_varint(block, offset)
+        timestamp += delta
+        if timestamp > end:
+            break
+        if timestamp >= start:
+            if first is None:
+                first = row
+            times.append(timestamp)
+    if first is None:
+        return
+    last = first + len(times)
+
+    decoded = []
+    for column in columns:
+        values = []
+        offset = ends[column]
+        previous = 0
+        scale = scales[column]
+        for row in range(last):
+            symbol, offset = get_varint(block, offset)
+            if symbol:
+                previous += unzigzag(symbol - 1)
+            if row >= first:
+                values.append(previous / scale if symbol else None)
+        decoded.append(values)
+
+    for row, timestamp in enumerate(times):
+        yield timestamp, [values[row] for values in decoded]
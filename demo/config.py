@@ -0,0 +1,31 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Settings from settings.toml on the device, or the environment on a host"""
+
+import os
+import sys
+import gc
+
+ON_DEVICE = sys.implementation.name == "circuitpython"
+
+
+def setting(name, default):
+    """Read SENSORTECH_<name>, converted to the type of default"""
+    value = os.getenv("SENSORTECH_" + name)
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value in (True, 1, "1", "true", "True", "yes")
+    return type(default)(value)
+
+
+def mem_free():
+    """Free heap bytes, or None on a host where gc doesn't report it"""
+    return gc.mem_free() if hasattr(gc, "mem_free") else None
+
+
+def mem_alloc():
+    """Allocated heap bytes, or None on a host where gc doesn't report it"""
+    return gc.mem_alloc() if hasattr(gc, "mem_alloc") else None
@@ -0,0 +1,268 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Append-only log of readings in flash, batched to spare the flash and the loop
+
+Readings collect in a preallocated RAM batch, and the whole batch is
+appended to the current segment file as one record, either when it's full
+or when it's been waiting long enough. Segments are rotated at a size cap
+and the oldest is deleted, so the log uses a fixed amount of flash.
+
+Each record is
+    u16 magic, u16 entry count, u32 sequence number, u32 CRC32 of the entries,
+    then per entry: u32 time (seconds, time.time()), u8 field index, f32 value
+
+A write cut short by a power loss leaves a record whose length or CRC is
+wrong. It's always at the end of a segment, so readers stop there, and at
+boot the log starts a fresh segment after it.
+
+On the device CIRCUITPY has to be writable by code, see boot.py.
+"""
+
+import os
+import time
+import struct
+import binascii
+from logger import log
+
+MAGIC = 0x5354
+RECORD_HEADER = "<HHII"
+HEADER_SIZE = struct.calcsize(RECORD_HEADER)
+ENTRY = "<IBf"
+ENTRY_SIZE = struct.calcsize(ENTRY)
+
+# errno values meaning the filesystem won't take any more writes
+EROFS = 30
+ENOSPC = 28
+
+
+def crc32(data):
+    return binascii.crc32(data) & 0xFFFFFFFF
+
+
+class DataLog:
+    """Batches readings and appends them to rotating segment files in directory
+
+    Each field is logged at most once every interval seconds.
+    """
+
+    def __init__(self, directory, fields, interval=30, batch=64, flush_seconds=300,
+                 segment_size=32 * 1024, segments=8):
+        self.directory = directory
+        self.interval = interval
+        self.batch = batch
+        self.flush_seconds = flush_seconds
+        self.segment_size = segment_size
+        self.segments = segments
+        self.enabled = True
+
+        # The pending record, written in place so adding a reading never allocates
+        self.buffer = bytearray(HEADER_SIZE + batch * ENTRY_SIZE)
+        self.view = memoryview(self.buffer)
+        # Records are read back one at a time into here
+        self.read_buffer = bytearray(len(self.buffer))
+        self.pending = 0
+        self.oldest_pending = 0
+        self.last_logged = [None] * fields
+
+        self.sequence = 0
+        self.segment = None
+        self.segment_bytes = 0
+        self.records_written = 0
+        self.torn = 0
+        self._valid_bytes = 0
+        self._open()
+
+    def _path(self, name):
+        return self.directory + "/" + name
+
+    def segment_names(self):
+        """Segment file names, oldest first"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(name for name in names if name.endswith(".log"))
+
+    def _open(self):
+        """Find where the last run left off, skipping a torn record at the end"""
+        try:
+            os.mkdir(self.directory)
+        except OSError:
+            pass
+        names = self.segment_names()
+        if not names:
+            self._rotate()
+            return
+        last = names[-1]
+        # A segment is named after its first record, which may be the torn one
+        self.sequence = int(last[:8], 16)
+        for sequence, _, _ in self.records(last):
+            self.sequence = sequence + 1
+        size = os.stat(self._path(last))[6]
+        self.segment = last
+        self.segment_bytes = size
+        if self._valid_bytes != size:
+            # Never append after a torn record, readers would stop before the new ones
+            self.torn += 1
+            log.warning("Log: torn record at %s offset %d, starting a new segment", last, self._valid_bytes)
+            self._abandon_segment()
+        log.info("Log: %d segments, next record %d", len(names), self.sequence)
+
+    def _abandon_segment(self):
+        """Carry on in a new segment, as this one may end in a torn record"""
+        # Skip a sequence number so the new segment's name can't collide with this one's
+        self.sequence += 1
+        self._rotate()
+
+    def _rotate(self):
+        self.segment = "%08x.log" % self.sequence
+        self.segment_bytes = 0
+        names = self.segment_names()
+        while len(names) >= self.segments:
+            os.remove(self._path(names.pop(0)))
+
+    def append(self, field, value, now=None):
+        """Queue a reading; it's dropped if the field was logged less than interval seconds ago"""
+        if not self.enabled or value is None:
+            return
+        if now is None:
+            now = int(time.time())
+        last = self.last_logged[field]
+        if last is not None and now - last < self.interval:
+            return
+        self.last_logged[field] = now
+        if not self.pending:
+            self.oldest_pending = now
+        struct.pack_into(ENTRY, self.buffer, HEADER_SIZE + self.pending * ENTRY_SIZE, now, field, value)
+        self.pending += 1
+        if self.pending == self.batch:
+            self.flush()
+
+    def tick(self, now=None):
+        """Flush a batch that's been waiting longer than flush_seconds; call about once a second"""
+        if not self.pending:
+            return
+        if now is None:
+            now = int(time.time())
+        if now - self.oldest_pending >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        if not self.pending or not self.enabled:
+            return
+        used = HEADER_SIZE + self.pending * ENTRY_SIZE
+        if self.segment_bytes and self.segment_bytes + used > self.segment_size:
+            self._rotate()
+        struct.pack_into(RECORD_HEADER, self.buffer, 0, MAGIC, self.pending, self.sequence,
+                         crc32(self.view[HEADER_SIZE:used]))
+        try:
+            with open(self._path(self.segment), "ab") as f:
+                written = f.write(self.view[:used])
+        except OSError as e:
+            if e.args and e.args[0] in (EROFS, ENOSPC):
+                # Read-only or full: stop trying rather than failing every batch
+                self.enabled = False
+            log.error("Error writing log: %s", str(e))
+            # Part of the record may have gone; readers stop there, so don't write after it
+            if self.enabled:
+                self._abandon_segment()
+            return
+        finally:
+            self.pending = 0
+        if written is not None and written != used:
+            log.error("Error writing log: %d of %d bytes written", written, used)
+            self._abandon_segment()
+            return
+        self.segment_bytes += used
+        self.sequence += 1
+        self.records_written += 1
+
+    def records(self, name):
+        """Yield (sequence, entry count, entries) for each intact record in segment name
+
+        The entries are a memoryview into read_buffer, only valid until the
+        next record. Stops at the first bad record; self._valid_bytes is left
+        at the end of the last good one.
+        """
+        buffer = self.read_buffer
+        view = memoryview(buffer)
+        self._valid_bytes = 0
+        with open(self._path(name), "rb") as f:
+            while True:
+                if f.readinto(view[:HEADER_SIZE]) != HEADER_SIZE:
+                    return
+                magic, count, sequence, crc = struct.unpack_from(RECORD_HEADER, buffer, 0)
+                size = count * ENTRY_SIZE
+                if magic != MAGIC or HEADER_SIZE + size > len(buffer):
+                    return
+                entries = view[HEADER_SIZE:HEADER_SIZE + size]
+                if f.readinto(entries) != size or crc32(entries) != crc:
+                    return
+                self._valid_bytes += HEADER_SIZE + size
+                yield sequence, count, entries
+
+    def export(self, start, end):
+        """Yield (sequence, time, field index, value) for logged readings with start <= time <= end
+
+        Reads one record at a time into read_buffer, so memory use doesn't
+        grow with the size of the log. Readings still in the RAM batch come
+        last, with the sequence number their record will get, without
+        writing them out.
+        """
+        for name in self.segment_names():
+            try:
+                for sequence, count, entries in self.records(name):
+                    for index in range(count):
+                        timestamp, field, value = struct.unpack_from(ENTRY, entries, index * ENTRY_SIZE)
+                        if start <= timestamp <= end:
+                            yield sequence, timestamp, field, value
+            except OSError:
+                # Rotated away while we were reading
+                continue
+        record = self.pending_record()
+        if record is not None:
+            _, count, sequence, _ = struct.unpack_from(RECORD_HEADER, record, 0)
+            for index in range(count):
+                timestamp, field, value = struct.unpack_from(ENTRY, record, HEADER_SIZE + index * ENTRY_SIZE)
+                if start <= timestamp <= end:
+                    yield sequence, timestamp, field, value
+
+    def export_records(self, start, end):
+        """Yield the raw bytes of each intact record with any reading between start and end
+
+        The RAM batch comes last, as the record flush() would write.
+        """
+        for name in self.segment_names():
+            try:
+                for _, count, entries in self.records(name):
+                    if not count:
+                        continue
+                    first = struct.unpack_from("<I", entries, 0)[0]
+                    last = struct.unpack_from("<I", entries, (count - 1) * ENTRY_SIZE)[0]
+                    if first <= end and last >= start:
+                        yield memoryview(self.read_buffer)[:HEADER_SIZE + count * ENTRY_SIZE]
+            except OSError:
+                continue
+        record = self.pending_record()
+        if record is not None:
+            count = struct.unpack_from(RECORD_HEADER, record, 0)[1]
+            first = struct.unpack_from("<I", record, HEADER_SIZE)[0]
+            last = struct.unpack_from("<I", record, HEADER_SIZE + (count - 1) * ENTRY_SIZE)[0]
+            if first <= end and last >= start:
+                yield record
+
+    def pending_record(self):
+        """A copy of the RAM batch as the record flush() would write, or None if it's empty
+
+        A copy, because a response streams over several passes of the loop and
+        the batch can be flushed and refilled in between.
+        """
+        if not self.pending:
+            return None
+        used = HEADER_SIZE + self.pending * ENTRY_SIZE
+        record = bytearray(self.view[:used])
+        struct.pack_into(RECORD_HEADER, record, 0, MAGIC, self.pending, self.sequence,
+                         crc32(memoryview(record)[HEADER_SIZE:]))
+        return record
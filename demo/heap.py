@@ -0,0 +1,148 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Garbage collection in the loop's idle time, and a watch on fragmentation
+
+Left alone, CircuitPython collects whenever an allocation finds the heap
+full. That can happen in the middle of a response or an I2C read, and
+the pause grows with the heap, not with the garbage. So the server loop
+calls idle() whenever it has nothing in flight, with the time the next
+sensor is due. If a collection is needed, and the pauses seen so far say
+it'll finish before then, it runs there.
+
+Asking how much is allocated walks the heap, so idle() doesn't. It goes by
+self.allocated, which the loop updates from its once-a-second heap sample.
+
+gc.threshold() is adapted to the allocation rate. Automatic collection
+then only fires if idle slots stop coming, and never lets the heap get
+more than half used up between them.
+
+Every so often, straight after a collection, the largest block that can
+still be allocated is found by binary search. When it falls well below the
+free total, the heap is fragmenting. That's what eventually ends in a
+MemoryError even though gc.mem_free() looks fine.
+"""
+
+import gc
+import time
+from config import mem_free, mem_alloc
+from logger import log
+from metrics import Histogram, now_us
+
+# Collect in idle time once this share of the automatic threshold has been allocated
+IDLE_SHARE = 0.5
+# ... or at least this often, in seconds
+MAX_INTERVAL = 30
+# Never set the automatic threshold below this many bytes
+MIN_THRESHOLD = 4096
+# Aim for an automatic collection no sooner than this many seconds of allocation
+THRESHOLD_SECONDS = 10
+# Only start a collection with this many times its expected pause to spare
+MARGIN = 2
+# Seconds between largest free block probes, and the most probe allocations each takes
+PROBE_INTERVAL = 60
+PROBE_STEPS = 8
+
+
+class Heap:
+    """Schedules collections into idle time and keeps heap statistics for /metrics"""
+
+    def __init__(self):
+        self.pauses = Histogram()
+        self.pause_us = 0
+        self.pause_max_us = 0
+        self.collections = 0
+        self.skipped = 0
+        self.memory_errors = 0
+        self.threshold = None
+        self.largest_free = None
+        self.free_after = mem_free()
+        self.alloc_after = mem_alloc()
+        # Bytes allocated at the last once-a-second heap sample, or None on a host
+        self.allocated = self.alloc_after
+        self.last_collect = time.monotonic()
+        self.last_probe = self.last_collect
+        # Bytes allocated per second, between collections
+        self.alloc_rate = None
+        if hasattr(gc, "threshold"):
+            self.threshold = gc.threshold()
+
+    def due(self, now):
+        """True if enough has been allocated, or enough time passed, to be worth a collection"""
+        if now - self.last_collect >= MAX_INTERVAL:
+            return True
+        if self.allocated is None or self.threshold is None or self.threshold < 0:
+            return False
+        return self.allocated - self.alloc_after >= self.threshold * IDLE_SHARE
+
+    def idle(self, deadline=None):
+        """Collect now if it's due and will be over before deadline (a time.monotonic()); True if it ran"""
+        now = time.monotonic()
+        if not self.due(now):
+            return False
+        spare = None if deadline is None else (deadline - now) * 1000000
+        if spare is not None and spare < self.pause_us * MARGIN:
+            self.skipped += 1
+            return False
+        self.collect()
+        if mem_free() is not None and time.monotonic() - self.last_probe >= PROBE_INTERVAL:
+            if spare is None or spare >= self.pause_us * MARGIN * (PROBE_STEPS + 2):
+                self.probe()
+        return True
+
+    def collect(self):
+        """Collect and time it, then retune the automatic threshold"""
+        allocated = mem_alloc()
+        started = now_us()
+        gc.collect()
+        pause = now_us() - started
+        now = time.monotonic()
+        self.pauses.observe(pause)
+        self.pause_us = pause if not self.collections else self.pause_us + (pause - self.pause_us) // 4
+        self.pause_max_us = max(self.pause_max_us, pause)
+        self.collections += 1
+        if allocated is not None and now > self.last_collect:
+            rate = max(0, allocated - self.alloc_after) / (now - self.last_collect)
+            self.alloc_rate = rate if self.alloc_rate is None else self.alloc_rate + (rate - self.alloc_rate) / 4
+        self.last_collect = now
+        self.free_after = mem_free()
+        self.alloc_after = self.allocated = mem_alloc()
+        self.tune()
+
+    def tune(self):
+        """Set gc.threshold() from the allocation rate, capped at half the free heap"""
+        if self.threshold is None or self.alloc_rate is None or self.free_after is None:
+            return
+        threshold = int(self.alloc_rate * THRESHOLD_SECONDS)
+        threshold = max(MIN_THRESHOLD, min(threshold, self.free_after // 2))
+        # Don't churn it over small changes
+        if self.threshold > 0 and abs(threshold - self.threshold) < self.threshold // 4:
+            return
+        gc.threshold(threshold)
+        self.threshold = threshold
+        log.debug("GC threshold %d bytes, %d bytes/s allocated", threshold, self.alloc_rate)
+
+    def probe(self):
+        """Find the largest block that can be allocated, to within free / 2**PROBE_STEPS"""
+        self.last_probe = time.monotonic()
+        low, high = 0, self.free_after
+        for _ in range(PROBE_STEPS):
+            middle = (low + high) // 2
+            try:
+                block = bytearray(middle)
+                low = middle
+            except MemoryError:
+                high = middle
+            block = None
+        # Don't leave the last probe taking up the heap
+        gc.collect()
+        self.largest_free = low
+        if low < self.free_after // 4:
+            log.warning("Heap fragmented: largest free block %d of %d bytes free", low, self.free_after)
+
+    def memory_error(self):
+        """Count a MemoryError and collect straight away, idle or not"""
+        self.memory_errors += 1
+        self.collect()
+        log.error("Out of memory, %s bytes free after collecting", self.free_after)
@@ -0,0 +1,278 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Preallocated per-field history of sensor readings
+
+Each field keeps its newest raw samples plus rollup tiers of
+min/max/mean/count buckets (by default 1 minute and 1 hour wide). Every
+tier is a fixed set of arrays allocated up front, so recording a reading
+is O(1) per tier and never allocates, and a query over a long span reads
+a few hundred buckets instead of every raw sample.
+
+Every sample a field records gets the next sequence number, starting at 1,
+so a client that knows the last one it has can ask for just the samples
+after it. Sequence numbers aren't stored: the newest raw sample's is the
+count of samples ever appended, and the rest count back from there.
+"""
+
+import time
+from array import array
+
+# Bytes per element for the typecodes we use; 'I' is 32 bits on both CircuitPython and CPython
+ITEM_SIZES = {'H': 2, 'I': 4, 'f': 4}
+
+
+def groups(n, step):
+    """How many entries n buckets make when merged step at a time"""
+    return (n + step - 1) // step
+
+
+def uptime():
+    """Whole seconds since boot, without monotonic()'s float precision loss"""
+    return time.monotonic_ns() // 1000000000
+
+
+class RingBuffer:
+    """Fixed-capacity circular buffer of (timestamp, value) samples
+
+    Both arrays are allocated once, so appending never allocates.
+    appended counts every sample ever appended, which makes it the newest
+    sample's sequence number.
+    """
+
+    # Raw samples have no fixed spacing
+    interval = 0
+
+    def __init__(self, typecode, capacity):
+        self.typecode = typecode
+        self.capacity = capacity
+        self.times = array('I', (0 for _ in range(capacity)))
+        self.values = array(typecode, (0 for _ in range(capacity)))
+        self.head = 0
+        self.count = 0
+        self.appended = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, value):
+        self.appended += 1
+        self.times[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def window(self, n, limit=None):
+        """Yield the newest n samples, oldest first, stopping after limit of them"""
+        n = min(n, self.count)
+        index = (self.head - n) % self.capacity
+        for _ in range(n if limit is None else min(n, limit)):
+            yield self.times[index], self.values[index]
+            index = (index + 1) % self.capacity
+
+    def since(self, timestamp):
+        """How many of the newest samples are at or after timestamp, by binary search"""
+        oldest = (self.head - self.count) % self.capacity
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[(oldest + middle) % self.capacity] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return self.count - low
+
+    def oldest(self):
+        if not self.count:
+            return None
+        return self.times[(self.head - self.count) % self.capacity]
+
+    def after(self, sequence):
+        """How many of the newest samples have sequence numbers after sequence
+
+        Samples already overwritten can't be counted, so after a long enough
+        gap this is every sample held.
+        """
+        return max(0, min(self.count, self.appended - sequence))
+
+
+class Rollup:
+    """Fixed-capacity circular buffer of min/max/mean/count buckets, interval seconds wide
+
+    Buckets are contiguous, so their start times aren't stored: the newest
+    (still open) bucket starts at self.start and each older one interval
+    seconds before it. Intervals with no readings are kept as empty buckets.
+    """
+
+    def __init__(self, typecode, interval, capacity):
+        self.typecode = typecode
+        self.interval = interval
+        self.capacity = capacity
+        self.mins = array(typecode, (0 for _ in range(capacity)))
+        self.maxes = array(typecode, (0 for _ in range(capacity)))
+        # A running mean rather than a sum, so it can't overflow a float32's precision
+        self.means = array('f', (0 for _ in range(capacity)))
+        self.counts = array('H', (0 for _ in range(capacity)))
+        # Slot of the open bucket and its start time
+        self.head = 0
+        self.start = 0
+        self.count = 0
+        # Readings ever added, so the sequence number of the newest one
+        self.appended = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, timestamp, value):
+        self.appended += 1
+        start = timestamp - timestamp % self.interval
+        if not self.count:
+            self.start = start
+            self.count = 1
+        elif start > self.start:
+            # Close the open bucket, leaving empty ones for any intervals with no readings
+            for _ in range(min((start - self.start) // self.interval, self.capacity)):
+                self.head = (self.head + 1) % self.capacity
+                self.counts[self.head] = 0
+                if self.count < self.capacity:
+                    self.count += 1
+            self.start = start
+        elif start < self.start:
+            return
+
+        index = self.head
+        n = self.counts[index]
+        if n == 0:
+            self.mins[index] = value
+            self.maxes[index] = value
+            self.means[index] = value
+        else:
+            if value < self.mins[index]:
+                self.mins[index] = value
+            if value > self.maxes[index]:
+                self.maxes[index] = value
+            self.means[index] += (value - self.means[index]) / (n + 1)
+        if n < 0xFFFF:
+            self.counts[index] = n + 1
+
+    def window(self, n, step=1):
+        """Yield (start, mean, min, max, count) for the newest n buckets, oldest first
+
+        With step > 1, every step adjacent buckets are merged into one, the
+        newest group ending with the open bucket. Intervals with no readings
+        come out with a count of 0.
+        """
+        n = min(n, self.count)
+        index = (self.head - n + 1) % self.capacity
+        start = self.start - (n - 1) * self.interval
+        # The oldest group takes whatever is left over
+        group = n - (groups(n, step) - 1) * step
+        while n > 0:
+            low = high = None
+            mean = 0.0
+            total = 0
+            for _ in range(group):
+                count = self.counts[index]
+                if count:
+                    if total == 0 or self.mins[index] < low:
+                        low = self.mins[index]
+                    if total == 0 or self.maxes[index] > high:
+                        high = self.maxes[index]
+                    total += count
+                    mean += (self.means[index] - mean) * count / total
+                index = (index + 1) % self.capacity
+            yield start, mean, low or 0, high or 0, total
+            start += group * self.interval
+            n -= group
+            group = step
+
+    def since(self, timestamp):
+        """How many of the newest buckets end after timestamp
+
+        The oldest of them may only partly cover the span from timestamp on.
+        """
+        if not self.count or timestamp > self.start:
+            return min(1, self.count)
+        return min(self.count, (self.start - timestamp - 1) // self.interval + 2)
+
+    def oldest(self):
+        if not self.count:
+            return None
+        return self.start - (self.count - 1) * self.interval
+
+
+class History:
+    """Raw samples and rollup tiers for every field
+
+    fields is a sequence of (name, array typecode) pairs. The raw buffers
+    share budget bytes between them; tiers is a sequence of (interval
+    seconds, bucket count) pairs, finest first, each allocated per field.
+    """
+
+    def __init__(self, fields, budget, tiers=()):
+        per_sample = sum(ITEM_SIZES['I'] + ITEM_SIZES[typecode] for _, typecode in fields)
+        self.capacity = max(1, budget // per_sample)
+        self.tiers = tiers
+        self.rings = {}
+        self.rollups = {}
+        for field, typecode in fields:
+            self.rings[field] = RingBuffer(typecode, self.capacity)
+            self.rollups[field] = tuple(Rollup(typecode, interval, capacity)
+                                        for interval, capacity in tiers)
+
+    def record(self, field, value, timestamp=None):
+        if value is None:
+            return
+        if timestamp is None:
+            timestamp = uptime()
+        self.rings[field].append(timestamp, value)
+        for rollup in self.rollups[field]:
+            rollup.add(timestamp, value)
+
+    def ring(self, field):
+        return self.rings.get(field)
+
+    def select(self, field, span, max_points, now=None):
+        """Pick the buffer to answer a query for the last span seconds of field
+
+        Uses raw samples if they cover the span in at most max_points,
+        otherwise the finest rollup tier that covers it, merging buckets so
+        the answer stays within max_points. Returns (buffer, entries to read,
+        buckets merged per point), or None for an unknown field.
+        """
+        ring = self.rings.get(field)
+        if ring is None:
+            return None
+        if now is None:
+            now = uptime()
+        since = now - span
+        if self.covers(ring, since) and ring.since(since) <= max_points:
+            return ring, ring.since(since), 1
+        rollups = self.rollups[field]
+        if not rollups:
+            return ring, min(ring.since(since), max_points), 1
+        for rollup in rollups:
+            if self.covers(rollup, since):
+                break
+        n = rollup.since(since)
+        return rollup, n, groups(n, max(1, max_points))
+
+    @staticmethod
+    def covers(buffer, since):
+        """True if buffer reaches back to since, or has never filled up and so holds everything"""
+        if len(buffer) < buffer.capacity:
+            return True
+        oldest = buffer.oldest()
+        # A bucket that starts before since but ends after it is close enough
+        return oldest <= since or oldest < since + buffer.interval
+
+    def size(self):
+        """Bytes allocated for all the buffers"""
+        total = 0
+        for field, ring in self.rings.items():
+            total += ring.capacity * (ITEM_SIZES['I'] + ITEM_SIZES[ring.typecode])
+            for rollup in self.rollups[field]:
+                total += rollup.capacity * (2 * ITEM_SIZES[rollup.typecode] + ITEM_SIZES['f'] + ITEM_SIZES['H'])
+        return total
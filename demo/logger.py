@@ -0,0 +1,141 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Leveled log kept in a RAM ring buffer, and echoed to the serial console
+
+Messages are a %-style format string and its arguments. Below the log's
+level a call returns before anything else happens; otherwise the format
+and arguments go into the ring as they are, and the string is only built
+when the message is echoed to the console or read back through /log.
+
+Writing to the USB console blocks, so two things keep a noisy message from
+flooding it:
+- a message repeating the previous one exactly just bumps its repeat count,
+  and the console hears "repeated N times" once something else comes along
+- each format string gets at most burst messages per window seconds, and
+  says how many were dropped once it's allowed through again
+
+    from logger import log
+    log.info("Sampling every %d s", period)
+
+Pass exceptions as str(e): an exception in the ring would keep its
+traceback alive, and two of them never compare equal for the dedupe.
+"""
+
+from array import array
+from history import uptime
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+def level_number(name):
+    """The level called name, e.g. from a setting"""
+    try:
+        return LEVELS[name.lower()]
+    except KeyError:
+        raise ValueError("Unknown log level %s" % name) from None
+
+
+class Logger:
+    """Ring of the newest size messages at level or above; console gets those at console_level or above"""
+
+    def __init__(self, size=64, level=INFO, console_level=INFO, burst=5, window=60):
+        self.size = size
+        self.level = level
+        self.console_level = console_level
+        self.burst = burst
+        self.window = window
+        # The ring, one slot per message, all allocated up front
+        self.formats = [None] * size
+        self.args = [None] * size
+        self.levels = bytearray(size)
+        self.times = array('I', (0 for _ in range(size)))
+        self.repeats = array('H', (0 for _ in range(size)))
+        # Sequence number of the next message; message n is in slot n % size
+        self.sequence = 0
+        # Format string -> [window start, messages let through, messages dropped]
+        self._limits = {}
+        self.dropped = 0
+
+    def debug(self, fmt, *args):
+        if DEBUG >= self.level:
+            self.log(DEBUG, fmt, args)
+
+    def info(self, fmt, *args):
+        if INFO >= self.level:
+            self.log(INFO, fmt, args)
+
+    def warning(self, fmt, *args):
+        if WARNING >= self.level:
+            self.log(WARNING, fmt, args)
+
+    def error(self, fmt, *args):
+        if ERROR >= self.level:
+            self.log(ERROR, fmt, args)
+
+    def log(self, level, fmt, args=()):
+        if level < self.level:
+            return
+        last = (self.sequence - 1) % self.size
+        if self.sequence and self.formats[last] is fmt and self.args[last] == args:
+            if self.repeats[last] < 0xFFFF:
+                self.repeats[last] += 1
+            return
+
+        now = uptime()
+        limit = self._limits.get(fmt)
+        if limit is None:
+            limit = self._limits[fmt] = [now, 0, 0]
+        elif now - limit[0] >= self.window:
+            limit[0] = now
+            limit[1] = 0
+        if limit[1] >= self.burst:
+            limit[2] += 1
+            self.dropped += 1
+            return
+        limit[1] += 1
+
+        if self.sequence and self.repeats[last] and self.levels[last] >= self.console_level:
+            print("Last message repeated %d times" % self.repeats[last])
+        slot = self.sequence % self.size
+        self.formats[slot] = fmt
+        self.args[slot] = args
+        self.levels[slot] = level
+        self.times[slot] = now
+        self.repeats[slot] = 0
+        self.sequence += 1
+        if level >= self.console_level:
+            print(self.message(slot))
+        if limit[2]:
+            if level >= self.console_level:
+                print("%d more like that dropped" % limit[2])
+            limit[2] = 0
+
+    def message(self, slot):
+        """The text of the message in slot"""
+        fmt, args = self.formats[slot], self.args[slot]
+        if not args:
+            return fmt
+        try:
+            return fmt % args
+        except (TypeError, ValueError):
+            return "%s %r" % (fmt, args)
+
+    def entries(self, since=0, level=DEBUG):
+        """Yield (sequence, time, level name, message, repeats) for messages from sequence since on"""
+        first = max(since, self.sequence - self.size, 0)
+        for sequence in range(first, self.sequence):
+            slot = sequence % self.size
+            if self.levels[slot] >= level:
+                yield (sequence, self.times[slot], LEVEL_NAMES[self.levels[slot]],
+                       self.message(slot), self.repeats[slot])
+
+
+# The one log everything shares
+log = Logger()
@@ -0,0 +1,248 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Counters and histograms cheap enough to leave on, rendered in Prometheus text format
+
+Durations are kept as integer microseconds and histograms count into
+preallocated arrays, so recording a sample never allocates a container.
+Strings are only built when /metrics is scraped.
+"""
+
+import time
+from array import array
+from config import mem_free, mem_alloc
+
+# Bucket upper bounds in microseconds, shared by every histogram
+BUCKETS_US = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+
+
+def now_us():
+    return time.monotonic_ns() // 1000
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in microseconds"""
+
+    def __init__(self):
+        # One slot per bound plus a final +Inf slot
+        self.counts = array('I', (0 for _ in range(len(BUCKETS_US) + 1)))
+        self.count = 0
+        self.total_us = 0
+
+    def observe(self, duration_us):
+        index = 0
+        for bound in BUCKETS_US:
+            if duration_us <= bound:
+                break
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total_us += duration_us
+
+    def render(self, name, labels):
+        """Yield Prometheus lines; labels is a preformatted 'key="value",' prefix"""
+        cumulative = 0
+        for index, bound in enumerate(BUCKETS_US):
+            cumulative += self.counts[index]
+            yield '%s_bucket{%sle="%s"} %d\n' % (name, labels, bound / 1000000, cumulative)
+        yield '%s_bucket{%sle="+Inf"} %d\n' % (name, labels, self.count)
+        labels = labels.rstrip(',')
+        labels = '{%s}' % labels if labels else ''
+        yield '%s_sum%s %s\n' % (name, labels, self.total_us / 1000000)
+        yield '%s_count%s %d\n' % (name, labels, self.count)
+
+
+class SensorMetrics:
+    def __init__(self, adapter=None):
+        # The sensor adapter, for its configuration write counts and sampling period
+        self.adapter = adapter
+        self.read_time = Histogram()
+        self.reads = 0
+        self.errors = 0
+        self.last_sample_us = None
+        # Smoothed microseconds between samples, for the achieved sample rate
+        self.interval_us = None
+
+    def read_ok(self, started_us):
+        finished = now_us()
+        self.read_time.observe(finished - started_us)
+        self.reads += 1
+        if self.last_sample_us is not None:
+            interval = finished - self.last_sample_us
+            if self.interval_us is None:
+                self.interval_us = interval
+            else:
+                self.interval_us += (interval - self.interval_us) / 8
+        self.last_sample_us = finished
+
+    def read_failed(self):
+        self.errors += 1
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.duration = Histogram()
+        self.requests = 0
+        self.bytes_sent = 0
+
+
+class Metrics:
+    """Everything /metrics reports"""
+
+    def __init__(self):
+        self.sensors = {}
+        self.routes = {}
+        self.poll_time = Histogram()
+        self.loop_overruns = 0
+        # A power.Power, for its current estimate and light sleep time
+        self.power = None
+        # A heap.Heap, for collection pauses and fragmentation
+        self.heap = None
+        # A telemetry.Telemetry, when samples are being pushed to a collector
+        self.telemetry = None
+        self.heap_free_min = None
+        self.heap_alloc_max = None
+        # The request currently being handled by server.poll()
+        self._route = None
+        self._response = None
+        self._started_us = 0
+
+    def sensor(self, name, adapter=None):
+        if name not in self.sensors:
+            self.sensors[name] = SensorMetrics(adapter)
+        return self.sensors[name]
+
+    def route(self, name):
+        """Decorator for route handlers; pair with request_finished() after server.poll()"""
+        self.routes[name] = RouteMetrics()
+
+        def decorator(handler):
+            def timed_handler(request, *args, **kwargs):
+                self._started_us = now_us()
+                self._route = self.routes[name]
+                self._response = handler(request, *args, **kwargs)
+                return self._response
+            return timed_handler
+        return decorator
+
+    def request_finished(self):
+        """Credit the response just sent by server.poll() to its route"""
+        route = self._route
+        if route is None:
+            return
+        route.duration.observe(now_us() - self._started_us)
+        route.requests += 1
+        if self._response is not None:
+            route.bytes_sent += getattr(self._response, "_size", 0)
+        self._route = None
+        self._response = None
+
+    def sample_heap(self):
+        """Update the heap low and high water marks; returns the bytes allocated, or None on a host"""
+        free, allocated = mem_free(), mem_alloc()
+        if free is None:
+            return None
+        if self.heap_free_min is None or free < self.heap_free_min:
+            self.heap_free_min = free
+        if self.heap_alloc_max is None or allocated > self.heap_alloc_max:
+            self.heap_alloc_max = allocated
+        return allocated
+
+    def render(self):
+        """Yield the Prometheus text exposition, a few lines at a time"""
+        now = now_us()
+        self.sample_heap()
+
+        yield '# TYPE sensortech_sensor_read_seconds histogram\n'
+        for name, sensor in self.sensors.items():
+            yield from sensor.read_time.render('sensortech_sensor_read_seconds', 'sensor="%s",' % name)
+        yield '# TYPE sensortech_sensor_reads_total counter\n'
+        for name, sensor in self.sensors.items():
+            yield 'sensortech_sensor_reads_total{sensor="%s",result="ok"} %d\n' % (name, sensor.reads)
+            yield 'sensortech_sensor_reads_total{sensor="%s",result="error"} %d\n' % (name, sensor.errors)
+        yield '# TYPE sensortech_sensor_config_writes_total counter\n'
+        for name, sensor in self.sensors.items():
+            if sensor.adapter is not None:
+                yield 'sensortech_sensor_config_writes_total{sensor="%s",result="written"} %d\n' % (
+                    name, sensor.adapter.writes)
+                yield 'sensortech_sensor_config_writes_total{sensor="%s",result="skipped"} %d\n' % (
+                    name, sensor.adapter.writes_skipped)
+        yield '# TYPE sensortech_sensor_period_seconds gauge\n'
+        for name, sensor in self.sensors.items():
+            if sensor.adapter is not None:
+                yield 'sensortech_sensor_period_seconds{sensor="%s"} %s\n' % (name, sensor.adapter.period)
+        yield '# TYPE sensortech_sensor_sample_rate_hertz gauge\n'
+        for name, sensor in self.sensors.items():
+            if sensor.interval_us:
+                yield 'sensortech_sensor_sample_rate_hertz{sensor="%s"} %s\n' % (
+                    name, 1000000 / sensor.interval_us)
+        yield '# TYPE sensortech_sensor_sample_age_seconds gauge\n'
+        for name, sensor in self.sensors.items():
+            if sensor.last_sample_us is not None:
+                age = (now - sensor.last_sample_us) / 1000000
+                yield 'sensortech_sensor_sample_age_seconds{sensor="%s"} %s\n' % (name, age)
+
+        yield '# TYPE sensortech_http_request_seconds histogram\n'
+        for name, route in self.routes.items():
+            yield from route.duration.render('sensortech_http_request_seconds', 'route="%s",' % name)
+        yield '# TYPE sensortech_http_requests_total counter\n'
+        for name, route in self.routes.items():
+            yield 'sensortech_http_requests_total{route="%s"} %d\n' % (name, route.requests)
+        yield '# TYPE sensortech_http_response_bytes_total counter\n'
+        for name, route in self.routes.items():
+            yield 'sensortech_http_response_bytes_total{route="%s"} %d\n' % (name, route.bytes_sent)
+
+        yield '# TYPE sensortech_server_poll_seconds histogram\n'
+        yield from self.poll_time.render('sensortech_server_poll_seconds', '')
+        yield '# TYPE sensortech_loop_overruns_total counter\n'
+        yield 'sensortech_loop_overruns_total %d\n' % self.loop_overruns
+
+        if self.power is not None:
+            yield '# TYPE sensortech_power_estimated_milliamps gauge\n'
+            yield 'sensortech_power_estimated_milliamps{profile="%s"} %s\n' % (
+                self.power.profile, self.power.estimate())
+            yield '# TYPE sensortech_light_sleep_seconds_total counter\n'
+            yield 'sensortech_light_sleep_seconds_total %s\n' % self.power.slept
+
+        heap = self.heap
+        if heap is not None:
+            yield '# TYPE sensortech_gc_pause_seconds histogram\n'
+            yield from heap.pauses.render('sensortech_gc_pause_seconds', '')
+            yield '# TYPE sensortech_gc_pause_max_seconds gauge\n'
+            yield 'sensortech_gc_pause_max_seconds %s\n' % (heap.pause_max_us / 1000000)
+            yield '# TYPE sensortech_gc_skipped_total counter\n'
+            yield 'sensortech_gc_skipped_total %d\n' % heap.skipped
+            yield '# TYPE sensortech_memory_errors_total counter\n'
+            yield 'sensortech_memory_errors_total %d\n' % heap.memory_errors
+            if heap.threshold is not None:
+                yield '# TYPE sensortech_gc_threshold_bytes gauge\n'
+                yield 'sensortech_gc_threshold_bytes %d\n' % heap.threshold
+            if heap.largest_free is not None:
+                yield '# TYPE sensortech_heap_largest_free_bytes gauge\n'
+                yield 'sensortech_heap_largest_free_bytes %d\n' % heap.largest_free
+
+        telemetry = self.telemetry
+        if telemetry is not None:
+            yield '# TYPE sensortech_telemetry_batches_total counter\n'
+            yield 'sensortech_telemetry_batches_total{result="sent"} %d\n' % telemetry.batches_sent
+            yield 'sensortech_telemetry_batches_total{result="dropped"} %d\n' % telemetry.dropped
+            yield '# TYPE sensortech_telemetry_samples_total counter\n'
+            yield 'sensortech_telemetry_samples_total %d\n' % telemetry.samples_sent
+            yield '# TYPE sensortech_telemetry_bytes_total counter\n'
+            yield 'sensortech_telemetry_bytes_total %d\n' % telemetry.bytes_sent
+            yield '# TYPE sensortech_telemetry_errors_total counter\n'
+            yield 'sensortech_telemetry_errors_total %d\n' % telemetry.errors
+            yield '# TYPE sensortech_telemetry_queued_batches gauge\n'
+            yield 'sensortech_telemetry_queued_batches %d\n' % len(telemetry.queue)
+
+        free = mem_free()
+        if free is not None:
+            yield '# TYPE sensortech_heap_free_bytes gauge\n'
+            yield 'sensortech_heap_free_bytes %d\n' % free
+            yield '# TYPE sensortech_heap_free_min_bytes gauge\n'
+            yield 'sensortech_heap_free_min_bytes %d\n' % self.heap_free_min
+            yield '# TYPE sensortech_heap_alloc_bytes gauge\n'
+            yield 'sensortech_heap_alloc_bytes %d\n' % mem_alloc()
+            yield '# TYPE sensortech_heap_alloc_max_bytes gauge\n'
+            yield 'sensortech_heap_alloc_max_bytes %d\n' % self.heap_alloc_max
@@ -0,0 +1,126 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Power profiles, for running the demo from a battery
+
+SENSORTECH_POWER_PROFILE picks one:
+
+performance (the default)
+    every sensor adapts its sampling rate to its readings, see sensors.py
+low_power
+    every sensor is sampled every 30 seconds: the SCD4x in its low power
+    periodic mode, the CCS811 in its 60 second drive mode
+single_shot
+    every sensor is sampled every SENSORTECH_POWER_INTERVAL seconds (300 by
+    default): the SCD41 by single shot measurements, the ENS160 left idle
+    except for the 30 seconds before each read, the CCS811 in its 60
+    second drive mode
+
+The sensors are read together, so with SENSORTECH_POWER_LIGHT_SLEEP the
+board can light sleep, radio and all, from one round of reads to the next.
+It only does once nobody has made a request for AWAKE_AFTER_REQUEST
+seconds, and while it sleeps the dashboard doesn't answer.
+
+The current estimate adds the datasheet figures for each sensor in its mode
+to the board's, awake or asleep. It's good for comparing profiles, not for
+sizing a battery.
+"""
+
+import time
+from config import ON_DEVICE
+
+if ON_DEVICE:
+    import alarm
+
+PROFILES = ('performance', 'low_power', 'single_shot')
+# Seconds between samples in the low_power profile, the SCD4x's low power period
+LOW_POWER_INTERVAL = 30
+# The CCS811's slowest drive mode, which samples every 60 seconds
+CCS811_SLOW_MODE = (60, 3)
+# Rough average current in mA of an ESP32-S2 with its access point up, and in light sleep
+AWAKE_MA = 70
+LIGHT_SLEEP_MA = 0.8
+# Light sleeping for less than this many seconds isn't worth the wake-up
+MIN_SLEEP = 2
+# Stay awake this long after a request, so an open dashboard keeps working
+AWAKE_AFTER_REQUEST = 30
+
+
+class Power:
+    """Applies a power profile to the sensors and schedules light sleep between samples"""
+
+    def __init__(self, profile="performance", interval=300, light_sleep=False):
+        if profile not in PROFILES:
+            raise ValueError("Unknown power profile %s" % profile)
+        self.profile = profile
+        self.interval = LOW_POWER_INTERVAL if profile == 'low_power' else interval
+        self.light_sleep = light_sleep and profile != 'performance'
+        self.sensors = ()
+        # Sensor name -> time.monotonic() it next needs the CPU
+        self.wakes = {}
+        self.started = time.monotonic()
+        self.last_request = self.started
+        self.slept = 0.0
+        self.sleeps = 0
+
+    def configure(self, sensors):
+        """Pin each sensor to the profile's mode; call before bringing them up
+
+        sensors maps driver library names to adapters, as start_sensors() returns.
+        """
+        self.sensors = tuple(sensors.values())
+        if self.profile == 'performance':
+            return
+        for driver, sensor in sensors.items():
+            if driver == 'adafruit_scd4x':
+                sensor.fix_mode(self.interval, 'low power' if self.profile == 'low_power' else 'single shot')
+            elif driver == 'adafruit_ccs811':
+                sensor.fix_mode(max(self.interval, CCS811_SLOW_MODE[0]), CCS811_SLOW_MODE[1])
+            elif driver == 'adafruit_ens160' and self.profile == 'single_shot':
+                sensor.fix_mode(self.interval, 'duty')
+            else:
+                sensor.fix_mode(self.interval)
+
+    def next_slot(self, period, now=None):
+        """When a sensor sampled every period seconds is next due, on a grid shared by all of them"""
+        if now is None:
+            now = time.monotonic()
+        if self.profile == 'performance':
+            return now
+        return now - now % period + period
+
+    def wake_at(self, name, when):
+        self.wakes[name] = when
+
+    def request_seen(self):
+        self.last_request = time.monotonic()
+
+    def sleep(self):
+        """Light sleep until the next sensor is due, if that's allowed and worth it
+
+        Blocks everything, the web server included. Returns the seconds slept.
+        """
+        if not self.light_sleep or not self.wakes:
+            return 0
+        now = time.monotonic()
+        if now - self.last_request < AWAKE_AFTER_REQUEST:
+            return 0
+        wake = min(self.wakes.values())
+        if wake - now < MIN_SLEEP:
+            return 0
+        if ON_DEVICE:
+            alarm.light_sleep_until_alarms(alarm.time.TimeAlarm(monotonic_time=wake))
+        else:
+            time.sleep(wake - now)
+        slept = time.monotonic() - now
+        self.slept += slept
+        self.sleeps += 1
+        return slept
+
+    def estimate(self):
+        """Rough average supply current in mA: the sensors in their current modes plus the board"""
+        elapsed = time.monotonic() - self.started
+        asleep = self.slept / elapsed if elapsed > 0 else 0
+        return (sum(sensor.current() for sensor in self.sensors) +
+                AWAKE_MA * (1 - asleep) + LIGHT_SLEEP_MA * asleep)
@@ -0,0 +1,56 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""One encoded copy of the latest readings, shared by every client
+
+When the readings change, Publisher.publish() encodes all of them, once.
+That covers the /data JSON, the /data.bin packing, the full-state event a
+new /stream client starts with, and the event carrying just the changes.
+Each is an immutable bytes object. Every /data response (a plain Response
+sends a memoryview body as it is) and every stream event sends a memoryview
+of it, so an open dashboard costs a send() per update, with no encoding or
+copying of its own.
+"""
+
+import json
+from adafruit_httpserver import SSEResponse
+
+
+class Snapshot:
+    """Everything sent to clients for one version of the readings; never changed once built"""
+
+    def __init__(self, version, json_body, binary_body):
+        self.version = version
+        self.json = memoryview(json_body)
+        self.binary = memoryview(binary_body)
+        self.event = memoryview(b"data: " + json_body + b"\n\n")
+
+
+class Publisher:
+    """Builds a Snapshot per version of the readings, and the change events for /stream"""
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.snapshot = Snapshot(-1, b"{}", b"")
+        self.builds = 0
+
+    def publish(self, values, seqs, times, version, timestamp):
+        """Encode the readings as of version, unless that's already been done; returns the Snapshot"""
+        if self.snapshot.version != version:
+            binary = bytes(self.encoder.encode(values, seqs, times, version, timestamp))
+            self.snapshot = Snapshot(version, json.dumps(values).encode(), binary)
+            self.builds += 1
+        return self.snapshot
+
+    @staticmethod
+    def event(changes):
+        """A /stream event carrying changes, encoded once for all the clients"""
+        return memoryview(b"data: " + json.dumps(changes).encode() + b"\n\n")
+
+
+class EventStream(SSEResponse):
+    """A /stream connection that's sent events already encoded by the Publisher"""
+
+    def send_encoded(self, event):
+        self._send_bytes(self._request.connection, event)
@@ -0,0 +1,530 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""One adapter per sensor driver, so the main loop can treat them all alike
+
+Each adapter is built around a driver module - the real Adafruit library,
+or the simulated module that stands in for all of them on a host.
+
+Bringing a sensor up can take seconds of waiting (the ENS160 wants about
+11), so it's a state machine the main loop drives with step() instead of
+a run of time.sleep() calls: probe, reset, warm-up, then ready. A sensor
+that doesn't answer is marked failed and probed again later.
+
+Each sensor also has a list of sampling modes, from its fastest to its
+slowest and most frugal. adapt() watches one reading against its rolling
+mean: a sudden departure (a CO2 cartridge, an alcohol swab) switches to the
+fastest mode at once, and a reading that stays calm steps down one mode at
+a time.
+
+At boot, detect() scans the I2C bus for each adapter's addresses and
+load_drivers() imports only the driver libraries for the sensors it found,
+so a board with one or two sensors doesn't spend RAM on the rest.
+
+A power profile (see power.py) can instead pin each sensor to one mode
+with fix_mode(), and current() gives a rough idea of what that mode costs.
+
+Configuration that follows the environment, like the ENS160's temperature
+and humidity compensation, goes through Sensor.write(), which skips writes
+that wouldn't change anything that matters and rate-limits the rest, so
+the bus is left for reads.
+"""
+
+import gc
+import time
+from config import mem_free
+from logger import log
+
+# Bring-up states
+PROBE = "probe"
+RESET = "reset"
+WARM_UP = "warm-up"
+READY = "ready"
+FAILED = "failed"
+
+# Ambient pressures in hPa the SCD4x accepts
+AMBIENT_PRESSURE_RANGE = (700, 1200)
+
+# SCD41 single shot measurement command, and how long it takes
+MEASURE_SINGLE_SHOT = 0x219D
+SINGLE_SHOT_SECONDS = 5
+
+# Seconds between ENS160 data_validity checks once it's in normal operation
+ENS160_STATUS_SECONDS = 60
+
+# The ENS160's AQI-UBA index is the low three bits of its register
+ENS160_AQI_MASK = 0x07
+
+
+class Sensor:
+    """Common interface: step() until ready, then data_ready() and read(); plus name, fields and period
+
+    read() returns one value per entry in fields, in the same order.
+    """
+
+    name = None
+    fields = ()
+    # I2C addresses the sensor can be strapped to, the driver's default first
+    addresses = ()
+    # Seconds between samples
+    period = 1
+    # Seconds between attempts to bring up a sensor that failed
+    retry = 30
+    # Seconds a measurement takes when the sensor only measures on demand,
+    # so start() has to be called that long before the sample is wanted
+    lead = 0
+    # Sampling modes, fastest first, as (seconds between samples, driver mode
+    # or None); set_mode() applies one. Sensors start in default_mode.
+    modes = ((1, None),)
+    default_mode = 0
+    # Index into fields of the reading adapt() watches, and how far (in its
+    # units) it has to stray from its rolling mean to count as a transient
+    watch = 0
+    change = None
+    # Seconds the reading has to stay calm before stepping down a mode
+    calm_time = 60
+    # Time constant of the rolling mean, in seconds
+    mean_time = 30
+    # Rough typical supply current at 3.3 V from the datasheet: mA in each
+    # driver mode that draws steadily, mA otherwise, and mC per read on top
+    mode_ma = {}
+    idle_ma = 0
+    read_mc = 0
+
+    # Driver properties written through write(): name -> (deadband, minimum
+    # seconds between writes). A new value within the deadband of the last
+    # one written is dropped.
+    coalesce = {}
+
+    def __init__(self, module, i2c, address=None):
+        self.module = module
+        self.i2c = i2c
+        self.address = address if address is not None else self.addresses[0]
+        self.device = None
+        self.state = PROBE
+        self._bring_up = None
+        # name -> (value, time.monotonic()) of the last write of each coalesced property
+        self._written = {}
+        self.writes = 0
+        self.writes_skipped = 0
+        self.mode = None
+        self.mean = None
+        self._last_sample = 0
+        self._calm_since = 0
+        # data_ready() is sure to be False until time.monotonic() reaches this
+        self.ready_at = 0
+
+    def write(self, name, value, force=False):
+        """Set a driver property unless it's within its deadband of what's there, or was just written
+
+        Returns True if the write went out to the sensor.
+        """
+        now = time.monotonic()
+        last = self._written.get(name)
+        if last is not None and not force:
+            deadband, interval = self.coalesce.get(name, (0, 0))
+            if abs(value - last[0]) <= deadband or now - last[1] < interval:
+                self.writes_skipped += 1
+                return False
+        setattr(self.device, name, value)
+        self._written[name] = (value, now)
+        self.writes += 1
+        return True
+
+    def bring_up(self):
+        """Create and configure the driver; raises if the sensor isn't there
+
+        Adapters that have to wait make this a generator yielding (state,
+        seconds) at each wait. Returning means the sensor is ready.
+        """
+        raise NotImplementedError
+
+    def step(self):
+        """Advance bring-up by one state; returns the seconds to wait before the next step"""
+        try:
+            if self._bring_up is None:
+                self.state = PROBE
+                self._bring_up = self.bring_up()
+            if self._bring_up is not None:
+                try:
+                    self.state, delay = next(self._bring_up)
+                    return delay
+                except StopIteration:
+                    pass
+            if self.mode != self.default_mode:
+                self.set_mode(self.default_mode)
+        except Exception as e:
+            log.error("Error bringing up %s: %s", self.name, str(e))
+            self.state = FAILED
+            self._bring_up = None
+            return self.retry
+        self.state = READY
+        self._bring_up = None
+        return 0
+
+    def set_mode(self, index):
+        """Switch to modes[index], applying its driver mode if it has one"""
+        period, driver_mode = self.modes[index]
+        if driver_mode is not None:
+            self.apply_mode(driver_mode)
+        self.mode = index
+        self.period = period
+
+    def apply_mode(self, driver_mode):
+        raise NotImplementedError
+
+    def fix_mode(self, period, driver_mode=None):
+        """Sample in this one mode from now on, without adapting; call before bring-up"""
+        self.modes = ((period, driver_mode),)
+        self.default_mode = 0
+
+    def current(self):
+        """Rough average supply current in mA in the current mode"""
+        if self.mode is None:
+            return self.idle_ma
+        period, driver_mode = self.modes[self.mode]
+        if driver_mode in self.mode_ma:
+            return self.mode_ma[driver_mode]
+        return self.idle_ma + self.read_mc / period
+
+    def adapt(self, values, now=None):
+        """Pick the sampling mode from how far the watched reading strays from its rolling mean
+
+        Call with every new sample; returns True if the mode changed.
+        """
+        value = values[self.watch]
+        if self.change is None or len(self.modes) < 2 or value is None:
+            return False
+        if now is None:
+            now = time.monotonic()
+        if self.mean is None:
+            self.mean = value
+            self._calm_since = now
+        # Compare with the mean before this sample joins it
+        deviation = abs(value - self.mean)
+        self.mean += (value - self.mean) * min(1, (now - self._last_sample) / self.mean_time)
+        self._last_sample = now
+
+        target = self.mode
+        if deviation > self.change:
+            target = 0
+            self._calm_since = now
+        elif deviation > self.change / 4:
+            self._calm_since = now
+        elif now - self._calm_since >= self.calm_time:
+            target = min(self.mode + 1, len(self.modes) - 1)
+            self._calm_since = now
+        if target == self.mode:
+            return False
+        self.set_mode(target)
+        return True
+
+    def start(self):
+        """Begin an on-demand measurement; only needed when lead isn't 0"""
+
+    def data_ready(self):
+        """Sensors without a data-ready flag can always be read"""
+        return True
+
+    def read(self):
+        raise NotImplementedError
+
+
+class SCD4xSensor(Sensor):
+    name = "SCD40"
+    fields = ('co2', 'temperature', 'humidity')
+    addresses = (0x62,)
+    # Periodic measurement mode produces a sample every 5 seconds
+    period = 5
+    # Metres above sea level to compensate for, or None to leave the sensor's setting alone
+    altitude = None
+    # Ambient pressure in hPa overrides altitude, and can change while measuring
+    coalesce = {'ambient_pressure': (1, 60)}
+    # Periodic measurement every 5 s, or low power periodic every 30 s; a
+    # power profile can also pick single shot measurements (SCD41 only)
+    modes = ((5, 'periodic'), (30, 'low power'))
+    change = 50
+    mode_ma = {'periodic': 15, 'low power': 3.2}
+    idle_ma = 0.2
+    read_mc = 90
+    single_shot = False
+
+    def bring_up(self):
+        scd4x = self.device = self.module.SCD4X(self.i2c, address=self.address)
+        if self.altitude is not None and scd4x.altitude != self.altitude:
+            # Only settable while idle, so before measurements start
+            self.write('altitude', self.altitude, force=True)
+        log.info("Serial Number: %s", scd4x.serial_number)
+        log.info("Temperature Offset: %s°C", scd4x.temperature_offset)
+        log.info("Altitude: %s m", scd4x.altitude)
+        log.info("Automatic Self-Calibration: %s", scd4x.self_calibration_enabled)
+
+        self.set_mode(self.default_mode)
+        if not self.single_shot:
+            log.info("Started periodic SCD4x measurements...")
+            # The first measurement takes one period
+            yield WARM_UP, self.period
+
+    @property
+    def lead(self):
+        return SINGLE_SHOT_SECONDS if self.single_shot else 0
+
+    def start(self):
+        if self.single_shot and not self.ready_at:
+            # The driver's measure_single_shot() sleeps through the 5
+            # seconds, so send the command and come back for the result
+            self.device._send_command(MEASURE_SINGLE_SHOT)  # pylint:disable=protected-access
+            self.ready_at = time.monotonic() + SINGLE_SHOT_SECONDS
+
+    def data_ready(self):
+        if self.single_shot:
+            if not self.ready_at:
+                self.start()
+                return False
+            if time.monotonic() < self.ready_at:
+                return False
+        return self.device.data_ready
+
+    def read(self):
+        scd4x = self.device
+        self.ready_at = 0
+        return scd4x.CO2, scd4x.temperature, scd4x.relative_humidity
+
+    def apply_mode(self, driver_mode):
+        # The driver waits the 500 ms the sensor needs after stopping
+        scd4x = self.device
+        if self.mode is not None:
+            scd4x.stop_periodic_measurement()
+        self.single_shot = driver_mode == 'single shot'
+        if driver_mode == 'low power':
+            scd4x.start_low_periodic_measurement()
+        elif driver_mode == 'periodic':
+            scd4x.start_periodic_measurement()
+
+    def compensate(self, pressure):
+        """Feed the ambient pressure in hPa into the CO2 readings
+
+        The driver packs it into a 16-bit command word, so it has to be a
+        whole number within the sensor's range.
+        """
+        low, high = AMBIENT_PRESSURE_RANGE
+        self.write('ambient_pressure', max(low, min(high, int(round(pressure)))))
+
+
+class CCS811Sensor(Sensor):
+    name = "CCS811"
+    fields = ('eco2', 'tvoc')
+    addresses = (0x5A, 0x5B)
+    # Drive modes 1, 2 and 3; the 250 ms mode only produces raw data
+    modes = ((1, 1), (10, 2), (60, 3))
+    change = 50
+    mode_ma = {1: 14, 2: 2, 3: 0.4}
+
+    def bring_up(self):
+        self.device = self.module.CCS811(self.i2c, address=self.address)
+
+    def apply_mode(self, driver_mode):
+        self.device.drive_mode = driver_mode
+
+    def data_ready(self):
+        return self.device.data_ready
+
+    def read(self):
+        return self.device.eco2, self.device.tvoc
+
+
+class ENS160Sensor(Sensor):
+    name = "ENS160"
+    fields = ('ens_aqi', 'ens_tvoc', 'ens_eco2')
+    addresses = (0x53, 0x52)
+    # Last data_validity seen, and when
+    status = None
+    status_at = 0
+    # The gas sensor always measures once a second in standard mode, and
+    # idle would mean warming its heaters up again, so slow down by reading
+    # less. A power profile can pick 'duty', which idles it between reads and
+    # wakes it wake_time seconds ahead.
+    modes = ((1, None), (10, None))
+    watch = 1
+    change = 50
+    mode_ma = {None: 10}
+    idle_ma = 0.5
+    wake_time = 30
+    read_mc = 10 * wake_time
+    duty = False
+    # The compensation only has to follow the room, not every wobble of the AHT21
+    coalesce = {
+        'temperature_compensation': (0.5, 30),
+        'humidity_compensation': (2, 30),
+    }
+
+    def bring_up(self):
+        ens160 = self.module
+        ens = self.device = ens160.ENS160(self.i2c, address=self.address)
+        yield PROBE, 5
+
+        ens.clear_command()
+        ens.reset()
+        yield RESET, 5
+
+        # A reset clears the compensation, so forget what was written before
+        self.write('temperature_compensation', 25, force=True)
+        self.write('humidity_compensation', 50, force=True)
+
+        log.info("ENS160 Firmware Vers: %s", ens.firmware_version)
+        log.info("ENS160 part id: %s", ens.part_id)
+
+        ens.mode = ens160.MODE_IDLE
+        yield WARM_UP, 1
+        ens.mode = ens160.MODE_STANDARD
+
+    def apply_mode(self, driver_mode):
+        self.duty = driver_mode == 'duty'
+        if self.duty:
+            self.device.mode = self.module.MODE_IDLE
+
+    @property
+    def lead(self):
+        return self.wake_time if self.duty else 0
+
+    def start(self):
+        if self.duty and not self.ready_at:
+            self.device.mode = self.module.MODE_STANDARD
+            self.ready_at = time.monotonic() + self.wake_time
+
+    def data_ready(self):
+        if self.duty:
+            if not self.ready_at:
+                self.start()
+                return False
+            if time.monotonic() < self.ready_at:
+                return False
+        return self.device.new_data_available
+
+    def read(self):
+        ens160 = self.module
+        ens = self.device
+        # The validity isn't in the driver's buffer, so it costs a transfer of
+        # its own; only check it often while it can still change
+        now = time.monotonic()
+        if self.status != ens160.NORMAL_OP or now - self.status_at >= ENS160_STATUS_SECONDS:
+            self.status_at = now
+            self.check_status()
+
+        # new_data_available already read all three in one transfer
+        data = ens.read_all_sensors()
+        aqi, tvoc, eco2 = data["AQI"] & ENS160_AQI_MASK, data["TVOC"], data["eCO2"]
+        if self.duty:
+            ens.mode = ens160.MODE_IDLE
+            self.ready_at = 0
+        log.debug("ENS AQI %s TVOC %s eCO2 %s", aqi, tvoc, eco2)
+        return aqi, tvoc, eco2
+
+    def check_status(self):
+        """Read data_validity, and log it when it changes, e.g. at the end of warm-up"""
+        ens160 = self.module
+        status = self.device.data_validity
+        if status == self.status:
+            return
+        self.status = status
+        if status == ens160.NORMAL_OP:
+            log.info("ENS160 normal operation")
+        if status == ens160.WARM_UP:
+            log.info("ENS160 warming up")
+        if status == ens160.START_UP:
+            log.info("ENS160 initial startup")
+        if status == ens160.INVALID_OUT:
+            log.warning("ENS160 invalid output")
+
+    def compensate(self, temperature, humidity):
+        """Feed ambient conditions from another sensor into the gas readings"""
+        self.write('temperature_compensation', temperature)
+        self.write('humidity_compensation', humidity)
+
+
+class AHT21Sensor(Sensor):
+    name = "AHT21"
+    fields = ('aht21_temperature', 'aht21_humidity')
+    addresses = (0x38,)
+    # Every read triggers a measurement, so reading less is the low power mode
+    modes = ((1, None), (10, None))
+    # Breathing on it shows up in the humidity first
+    watch = 1
+    change = 2
+    # Asleep between reads; a measurement takes 80 ms at about 1 mA
+    idle_ma = 0.001
+    read_mc = 0.08
+
+    def bring_up(self):
+        self.device = self.module.AHTx0(self.i2c, address=self.address)
+
+    def read(self):
+        return self.device.temperature, self.device.relative_humidity
+
+
+# Every supported sensor, keyed by the name of the driver library it wraps
+REGISTRY = {
+    'adafruit_scd4x': SCD4xSensor,
+    'adafruit_ccs811': CCS811Sensor,
+    'adafruit_ens160': ENS160Sensor,
+    'adafruit_ahtx0': AHT21Sensor,
+}
+
+
+def detect(i2c):
+    """Scan the bus; returns driver library name -> address for each registered sensor that answered"""
+    while not i2c.try_lock():
+        pass
+    try:
+        found = i2c.scan()
+    finally:
+        i2c.unlock()
+    log.info("I2C devices: %s", " ".join("0x%02x" % address for address in found) or "none")
+    detected = {}
+    for driver, adapter in REGISTRY.items():
+        for address in adapter.addresses:
+            if address in found:
+                detected[driver] = address
+                break
+    return detected
+
+
+def load_drivers(drivers, importer=__import__):
+    """Import each named driver library, logging the time and heap it cost; returns name -> module
+
+    A library that won't import is logged and left out, so its sensor is
+    skipped rather than stopping the boot.
+    """
+    modules = {}
+    for driver in drivers:
+        gc.collect()
+        free = mem_free()
+        started = time.monotonic_ns()
+        try:
+            modules[driver] = importer(driver)
+        except ImportError as e:
+            log.error("Can't import %s: %s", driver, str(e))
+            continue
+        elapsed = (time.monotonic_ns() - started) / 1000000
+        if free is None:
+            log.info("Imported %s in %.1f ms", driver, elapsed)
+        else:
+            gc.collect()
+            log.info("Imported %s in %.1f ms, %d bytes", driver, elapsed, free - mem_free())
+    return modules
+
+
+def start_sensors(i2c, modules, addresses=None):
+    """An adapter for every registered sensor whose driver module is given
+
+    modules maps driver library names to modules, and addresses, if given,
+    to the I2C address each sensor was found at. Nothing talks to the bus
+    yet; each sensor is brought up by calling its step().
+    """
+    sensors = {}
+    for driver, adapter in REGISTRY.items():
+        module = modules.get(driver)
+        if module is not None:
+            sensors[driver] = adapter(module, i2c, (addresses or {}).get(driver))
+    return sensors
@@ -0,0 +1,410 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Simulated stand-ins for the sensor drivers, for running without hardware
+
+This module mimics the parts of adafruit_scd4x, adafruit_ccs811,
+adafruit_ens160 and adafruit_ahtx0 that the sensor adapters use, so it can
+be passed in place of any of them. All the simulated sensors measure the
+same room, whose CO2, VOC, temperature and humidity follow slow daily-ish
+cycles plus the occasional CO2 cartridge or alcohol swab.
+"""
+
+import math
+import random
+import time
+
+# ENS160 constants
+MODE_SLEEP = 0x00
+MODE_IDLE = 0x01
+MODE_STANDARD = 0x02
+MODE_RESET = 0xF0
+NORMAL_OP = 0x00
+WARM_UP = 0x01
+START_UP = 0x02
+INVALID_OUT = 0x03
+
+# CCS811 constants
+DRIVE_MODE_IDLE = 0x00
+DRIVE_MODE_1SEC = 0x01
+DRIVE_MODE_10SEC = 0x02
+DRIVE_MODE_60SEC = 0x03
+DRIVE_MODE_250MS = 0x04
+# Seconds between samples in each drive mode
+DRIVE_MODE_INTERVALS = {DRIVE_MODE_IDLE: 3600, DRIVE_MODE_1SEC: 1, DRIVE_MODE_10SEC: 10,
+                        DRIVE_MODE_60SEC: 60, DRIVE_MODE_250MS: 0.25}
+
+# Chance per second of someone waving a CO2 cartridge or an alcohol swab at the sensors
+CO2_EVENT_RATE = 1 / 600
+VOC_EVENT_RATE = 1 / 900
+
+
+class I2C:
+    """Fake bus that charges every transfer some latency and can fail at random"""
+
+    def __init__(self, latency=0.001, error_rate=0.0, addresses=(0x62, 0x5A, 0x53, 0x38)):
+        self.latency = latency
+        self.error_rate = error_rate
+        # What scan() finds: by default every sensor at its driver's default address
+        self.addresses = addresses
+        self.transfers = 0
+        self.errors = 0
+
+    def try_lock(self):
+        return True
+
+    def unlock(self):
+        pass
+
+    def scan(self):
+        self.transfer()
+        return list(self.addresses)
+
+    def transfer(self):
+        self.transfers += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            raise OSError(5, "Simulated I2C error")
+
+
+class Room:
+    """The air all the simulated sensors share"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.last = self.started
+        # Transient excess CO2 (ppm) and VOC (ppb), decaying toward zero
+        self.co2_spike = 0.0
+        self.voc_spike = 0.0
+
+    def step(self):
+        now = time.monotonic()
+        dt = now - self.last
+        if dt <= 0:
+            return
+        self.last = now
+        self.co2_spike *= math.exp(-dt / 90)
+        self.voc_spike *= math.exp(-dt / 120)
+        if random.random() < CO2_EVENT_RATE * dt:
+            self.co2_spike += random.uniform(2000, 8000)
+        if random.random() < VOC_EVENT_RATE * dt:
+            self.voc_spike += random.uniform(1000, 8000)
+
+    def occupancy(self):
+        """0 to 1, a slow cycle of people coming and going"""
+        t = time.monotonic() - self.started
+        return (1 - math.cos(2 * math.pi * t / 3600)) / 2
+
+    def co2(self):
+        self.step()
+        return 420 + 600 * self.occupancy() + self.co2_spike + random.uniform(-5, 5)
+
+    def voc(self):
+        self.step()
+        return 30 + 150 * self.occupancy() + self.voc_spike + random.uniform(-3, 3)
+
+    def temperature(self):
+        t = time.monotonic() - self.started
+        return 21.5 + 1.5 * math.sin(2 * math.pi * t / 7200) + random.uniform(-0.05, 0.05)
+
+    def humidity(self):
+        t = time.monotonic() - self.started
+        return 45 + 6 * math.sin(2 * math.pi * t / 5400 + 1) + random.uniform(-0.2, 0.2)
+
+
+room = Room()
+
+
+# How each simulated part turns the room's VOCs into its readings
+def ccs811_tvoc(voc):
+    return max(0, int(voc * 0.8))
+
+
+def ccs811_eco2(voc):
+    # eCO2 is a guess from VOCs, which is the whole point of the demo
+    return max(400, int(400 + voc * 2.5))
+
+
+def ens160_aqi(voc):
+    return 1 + min(4, int(voc // 300))
+
+
+def ens160_eco2(voc):
+    return max(400, int(400 + voc * 1.8))
+
+
+def reading(field):
+    """What the simulated sensors would give for one of the demo's fields right now, or None"""
+    if field == 'co2':
+        return int(room.co2())
+    if field in ('temperature', 'aht21_temperature'):
+        return room.temperature()
+    if field in ('humidity', 'aht21_humidity'):
+        return room.humidity()
+    if field == 'eco2':
+        return ccs811_eco2(room.voc())
+    if field == 'tvoc':
+        return ccs811_tvoc(room.voc())
+    if field == 'ens_aqi':
+        return ens160_aqi(room.voc())
+    if field == 'ens_tvoc':
+        return max(0, int(room.voc()))
+    if field == 'ens_eco2':
+        return ens160_eco2(room.voc())
+    return None
+
+
+class _Device:
+    """Common base: every register access goes through the bus"""
+
+    # Seconds between new samples
+    interval = 1
+
+    def __init__(self, i2c_bus, address=None):
+        self.i2c = i2c_bus
+        self.i2c.transfer()
+        self.address = address
+        self._next_sample = time.monotonic() + self.interval
+
+    def _ready(self):
+        return time.monotonic() >= self._next_sample
+
+    def _consume(self):
+        now = time.monotonic()
+        # Stay on the sensor's own cadence rather than the reader's
+        while self._next_sample <= now:
+            self._next_sample += self.interval
+
+
+class SCD4X(_Device):
+    interval = 5
+
+    def __init__(self, i2c_bus, address=0x62):
+        super().__init__(i2c_bus, address)
+        self.serial_number = (0x5E, 0x1A, 0x7B, 0x07, 0x3B, 0x9F)
+        self.temperature_offset = 4.0
+        self.self_calibration_enabled = True
+        self._altitude = 0
+        self._ambient_pressure = 1013
+        self._co2 = None
+        self._temperature = None
+        self._relative_humidity = None
+
+    @property
+    def altitude(self):
+        self.i2c.transfer()
+        return self._altitude
+
+    @altitude.setter
+    def altitude(self, value):
+        self.i2c.transfer()
+        self._altitude = value
+
+    @property
+    def ambient_pressure(self):
+        self.i2c.transfer()
+        return self._ambient_pressure
+
+    @ambient_pressure.setter
+    def ambient_pressure(self, value):
+        # Like the real driver, which shifts the value into a command word
+        if not isinstance(value, int):
+            raise TypeError("ambient_pressure must be an int")
+        if value > 1200 or value < 700:
+            raise AttributeError("ambient_pressure must be from 700-1200 hPa")
+        self.i2c.transfer()
+        self._ambient_pressure = value
+
+    def start_periodic_measurement(self):
+        self.i2c.transfer()
+        self.interval = 5
+        self._next_sample = time.monotonic() + self.interval
+
+    def start_low_periodic_measurement(self):
+        self.i2c.transfer()
+        self.interval = 30
+        self._next_sample = time.monotonic() + self.interval
+
+    def stop_periodic_measurement(self):
+        self.i2c.transfer()
+        time.sleep(0.5)
+        self._next_sample = self.interval = float('inf')
+
+    def _send_command(self, cmd, cmd_delay=0):
+        self.i2c.transfer()
+        if cmd == 0x219D:
+            # Single shot: one sample, 5 seconds from now
+            self._next_sample = time.monotonic() + 5
+        time.sleep(cmd_delay)
+
+    @property
+    def data_ready(self):
+        self.i2c.transfer()
+        return self._ready()
+
+    def _read_data(self):
+        self.i2c.transfer()
+        self._consume()
+        self._co2 = int(room.co2())
+        self._temperature = room.temperature()
+        self._relative_humidity = room.humidity()
+
+    @property
+    def CO2(self):  # pylint:disable=invalid-name
+        if self.data_ready:
+            self._read_data()
+        return self._co2
+
+    @property
+    def temperature(self):
+        if self.data_ready:
+            self._read_data()
+        return self._temperature
+
+    @property
+    def relative_humidity(self):
+        if self.data_ready:
+            self._read_data()
+        return self._relative_humidity
+
+
+class CCS811(_Device):
+    def __init__(self, i2c_bus, address=0x5A):
+        super().__init__(i2c_bus, address)
+        self._drive_mode = DRIVE_MODE_1SEC
+        self._eco2 = None
+        self._tvoc = None
+
+    @property
+    def drive_mode(self):
+        self.i2c.transfer()
+        return self._drive_mode
+
+    @drive_mode.setter
+    def drive_mode(self, value):
+        self.i2c.transfer()
+        self._drive_mode = value
+        self.interval = DRIVE_MODE_INTERVALS[value]
+        self._next_sample = time.monotonic() + self.interval
+
+    @property
+    def data_ready(self):
+        self.i2c.transfer()
+        return self._ready()
+
+    def _update_data(self):
+        if self._ready():
+            self.i2c.transfer()
+            self._consume()
+            voc = room.voc()
+            self._tvoc = ccs811_tvoc(voc)
+            self._eco2 = ccs811_eco2(voc)
+
+    @property
+    def eco2(self):
+        self._update_data()
+        return self._eco2
+
+    @property
+    def tvoc(self):
+        self._update_data()
+        return self._tvoc
+
+
+class ENS160(_Device):
+    def __init__(self, i2c_bus, address=0x53):
+        super().__init__(i2c_bus, address)
+        self.part_id = 0x160
+        self.firmware_version = "5.4.6"
+        self.mode = MODE_STANDARD
+        self._temperature_compensation = 25
+        self._humidity_compensation = 50
+        self._booted = time.monotonic()
+        self._bufferdict = {"AQI": None, "TVOC": None, "eCO2": None}
+
+    @property
+    def temperature_compensation(self):
+        self.i2c.transfer()
+        return self._temperature_compensation
+
+    @temperature_compensation.setter
+    def temperature_compensation(self, value):
+        self.i2c.transfer()
+        self._temperature_compensation = value
+
+    @property
+    def humidity_compensation(self):
+        self.i2c.transfer()
+        return self._humidity_compensation
+
+    @humidity_compensation.setter
+    def humidity_compensation(self, value):
+        self.i2c.transfer()
+        self._humidity_compensation = value
+
+    def clear_command(self):
+        self.i2c.transfer()
+
+    def reset(self):
+        self.i2c.transfer()
+        self._booted = time.monotonic()
+
+    @property
+    def data_validity(self):
+        self.i2c.transfer()
+        # The real part warms up for about 3 minutes after power-on
+        if time.monotonic() - self._booted < 180:
+            return WARM_UP
+        return NORMAL_OP
+
+    @property
+    def new_data_available(self):
+        self.i2c.transfer()
+        if self.mode != MODE_STANDARD or not self._ready():
+            return False
+        self._consume()
+        # Like the driver, read the three results in one go and keep them
+        self.i2c.transfer()
+        voc = room.voc()
+        self._bufferdict["AQI"] = ens160_aqi(voc)
+        self._bufferdict["TVOC"] = max(0, int(voc))
+        self._bufferdict["eCO2"] = ens160_eco2(voc)
+        return True
+
+    def read_all_sensors(self):
+        return self._bufferdict
+
+    @property
+    def AQI(self):  # pylint:disable=invalid-name
+        self.i2c.transfer()
+        return ens160_aqi(room.voc())
+
+    @property
+    def TVOC(self):  # pylint:disable=invalid-name
+        self.i2c.transfer()
+        return max(0, int(room.voc()))
+
+    @property
+    def eCO2(self):  # pylint:disable=invalid-name
+        self.i2c.transfer()
+        return ens160_eco2(room.voc())
+
+
+class AHTx0(_Device):
+    interval = 0
+
+    def __init__(self, i2c_bus, address=0x38):
+        super().__init__(i2c_bus, address)
+
+    @property
+    def temperature(self):
+        self.i2c.transfer()
+        return room.temperature()
+
+    @property
+    def relative_humidity(self):
+        self.i2c.transfer()
+        return room.humidity()
@@ -0,0 +1,105 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Serve files from flash, preferring pre-gzipped copies, with ETags and caching"""
+
+import os
+import binascii
+from adafruit_httpserver import Response, Status
+
+NOT_MODIFIED_304 = Status(304, "Not Modified")
+
+
+def file_size(path):
+    """Size of the file at path, or None if it doesn't exist"""
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return None
+
+
+class Asset:
+    """One file on flash plus its optional .gz variant built by tools/build_assets.py"""
+
+    def __init__(self, path, content_type, cache_control, buffer):
+        self.path = path
+        self.size = file_size(path)
+        self.content_type = content_type
+        self.cache_control = cache_control
+
+        self.gzip_path = path + ".gz"
+        self.gzip_size = file_size(self.gzip_path)
+
+        # Strong ETags: a CRC of the exact bytes sent, computed once at boot
+        self.etag = '"%08x"' % self.checksum(path, buffer)
+        if self.gzip_size is not None:
+            self.gzip_etag = '"%08x-gz"' % self.checksum(self.gzip_path, buffer)
+
+    @staticmethod
+    def checksum(path, buffer):
+        crc = 0
+        with open(path, "rb") as f:
+            while True:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                crc = binascii.crc32(memoryview(buffer)[:count], crc)
+        return crc & 0xFFFFFFFF
+
+
+class AssetResponse(Response):
+    """Sends a file with a known length through a shared, preallocated buffer"""
+
+    def __init__(self, request, path, length, buffer, *, headers=None, content_type=None):
+        super().__init__(request, headers=headers, content_type=content_type)
+        self._path = path
+        self._length = length
+        self._buffer = buffer
+
+    def _send(self):
+        self._send_headers(self._length, self._content_type)
+        view = memoryview(self._buffer)
+        with open(self._path, "rb") as f:
+            while True:
+                count = f.readinto(self._buffer)
+                if not count:
+                    break
+                self._send_bytes(self._request.connection, view[:count])
+        self._close_connection()
+
+
+class StaticFiles:
+    """Registry of assets under one directory, sharing a single read buffer"""
+
+    def __init__(self, root, chunk_size=2048):
+        self.root = root
+        # Requests are handled one at a time, so one buffer serves them all
+        self.buffer = bytearray(chunk_size)
+
+    def asset(self, filename, content_type, cache_control="no-cache"):
+        """Register a file, or return None if it isn't on flash"""
+        path = self.root + filename
+        if file_size(path) is None:
+            return None
+        return Asset(path, content_type, cache_control, self.buffer)
+
+    def serve(self, request, asset):
+        use_gzip = (asset.gzip_size is not None
+                    and "gzip" in request.headers.get("Accept-Encoding", ""))
+        etag = asset.gzip_etag if use_gzip else asset.etag
+        headers = {
+            "ETag": etag,
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+
+        if request.headers.get("If-None-Match") == etag:
+            return Response(request, status=NOT_MODIFIED_304, headers=headers)
+
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+            return AssetResponse(request, asset.gzip_path, asset.gzip_size, self.buffer,
+                                 headers=headers, content_type=asset.content_type)
+        return AssetResponse(request, asset.path, asset.size, self.buffer,
+                             headers=headers, content_type=asset.content_type)
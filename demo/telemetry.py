@@ -0,0 +1,279 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Push new samples to a collector over UDP or MQTT, in batches
+
+Samples are packed into a preallocated batch as they arrive. A batch is
+sealed when it's full or its oldest sample has waited max_age seconds,
+then it goes on a bounded queue. tick(), called from the server loop,
+sends what it can from the front of the queue without ever waiting on
+the network. While the collector can't be reached, batches stay queued
+and are retried with backoff. When the queue is full the oldest batch is
+dropped.
+
+Each batch is
+    u16 magic, u8 version, u8 entry count, u32 boot id, u32 batch number,
+    then per entry: u8 field index, u32 sample sequence number,
+    u32 time (seconds since boot), f32 value
+
+A UDP batch is one datagram. Over MQTT each batch is a QoS 0 PUBLISH to
+topic. That's enough MQTT to get the data to a broker without pulling in a
+client library. A missing batch number shows the collector a batch was
+lost; the sequence numbers show which samples /history?since= can fill in.
+"""
+
+import time
+import struct
+from errno import EAGAIN, EINPROGRESS
+from logger import log
+
+MAGIC = 0x5354
+VERSION = 1
+BATCH_HEADER = "<HBBII"
+HEADER_SIZE = struct.calcsize(BATCH_HEADER)
+ENTRY = "<BIIf"
+ENTRY_SIZE = struct.calcsize(ENTRY)
+
+# Keeps a UDP batch inside one Ethernet-sized datagram
+MAX_BATCH = (1472 - HEADER_SIZE) // ENTRY_SIZE
+
+# Retry delay after a failed send, doubling from the first to the second
+RETRY_SECONDS = (1, 60)
+
+# Most packets sent per tick(), so a backlog doesn't hold up the server
+SENDS_PER_TICK = 4
+
+# Seconds between MQTT PINGREQs when nothing else is being sent
+MQTT_KEEPALIVE = 60
+
+def would_block(e):
+    """True for an OSError that only means the socket isn't ready yet"""
+    return bool(e.args) and e.args[0] in (EAGAIN, EINPROGRESS)
+
+
+def decode(payload):
+    """Return (boot id, batch number, entries) for a batch; entries yields (field, seq, time, value)"""
+    magic, version, count, boot_id, number = struct.unpack_from(BATCH_HEADER, payload, 0)
+    if magic != MAGIC or version != VERSION or HEADER_SIZE + count * ENTRY_SIZE > len(payload):
+        raise ValueError("Not a telemetry batch")
+
+    def entries():
+        for index in range(count):
+            yield struct.unpack_from(ENTRY, payload, HEADER_SIZE + index * ENTRY_SIZE)
+
+    return boot_id, number, entries()
+
+
+def mqtt_string(text):
+    data = text.encode()
+    return struct.pack(">H", len(data)) + data
+
+
+def mqtt_packet(kind, body):
+    """An MQTT control packet: type byte, variable-length remaining length, body"""
+    header = bytearray([kind])
+    length = len(body)
+    while True:
+        byte = length & 0x7F
+        length >>= 7
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(header) + body
+
+
+class Telemetry:
+    """Batches samples and pushes them to address with protocol "udp" or "mqtt"
+
+    pool is the socketpool (the socket module on a host). address is an
+    (IP address, port) pair from pool.getaddrinfo(): a name lookup blocks,
+    so it's left to the caller to do once at startup.
+    """
+
+    def __init__(self, pool, address, boot_id, protocol="udp", topic="sensortech",
+                 batch=32, max_age=10, queue=16):
+        if protocol not in ("udp", "mqtt"):
+            raise ValueError("Unknown telemetry protocol %s" % protocol)
+        self.pool = pool
+        self.address = address
+        self.boot_id = boot_id
+        self.protocol = protocol
+        self.topic = topic
+        self.batch = max(1, min(batch, MAX_BATCH))
+        self.max_age = max_age
+        self.queue_size = queue
+
+        # The batch being filled, written in place so adding a sample never allocates
+        self.buffer = bytearray(HEADER_SIZE + self.batch * ENTRY_SIZE)
+        self.view = memoryview(self.buffer)
+        self.pending = 0
+        self.oldest_pending = 0
+        self.number = 0
+        self.queue = []
+
+        self.socket = None
+        # What's left to send of the packet being written, and whether it's the front batch
+        self.sending = None
+        self.front_in_flight = False
+        self.receive_buffer = bytearray(16)
+        self.last_sent = 0
+        self.retry_at = 0
+        self.retry_delay = RETRY_SECONDS[0]
+
+        self.batches_sent = 0
+        self.samples_sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self.connects = 0
+
+    def append(self, field, seq, timestamp, value):
+        """Add a sample to the batch, sealing it if it's full"""
+        if not self.pending:
+            self.oldest_pending = time.monotonic()
+        struct.pack_into(ENTRY, self.buffer, HEADER_SIZE + self.pending * ENTRY_SIZE,
+                         field, seq, timestamp, value)
+        self.pending += 1
+        if self.pending == self.batch:
+            self.seal()
+
+    def seal(self):
+        """Move the batch being filled onto the send queue"""
+        if not self.pending:
+            return
+        struct.pack_into(BATCH_HEADER, self.buffer, 0, MAGIC, VERSION, self.pending, self.boot_id, self.number)
+        self.number += 1
+        if len(self.queue) >= self.queue_size:
+            # A half-sent front batch has to finish, so the oldest one after it goes
+            oldest = 1 if self.front_in_flight else 0
+            self.dropped += 1
+            if oldest >= len(self.queue):
+                self.pending = 0
+                return
+            self.queue.pop(oldest)
+        self.queue.append(bytes(self.view[:HEADER_SIZE + self.pending * ENTRY_SIZE]))
+        self.pending = 0
+
+    def tick(self):
+        """Seal a batch that's old enough and send what the network will take right now"""
+        now = time.monotonic()
+        if self.pending and now - self.oldest_pending >= self.max_age:
+            self.seal()
+        if now < self.retry_at:
+            return
+        try:
+            if self.socket is None:
+                if not self.queue:
+                    return
+                self._connect()
+            if self.protocol == "mqtt":
+                self._receive()
+                if not self.queue and now - self.last_sent >= MQTT_KEEPALIVE / 2:
+                    self._send_packet(mqtt_packet(0xC0, b""))
+            for _ in range(SENDS_PER_TICK):
+                if not self.queue or not self._send_front():
+                    break
+        except OSError as e:
+            if not would_block(e):
+                self._failed(e)
+
+    def _connect(self):
+        if self.protocol == "udp":
+            self.socket = self.pool.socket(self.pool.AF_INET, self.pool.SOCK_DGRAM)
+            self.socket.setblocking(False)
+        else:
+            self.socket = self.pool.socket(self.pool.AF_INET, self.pool.SOCK_STREAM)
+            self.socket.setblocking(False)
+            self.connects += 1
+            # Queued before the connection finishes; it goes out once it does
+            self.sending = memoryview(mqtt_packet(0x10, mqtt_string("MQTT") + b"\x04\x02" +
+                                                  struct.pack(">H", MQTT_KEEPALIVE) +
+                                                  mqtt_string("sensortech-%06x" % self.boot_id)))
+            try:
+                self.socket.connect(self.address)
+            except OSError as e:
+                if not would_block(e):
+                    raise
+        log.info("Telemetry: sending to %s:%d over %s", self.address[0], self.address[1], self.protocol)
+
+    def _receive(self):
+        """Throw away what the broker sends (CONNACK, PINGRESP); notice if it hung up"""
+        while True:
+            try:
+                received = self.socket.recv_into(self.receive_buffer)
+            except OSError as e:
+                if would_block(e):
+                    return
+                raise
+            if not received:
+                raise OSError(0, "Broker closed the connection")
+
+    def _send_packet(self, packet):
+        """Send a whole packet that isn't part of the queue, if nothing else is half sent"""
+        if self.sending is None:
+            self.sending = memoryview(packet)
+            self._send_partial()
+
+    def _send_partial(self):
+        """Send what the socket will take of self.sending; True once it's all gone"""
+        while self.sending is not None:
+            sent = self.socket.send(self.sending)
+            if not sent:
+                return False
+            self.bytes_sent += sent
+            self.last_sent = time.monotonic()
+            self.sending = self.sending[sent:] if sent < len(self.sending) else None
+        return True
+
+    def _send_front(self):
+        """Send the batch at the front of the queue; True once its last byte has gone
+
+        The batch stays queued until then. If the connection drops partway,
+        close() forgets the partial packet and the batch goes again from the
+        start after reconnecting.
+        """
+        if self.sending is not None:
+            if not self._send_partial():
+                return False
+            if self.front_in_flight:
+                self._front_sent()
+                return True
+        payload = self.queue[0]
+        if self.protocol == "udp":
+            self.socket.sendto(payload, self.address)
+            self.bytes_sent += len(payload)
+            self.last_sent = time.monotonic()
+        else:
+            self.sending = memoryview(mqtt_packet(0x30, mqtt_string(self.topic) + payload))
+            self.front_in_flight = True
+            # Whatever the socket doesn't take now goes on the next tick
+            if not self._send_partial():
+                return False
+        self._front_sent()
+        return True
+
+    def _front_sent(self):
+        """Count the batch at the front of the queue as delivered and drop it"""
+        payload = self.queue.pop(0)
+        self.front_in_flight = False
+        self.batches_sent += 1
+        self.samples_sent += payload[3]
+        self.retry_delay = RETRY_SECONDS[0]
+
+    def _failed(self, e):
+        """Drop the connection and try again later; the queue keeps what hasn't gone"""
+        self.errors += 1
+        log.warning("Telemetry: %s, retrying in %d s", str(e), self.retry_delay)
+        self.close()
+        self.retry_at = time.monotonic() + self.retry_delay
+        self.retry_delay = min(RETRY_SECONDS[1], self.retry_delay * 2)
+
+    def close(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+        self.socket = None
+        self.sending = None
+        self.front_in_flight = False
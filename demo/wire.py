@@ -0,0 +1,188 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Compact binary encodings for /data.bin and /history.bin
+
+Everything is little-endian. The dashboard decodes it with DataView, and
+the layouts must stay in step with decodeData()/decodeHistory() in
+index.html; bump FORMAT_VERSION whenever they change.
+
+/data.bin:
+    u8 version, u8 field count, u16 presence bitmap (bit i = field i has a value),
+    u32 sequence number, u32 timestamp (seconds since boot),
+    then every field in FIELDS order: u16 for 'H' fields, f32 for 'f' fields,
+    then for every field: u8 sample count (low byte, so a change means a new
+    sample) and u16 age of its latest sample in seconds at the timestamp
+    (0xFFFF for never)
+
+/history.bin:
+    u8 version, u8 field index, u8 typecode (ASCII 'H' or 'f'),
+    u8 flags (bit 0: more raw samples follow the last one sent),
+    u32 now (seconds since boot), u32 interval (0 for raw samples), u32 count,
+    u32 sequence number of the last raw sample sent, or of the field's newest
+    reading for rollup buckets,
+    then for raw samples: u32 timestamp, value as above
+    or for rollup buckets: u32 start, f32 mean, min and max as above, u16 readings
+    (0 for an interval with no readings)
+"""
+
+import struct
+from history import groups
+
+FORMAT_VERSION = 4
+
+CONTENT_TYPE = "application/octet-stream"
+
+DATA_HEADER = "<BBHII"
+FRESHNESS = "<BH"
+HISTORY_HEADER = "<BBBBIIII"
+# /history.bin flags
+MORE = 0x01
+VALUE_FORMATS = {'H': "<H", 'f': "<f"}
+
+# Every reading in sensor_data with its array typecode, in the fixed order used
+# by the history buffers and the binary wire format
+FIELDS = (
+    ('co2', 'H'),
+    ('temperature', 'f'),
+    ('humidity', 'f'),
+    ('eco2', 'H'),
+    ('tvoc', 'H'),
+    ('aqi', 'H'),
+    ('ens_aqi', 'H'),
+    ('ens_tvoc', 'H'),
+    ('ens_eco2', 'H'),
+    ('aht21_temperature', 'f'),
+    ('aht21_humidity', 'f')
+)
+FIELD_INDEX = {field: index for index, (field, _) in enumerate(FIELDS)}
+
+
+def wants_binary(request):
+    """True if the client asked for the binary encoding in its Accept header"""
+    return CONTENT_TYPE in request.headers.get("Accept", "")
+
+
+class DataEncoder:
+    """Packs the latest readings into one reused buffer"""
+
+    def __init__(self, fields):
+        if len(fields) > 16:
+            raise ValueError("Presence bitmap holds at most 16 fields")
+        self.fields = fields
+        self.offsets = []
+        offset = struct.calcsize(DATA_HEADER)
+        for _, typecode in fields:
+            self.offsets.append(offset)
+            offset += struct.calcsize(VALUE_FORMATS[typecode])
+        self.freshness_offset = offset
+        self.buffer = bytearray(offset + len(fields) * struct.calcsize(FRESHNESS))
+
+    def encode(self, values, seqs, times, sequence, timestamp):
+        """Fill and return the shared buffer; it's overwritten by the next call
+
+        values, seqs and times map each field to its latest value, its sample
+        count and the time of its latest sample.
+        """
+        buffer = self.buffer
+        present = 0
+        freshness_size = struct.calcsize(FRESHNESS)
+        for index, (field, typecode) in enumerate(self.fields):
+            value = values[field]
+            if value is None:
+                value = 0
+            else:
+                present |= 1 << index
+            struct.pack_into(VALUE_FORMATS[typecode], buffer, self.offsets[index], value)
+            updated = times[field]
+            age = 0xFFFF if updated is None else min(timestamp - updated, 0xFFFF)
+            struct.pack_into(FRESHNESS, buffer, self.freshness_offset + index * freshness_size,
+                             seqs[field] & 0xFF, age)
+        struct.pack_into(DATA_HEADER, buffer, 0, FORMAT_VERSION, len(self.fields), present,
+                         sequence & 0xFFFFFFFF, timestamp)
+        return buffer
+
+
+def history_page(source, n, limit=None):
+    """For raw samples, (entries to send, sequence number of the last one, True if more follow)
+
+    Of the newest n samples in source, the oldest limit are sent. For a
+    Rollup it's every bucket asked for, and the newest reading's number.
+    """
+    n = min(n, len(source))
+    if source.interval or limit is None or limit >= n:
+        return n, source.appended, False
+    return limit, source.appended - n + limit, True
+
+
+def history_json(field, source, n, now, step=1, limit=None, chunk=32):
+    """Yield /history's JSON for field in pieces of up to chunk entries
+
+    source, n, step and limit are as for history_chunks().
+
+    Raw samples are [time, value]; rollup buckets are [start, mean, min, max, readings].
+    """
+    sent, sequence, more = history_page(source, n, limit)
+    yield '{"field": "%s", "now": %d, "interval": %d, "seq": %d, "more": %s, "samples": [' % (
+        field, now, source.interval * step, sequence, "true" if more else "false")
+    batch = []
+    first = True
+    if source.interval:
+        for start, mean, low, high, count in source.window(n, step):
+            if count:
+                batch.append('%s[%d, %s, %s, %s, %d]' % ('' if first else ',', start, mean, low, high, count))
+                first = False
+            if len(batch) == chunk:
+                yield ''.join(batch)
+                batch.clear()
+    else:
+        for timestamp, value in source.window(n, sent):
+            batch.append('%s[%d, %s]' % ('' if first else ',', timestamp, value))
+            first = False
+            if len(batch) == chunk:
+                yield ''.join(batch)
+                batch.clear()
+    yield ''.join(batch) + ']}'
+
+
+def history_chunks(source, field_index, n, now, buffer, step=1, limit=None):
+    """Yield /history.bin in pieces, packed into buffer and sent as memoryview slices
+
+    source is a history RingBuffer or Rollup; n is how many of its newest
+    entries to send, and for a Rollup, step is how many buckets to merge
+    into each one sent. For a RingBuffer only the oldest limit of those n
+    are sent, and the header says whether there are more.
+    """
+    view = memoryview(buffer)
+    value_format = VALUE_FORMATS[source.typecode]
+    value_size = struct.calcsize(value_format)
+    rollup = source.interval != 0
+    record_size = 10 + 2 * value_size if rollup else 4 + value_size
+    n = min(n, len(source))
+    sent, sequence, more = history_page(source, n, limit)
+    if rollup:
+        entries = source.window(n, step)
+        count = groups(n, step)
+    else:
+        entries = source.window(n, sent)
+        count = sent
+
+    struct.pack_into(HISTORY_HEADER, buffer, 0, FORMAT_VERSION, field_index, ord(source.typecode),
+                     MORE if more else 0, now, source.interval * step, count, sequence)
+    used = struct.calcsize(HISTORY_HEADER)
+    for entry in entries:
+        if used + record_size > len(buffer):
+            yield view[:used]
+            used = 0
+        struct.pack_into("<I", buffer, used, entry[0])
+        if rollup:
+            struct.pack_into("<f", buffer, used + 4, entry[1])
+            struct.pack_into(value_format, buffer, used + 8, entry[2])
+            struct.pack_into(value_format, buffer, used + 8 + value_size, entry[3])
+            struct.pack_into("<H", buffer, used + 8 + 2 * value_size, min(entry[4], 0xFFFF))
+        else:
+            struct.pack_into(value_format, buffer, used + 4, entry[1])
+        used += record_size
+    if used:
+        yield view[:used]
@@ -0,0 +1,52 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Host tests for the demo; its modules import each other by bare name, as on the device
+
+demo/ goes at the end of the path: at the front, demo/code.py would shadow
+the standard library's code module, which pytest imports.
+"""
+
+import importlib.util
+import os
+import socket
+import sys
+
+import pytest
+
+DEMO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "demo")
+
+sys.path.append(DEMO_DIR)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def load_demo(monkeypatch):
+    """Returns a function that imports demo/code.py with the simulated sensors and the given
+    SENSORTECH_ settings; importing it starts the server, which is stopped afterwards
+    """
+    pytest.importorskip("adafruit_httpserver")
+    demos = []
+
+    def load(**settings):
+        settings.setdefault("SIMULATE", "1")
+        settings.setdefault("HTTP_DEBUG", "0")
+        settings.setdefault("PORT", str(free_port()))
+        for name, value in settings.items():
+            monkeypatch.setenv("SENSORTECH_" + name, str(value))
+        spec = importlib.util.spec_from_file_location("sensortech_demo", os.path.join(DEMO_DIR, "code.py"))
+        demo = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(demo)
+        demo.port = int(settings["PORT"])
+        demos.append(demo)
+        return demo
+
+    yield load
+    for demo in demos:
+        demo.server.stop()
@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+import pytest
+
+import codec
+from codec import BlockEncoder, BlockStore
+
+FIELDS = (('co2', 1), ('temperature', 100))
+SCALES = [scale for _, scale in FIELDS]
+
+INT32_MIN = -2 ** 31
+INT32_MAX = 2 ** 31 - 1
+
+
+def encoded(rows, fields=FIELDS):
+    """A packed block of rows, (timestamp, values dict), as bytes"""
+    encoder = BlockEncoder(fields, rows=max(1, len(rows)))
+    for timestamp, values in rows:
+        encoder.add(timestamp, values)
+    return bytes(encoder.pack())
+
+
+@pytest.mark.parametrize("n", [0, 1, -1, 2, -2, 63, -64, INT32_MAX, INT32_MIN, 2 ** 32 - 1, -(2 ** 32 - 1)])
+def test_zigzag_round_trip(n):
+    assert codec.unzigzag(codec.zigzag(n)) == n
+    buffer = bytearray(codec.MAX_VARINT + 1)
+    end = codec.put_varint(buffer, 0, codec.zigzag(n))
+    assert codec.get_varint(buffer, 0) == (codec.zigzag(n), end)
+
+
+def test_zigzag_keeps_small_steps_small():
+    assert [codec.zigzag(n) for n in (0, -1, 1, -2, 2)] == [0, 1, 2, 3, 4]
+    # The widest int32 values still fit the varint the columns are sized for
+    assert codec.zigzag(INT32_MIN) == 2 ** 32 - 1
+    buffer = bytearray(codec.MAX_VARINT)
+    assert codec.put_varint(buffer, 0, codec.zigzag(INT32_MIN)) == codec.MAX_VARINT
+
+
+def test_round_trip_with_falling_and_missing_values():
+    rows = [
+        (100, {'co2': 800, 'temperature': 22.5}),
+        (101, {'co2': 650, 'temperature': 21.25}),
+        (103, {'co2': None, 'temperature': -5.5}),
+        (110, {'co2': 420, 'temperature': None}),
+    ]
+    block = encoded(rows)
+    assert codec.block_length(block) == len(block)
+    assert list(codec.decode(block, SCALES)) == [
+        (100, [800, 22.5]), (101, [650, 21.25]), (103, [None, -5.5]), (110, [420, None])]
+    # A time range, and only the columns asked for
+    assert list(codec.decode(block, SCALES, columns=[1], start=101, end=103)) == [(101, [21.25]), (103, [-5.5])]
+
+
+def test_round_trip_at_the_int32_limits():
+    rows = [(0, {'co2': INT32_MAX}), (1, {'co2': INT32_MIN}), (2, {'co2': INT32_MAX}), (3, {'co2': 0})]
+    block = encoded(rows, fields=(('co2', 1),))
+    assert list(codec.decode(block, [1])) == [(0, [INT32_MAX]), (1, [INT32_MIN]), (2, [INT32_MAX]), (3, [0])]
+
+
+def test_empty_block():
+    block = encoded([])
+    assert codec.block_length(block) == len(block) == codec.HEADER_SIZE + 2 * (len(FIELDS) + 1)
+    assert list(codec.decode(block, SCALES)) == []
+
+
+def test_stream_header_round_trip():
+    header = codec.stream_header(FIELDS)
+    assert codec.read_stream_header(header + b"block") == (list(FIELDS), len(header))
+
+
+def test_store_evicts_the_oldest_blocks():
+    blocks = [encoded([(start + row, {'co2': 400 + row, 'temperature': 20.0}) for row in range(4)])
+              for start in range(0, 100, 10)]
+    store = BlockStore(3 * len(blocks[0]))
+    for block in blocks:
+        store.append(block)
+    assert [bytes(block) for block in store.blocks()] == blocks[-3:]
+    assert store.rows == 12
+    # Only the blocks that can hold rows in the range
+    assert [codec.decode(block, SCALES).__next__()[0] for block in store.blocks(85, 92)] == [80, 90]
@@ -0,0 +1,128 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+import os
+import struct
+
+import datalog
+from datalog import DataLog, ENTRY_SIZE, HEADER_SIZE, RECORD_HEADER
+
+
+def logged(directory, readings, batch=4):
+    """A log in directory with readings, (time, field, value), appended and flushed"""
+    log = DataLog(str(directory), 3, interval=0, batch=batch)
+    for timestamp, field, value in readings:
+        log.append(field, value, now=timestamp)
+    log.flush()
+    return log
+
+
+def tear(directory, name, keep):
+    """Cut segment name short, as a power loss in the middle of a write would"""
+    path = os.path.join(str(directory), name)
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:keep])
+
+
+def test_export_round_trip(tmp_path):
+    readings = [(100 + i, i % 3, i * 0.5) for i in range(6)]
+    log = logged(tmp_path, readings[:4])
+    for timestamp, field, value in readings[4:]:
+        log.append(field, value, now=timestamp)
+    # Four flushed, two still in RAM with the next record's number
+    assert log.pending == 2
+    assert list(log.export(0, 1000)) == [(0,) + reading for reading in readings[:4]] + \
+        [(1,) + reading for reading in readings[4:]]
+    assert [reading[1] for reading in log.export(102, 104)] == [102, 103, 104]
+
+    records = [bytes(record) for record in log.export_records(0, 1000)]
+    assert len(records) == 2
+    for sequence, record in enumerate(records):
+        magic, count, number, crc = struct.unpack_from(RECORD_HEADER, record, 0)
+        assert (magic, number) == (datalog.MAGIC, sequence)
+        assert len(record) == HEADER_SIZE + count * ENTRY_SIZE
+        assert crc == datalog.crc32(record[HEADER_SIZE:])
+    # Exporting didn't write the RAM batch
+    assert log.records_written == 1
+
+
+def test_reopen_after_a_torn_record(tmp_path):
+    logged(tmp_path, [(100 + i, 0, i) for i in range(8)])
+    (name,) = os.listdir(str(tmp_path))
+    tear(tmp_path, name, HEADER_SIZE + 4 * ENTRY_SIZE + 5)
+
+    log = DataLog(str(tmp_path), 3, interval=0, batch=4)
+    assert log.torn == 1
+    # The intact record is kept and numbering carries on after the torn one
+    assert [reading[0] for reading in log.export(0, 1000)] == [0] * 4
+    assert log.sequence == 2
+    assert log.segment > name
+
+
+def test_reopen_when_a_later_segments_first_record_is_torn(tmp_path):
+    log = logged(tmp_path, [(100 + i, 0, i) for i in range(4)])
+    log._rotate()
+    log.append(0, 9.0, now=200)
+    log.flush()
+    names = sorted(os.listdir(str(tmp_path)))
+    assert names == ["00000000.log", "00000001.log"]
+    tear(tmp_path, names[-1], 3)
+
+    log = DataLog(str(tmp_path), 3, interval=0, batch=4)
+    # Named after the torn record, so the new segment sorts last and isn't pruned first
+    assert log.sequence == 2
+    assert log.segment == "00000002.log"
+    log.append(0, 1.0, now=300)
+    log.flush()
+    assert [reading[0] for reading in log.export(0, 1000)] == [0] * 4 + [2]
+
+
+class ShortWrite:
+    """A file that takes only part of each write"""
+
+    def __init__(self, path, mode):
+        self.file = open(path, mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+    def write(self, data):
+        return self.file.write(bytes(data[:len(data) // 2]))
+
+
+def test_a_failed_write_starts_a_new_segment(tmp_path, monkeypatch):
+    log = logged(tmp_path, [(100 + i, 0, i) for i in range(4)])
+    monkeypatch.setattr(datalog, "open", ShortWrite, raising=False)
+    for i in range(4):
+        log.append(0, i, now=200 + i)
+    monkeypatch.delattr(datalog, "open")
+    for i in range(4):
+        log.append(0, i, now=300 + i)
+
+    # The half-written batch is lost, the ones either side of it aren't
+    assert log.enabled
+    assert [reading[1] for reading in log.export(0, 1000)] == [100, 101, 102, 103, 300, 301, 302, 303]
+    assert len(os.listdir(str(tmp_path))) == 2
+
+
+def test_an_io_error_starts_a_new_segment(tmp_path, monkeypatch):
+    log = logged(tmp_path, [(100 + i, 0, i) for i in range(4)])
+
+    def failing(path, mode):
+        raise OSError(5, "I/O error")
+
+    monkeypatch.setattr(datalog, "open", failing, raising=False)
+    for i in range(4):
+        log.append(0, i, now=200 + i)
+    monkeypatch.delattr(datalog, "open")
+    assert log.enabled
+    log.append(0, 1.0, now=300)
+    log.flush()
+    assert log.segment != "00000000.log"
+    assert [reading[1] for reading in log.export(0, 1000)] == [100, 101, 102, 103, 300]
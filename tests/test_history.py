@@ -0,0 +1,36 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+from history import Rollup
+
+
+def hourly(start, buckets):
+    """An hourly rollup with one reading in each of buckets hours, the newest starting at start"""
+    rollup = Rollup('H', 3600, 48)
+    for hour in range(buckets):
+        rollup.add(start - (buckets - 1 - hour) * 3600, 400)
+    return rollup
+
+
+def test_since_counts_a_partly_covered_oldest_bucket():
+    rollup = hourly(3600, 2)
+    # Buckets [0, 3600) and [3600, 7200); 2000 falls inside the older one
+    assert rollup.since(2000) == 2
+
+
+def test_since_on_bucket_boundaries():
+    rollup = hourly(7200, 3)
+    # Buckets start at 0, 3600 and 7200
+    assert rollup.since(7200) == 1
+    assert rollup.since(7199) == 2
+    assert rollup.since(3600) == 2
+    assert rollup.since(3599) == 3
+    assert rollup.since(0) == 3
+
+
+def test_since_is_capped_at_the_buckets_held():
+    rollup = hourly(7200, 3)
+    assert rollup.since(-100000) == 3
+    assert rollup.since(100000) == 1
+    assert Rollup('H', 3600, 48).since(0) == 0
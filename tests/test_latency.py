@@ -0,0 +1,69 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Request latency while the simulated sensors are being read
+
+The old loop polled the server once, read every sensor and then slept a
+second, so a request could wait more than a second. With a task per
+sensor, a request waits at most for the server's next poll and whatever
+blocking I2C read is under way.
+"""
+
+import asyncio
+import socket
+import statistics
+import time
+
+# Seconds per simulated I2C transfer, so every read holds up the loop for a while
+I2C_LATENCY = 0.002
+# Seconds the sensors get to come up before the requests start, and seconds of requests
+WARM_UP = 1
+DURATION = 3
+# Generous for a loaded CI machine; the old loop took up to a second
+MEDIAN_LATENCY = 0.02
+MAX_LATENCY = 0.25
+
+
+def get(port, path):
+    """Seconds for one GET, until the server closes the connection"""
+    started = time.perf_counter()
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as s:
+        s.sendall(b"GET %s HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n" % path.encode())
+        while s.recv(4096):
+            pass
+    return time.perf_counter() - started
+
+
+def reads(demo):
+    return sum(stats.reads for stats in demo.metrics.sensors.values())
+
+
+def test_requests_are_served_while_sensors_are_read(load_demo):
+    demo = load_demo(I2C_LATENCY=I2C_LATENCY)
+    port = demo.port
+
+    def client():
+        deadline = time.monotonic() + DURATION
+        latencies = []
+        while time.monotonic() < deadline:
+            latencies.append(get(port, "/data"))
+            time.sleep(0.01)
+        return latencies
+
+    async def run():
+        task = asyncio.create_task(demo.main())
+        try:
+            await asyncio.sleep(WARM_UP)
+            before = reads(demo)
+            latencies = await asyncio.to_thread(client)
+            return latencies, reads(demo) - before
+        finally:
+            task.cancel()
+
+    latencies, sensor_reads = asyncio.run(run())
+
+    # The sensors kept being read between the requests
+    assert sensor_reads >= 3
+    assert statistics.median(latencies) < MEDIAN_LATENCY
+    assert max(latencies) < MAX_LATENCY
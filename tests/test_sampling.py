@@ -0,0 +1,49 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""The sensor tasks survive bus errors in the battery profiles
+
+In single_shot, the SCD41's single shot and the ENS160's wake-up are
+started ahead of each slot. A bus error there has to be counted like a
+failed read, not end the task, which would take the whole demo down with it.
+The SCD41 is up within a second, so it's the one made to fail; the ENS160
+goes through the same wait_for_slot() but takes 11 s to bring up.
+"""
+
+import asyncio
+
+# Seconds between slots, and seconds to run for
+INTERVAL = 2
+DURATION = 5
+
+
+def test_failed_starts_dont_stop_the_demo(load_demo):
+    demo = load_demo(POWER_PROFILE="single_shot", POWER_INTERVAL=INTERVAL, I2C_LATENCY=0)
+    bus = demo.i2c
+
+    def failing(start):
+        """start() with every transfer on the simulated bus failing"""
+        def wrapper():
+            bus.error_rate = 1.0
+            try:
+                start()
+            finally:
+                bus.error_rate = 0.0
+        return wrapper
+
+    async def run():
+        task = asyncio.create_task(demo.main())
+        demo.scd.start = failing(demo.scd.start)
+        try:
+            await asyncio.sleep(DURATION)
+            # gather() would have finished with the task's exception
+            assert not task.done()
+        finally:
+            task.cancel()
+
+    asyncio.run(run())
+
+    assert demo.metrics.sensor(demo.scd.name).errors >= 1
+    # The sensors without an on-demand measurement kept being read
+    assert demo.metrics.sensor(demo.aht21.name).reads >= 2
@@ -0,0 +1,255 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Telemetry against a loopback UDP socket and a minimal MQTT broker
+
+The broker only accepts a connection and reads packets. A throttled stand-in
+for the socket module makes the board's sends go out a few bytes at a
+time, the way a busy Wi-Fi link takes them.
+"""
+
+import errno
+import socket
+import struct
+import time
+
+import pytest
+
+import telemetry
+from telemetry import Telemetry
+
+BOOT_ID = 0x123456
+# Readings that survive the trip through f32 exactly
+SAMPLES = [(index % 11, 100 + index, 1000 + index, index * 0.25) for index in range(8)]
+
+
+class Throttled:
+    """The socket module, but stream sockets send at most budget bytes until given more"""
+
+    def __init__(self):
+        self.budget = None
+
+    def __getattr__(self, name):
+        return getattr(socket, name)
+
+    def socket(self, *args):
+        return ThrottledSocket(self, socket.socket(*args))
+
+
+class ThrottledSocket:
+    def __init__(self, pool, sock):
+        self.pool = pool
+        self.sock = sock
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def send(self, data):
+        if self.pool.budget is None:
+            return self.sock.send(data)
+        if not self.pool.budget:
+            raise OSError(errno.EAGAIN, "Throttled")
+        sent = self.sock.send(data[:self.pool.budget])
+        self.pool.budget -= sent
+        return sent
+
+
+class Broker:
+    """Accepts one connection at a time and splits what arrives into MQTT packets"""
+
+    def __init__(self):
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(1)
+        self.listener.settimeout(2)
+        self.address = self.listener.getsockname()
+        self.connection = None
+        self.data = b""
+
+    def accept(self):
+        self.connection, _ = self.listener.accept()
+        self.connection.setblocking(False)
+        self.data = b""
+
+    def receive(self):
+        try:
+            while True:
+                chunk = self.connection.recv(4096)
+                if not chunk:
+                    return
+                self.data += chunk
+        except BlockingIOError:
+            pass
+
+    def packets(self):
+        """(type, body) for each whole packet received on the current connection"""
+        packets = []
+        offset = 0
+        while offset < len(self.data):
+            length = shift = 0
+            index = offset + 1
+            while index < len(self.data):
+                byte = self.data[index]
+                index += 1
+                length |= (byte & 0x7F) << shift
+                shift += 7
+                if not byte & 0x80:
+                    break
+            else:
+                break
+            if index + length > len(self.data):
+                break
+            packets.append((self.data[offset] >> 4, self.data[index:index + length]))
+            offset = index + length
+        return packets
+
+    def published(self):
+        """The batches in the PUBLISH packets received so far"""
+        batches = []
+        for kind, body in self.packets():
+            if kind == 3:
+                topic_length = struct.unpack_from(">H", body, 0)[0]
+                batches.append(body[2 + topic_length:])
+        return batches
+
+    def hang_up(self):
+        self.connection.close()
+        self.connection = None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.listener.close()
+
+
+@pytest.fixture
+def broker():
+    broker = Broker()
+    yield broker
+    broker.close()
+
+
+def pump(sender, until, broker=None, timeout=2):
+    """tick() until until() is true"""
+    deadline = time.monotonic() + timeout
+    while not until():
+        assert time.monotonic() < deadline, "timed out"
+        sender.tick()
+        if broker is not None and broker.connection is not None:
+            broker.receive()
+        time.sleep(0.001)
+
+
+def fill(sender, samples=SAMPLES):
+    for sample in samples:
+        sender.append(*sample)
+
+
+def decoded(payload):
+    boot_id, number, entries = telemetry.decode(payload)
+    return boot_id, number, list(entries)
+
+
+def test_decode_round_trip():
+    sender = Telemetry(socket, ("127.0.0.1", 9), BOOT_ID, batch=len(SAMPLES))
+    fill(sender)
+    (payload,) = sender.queue
+    assert decoded(payload) == (BOOT_ID, 0, SAMPLES)
+    with pytest.raises(ValueError):
+        telemetry.decode(b"\x00" * len(payload))
+    # A count the payload is too short for
+    with pytest.raises(ValueError):
+        telemetry.decode(payload[:-1])
+
+
+def test_udp_batches_arrive():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(2)
+    try:
+        sender = Telemetry(socket, receiver.getsockname(), BOOT_ID, batch=4)
+        fill(sender)
+        sender.tick()
+        batches = [decoded(receiver.recv(2048)) for _ in range(2)]
+        sender.close()
+    finally:
+        receiver.close()
+    assert batches == [(BOOT_ID, 0, SAMPLES[:4]), (BOOT_ID, 1, SAMPLES[4:])]
+    assert (sender.batches_sent, sender.samples_sent) == (2, 8)
+
+
+def test_mqtt_partial_publish_counts_once(broker):
+    pool = Throttled()
+    sender = Telemetry(pool, broker.address, BOOT_ID, protocol="mqtt", batch=len(SAMPLES))
+    fill(sender)
+    pool.budget = 0
+    sender.tick()
+    broker.accept()
+    # The CONNECT and PUBLISH dribble out a few bytes per tick
+    for _ in range(200):
+        pool.budget = 7
+        sender.tick()
+        broker.receive()
+        if broker.published():
+            break
+        assert sender.batches_sent == 0
+        assert len(sender.queue) == 1
+    pump(sender, lambda: not sender.queue, broker)
+    assert [decoded(batch) for batch in broker.published()] == [(BOOT_ID, 0, SAMPLES)]
+    assert (sender.batches_sent, sender.samples_sent) == (1, len(SAMPLES))
+    sender.close()
+
+
+def test_mqtt_resends_after_the_broker_hangs_up(broker):
+    pool = Throttled()
+    sender = Telemetry(pool, broker.address, BOOT_ID, protocol="mqtt", batch=len(SAMPLES))
+    fill(sender)
+    pool.budget = 60
+    sender.tick()
+    broker.accept()
+    pump(sender, lambda: len(broker.data) >= 60, broker)
+    # Part of the PUBLISH has gone when the broker drops the connection
+    assert sender.front_in_flight
+    broker.hang_up()
+    pump(sender, lambda: sender.errors, timeout=2)
+    assert (sender.batches_sent, len(sender.queue)) == (0, 1)
+
+    pool.budget = None
+    sender.retry_at = 0
+    sender.tick()
+    broker.accept()
+    pump(sender, lambda: not sender.queue, broker)
+    pump(sender, lambda: broker.published(), broker)
+    # The new connection gets the whole batch again, from the start
+    assert [kind for kind, _ in broker.packets()] == [1, 3]
+    assert [decoded(batch) for batch in broker.published()] == [(BOOT_ID, 0, SAMPLES)]
+    assert (sender.batches_sent, sender.samples_sent, sender.connects) == (1, len(SAMPLES), 2)
+    sender.close()
+
+
+def test_full_queue_drops_the_oldest_batch():
+    sender = Telemetry(socket, ("127.0.0.1", 9), BOOT_ID, batch=2, queue=2)
+    fill(sender, SAMPLES[:6])
+    assert sender.dropped == 1
+    assert [decoded(batch)[1] for batch in sender.queue] == [1, 2]
+
+
+def test_full_queue_keeps_a_half_sent_batch(broker):
+    pool = Throttled()
+    sender = Telemetry(pool, broker.address, BOOT_ID, protocol="mqtt", batch=2, queue=2)
+    fill(sender, SAMPLES[:2])
+    # The CONNECT and part of the PUBLISH
+    pool.budget = 40
+    sender.tick()
+    broker.accept()
+    pump(sender, lambda: sender.front_in_flight, broker)
+    fill(sender, SAMPLES[2:6])
+    # Batch 0 is going out, so batch 1 is the one dropped
+    assert sender.dropped == 1
+    assert [decoded(batch)[1] for batch in sender.queue] == [0, 2]
+    pool.budget = None
+    pump(sender, lambda: not sender.queue, broker)
+    pump(sender, lambda: len(broker.published()) == 2, broker)
+    assert [decoded(batch)[1] for batch in broker.published()] == [0, 2]
+    sender.close()
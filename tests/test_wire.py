@@ -0,0 +1,98 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+import json
+import struct
+
+import wire
+from history import RingBuffer, Rollup
+from wire import FIELDS, DataEncoder
+
+
+def parse_data(payload):
+    """Decode /data.bin by the layout documented in wire.py"""
+    version, count, present, sequence, timestamp = struct.unpack_from("<BBHII", payload, 0)
+    offset = 12
+    values = {}
+    for index, (field, typecode) in enumerate(FIELDS[:count]):
+        size = 2 if typecode == 'H' else 4
+        value = struct.unpack_from("<H" if typecode == 'H' else "<f", payload, offset)[0]
+        values[field] = value if present & (1 << index) else None
+        offset += size
+    freshness = {}
+    for field, _ in FIELDS[:count]:
+        freshness[field] = struct.unpack_from("<BH", payload, offset)
+        offset += 3
+    assert offset == len(payload)
+    return version, sequence, timestamp, values, freshness
+
+
+def test_data_round_trip():
+    values = {field: None for field, _ in FIELDS}
+    values.update(co2=812, temperature=21.5, ens_eco2=450)
+    seqs = {field: 0 for field, _ in FIELDS}
+    seqs.update(co2=300, temperature=300, ens_eco2=7)
+    times = {field: None for field, _ in FIELDS}
+    times.update(co2=995, temperature=995, ens_eco2=1000)
+
+    payload = bytes(DataEncoder(FIELDS).encode(values, seqs, times, 2 ** 32 + 5, 1000))
+    version, sequence, timestamp, decoded, freshness = parse_data(payload)
+    assert (version, sequence, timestamp) == (wire.FORMAT_VERSION, 5, 1000)
+    assert decoded == values
+    # Only the low byte of the count, and the age of the latest sample
+    assert freshness['co2'] == (300 & 0xFF, 5)
+    assert freshness['ens_eco2'] == (7, 0)
+    assert freshness['humidity'] == (0, 0xFFFF)
+
+
+def ring(samples, capacity=10):
+    buffer = RingBuffer('H', capacity)
+    for index in range(samples):
+        buffer.append(100 + index, index)
+    return buffer
+
+
+def test_history_page():
+    source = ring(8)
+    # Every sample when there's no limit, or it's big enough
+    assert wire.history_page(source, 8) == (8, 8, False)
+    assert wire.history_page(source, 5, 5) == (5, 8, False)
+    # since=2 with limit=4: samples 3 to 6, with more to come
+    assert wire.history_page(source, source.after(2), 4) == (4, 6, True)
+    assert wire.history_page(source, source.after(6), 4) == (2, 8, False)
+    # More than are held
+    assert wire.history_page(source, 50, 4) == (4, 4, True)
+
+
+def test_history_page_after_wrapping():
+    source = ring(25)
+    # Samples 16 to 25 are held; anything older is gone
+    assert source.after(3) == 10
+    assert wire.history_page(source, source.after(3), 4) == (4, 19, True)
+    assert [value for _, value in source.window(10, 4)] == [15, 16, 17, 18]
+
+
+def test_history_page_rollup_sends_every_bucket():
+    rollup = Rollup('H', 60, 10)
+    for minute in range(5):
+        rollup.add(minute * 60, 400)
+    assert wire.history_page(rollup, 5, 2) == (5, rollup.appended, False)
+
+
+def test_history_json_and_binary_agree():
+    source = ring(8)
+    page = json.loads("".join(wire.history_json('co2', source, source.after(2), 500, limit=4, chunk=3)))
+    assert page == {"field": "co2", "now": 500, "interval": 0, "seq": 6, "more": True,
+                    "samples": [[102, 2], [103, 3], [104, 4], [105, 5]]}
+
+    body = b"".join(bytes(chunk) for chunk in
+                    wire.history_chunks(source, 0, source.after(2), 500, bytearray(64), limit=4))
+    version, index, typecode, flags, now, interval, count, sequence = \
+        struct.unpack_from(wire.HISTORY_HEADER, body, 0)
+    assert (version, index, chr(typecode), flags, now, interval, count, sequence) == \
+        (wire.FORMAT_VERSION, 0, 'H', wire.MORE, 500, 0, 4, 6)
+    offset = struct.calcsize(wire.HISTORY_HEADER)
+    samples = [list(struct.unpack_from("<IH", body, offset + 6 * i)) for i in range(count)]
+    assert samples == page["samples"]
+    assert len(body) == offset + 6 * count
@@ -0,0 +1,374 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Benchmark the demo's sensor loop and HTTP server on a host
+
+Runs demo/code.py in this process against the simulated sensors, and
+drives it from a separate process with K simulated dashboards that load
+the page once and then poll /data. Reports request latency, requests per
+second, event loop jitter and bytes allocated per request.
+
+    python tools/bench.py --clients 8 --duration 20 --save
+    python tools/bench.py --clients 8 --duration 20
+
+The first run saves a baseline, later runs are compared against it and
+exit non-zero when something got worse by more than --tolerance.
+
+--sweep repeats the load at each of a list of dashboard counts and reports
+the server's CPU time per request, which should stay flat as they grow:
+
+    python tools/bench.py --sweep 1,5,10,20
+
+Needs adafruit-circuitpython-httpserver installed on the host.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+DEMO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "demo")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench-baseline.json")
+
+HISTORY_FIELDS = ("co2", "eco2", "tvoc", "ens_tvoc", "ens_eco2",
+                  "temperature", "humidity", "aht21_temperature", "aht21_humidity")
+
+# Routes measured one request at a time for allocations
+ALLOC_ROUTES = ("/", "/data", "/data.bin", "/history?field=co2&n=120", "/history.bin?field=co2&n=120",
+                "/chart.js")
+ALLOC_REQUESTS = 20
+
+# How often the probe task asks to be woken, to measure event loop lateness
+PROBE_INTERVAL = 0.01
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ---- Client side, runs in its own process so its work doesn't skew the server's numbers
+
+
+async def fetch(port, path, headers=None):
+    """One HTTP/1.1 GET; returns (seconds, status, bytes received, etag)"""
+    lines = [f"GET {path} HTTP/1.1", "Host: 127.0.0.1", "Accept-Encoding: gzip"]
+    for name, value in (headers or {}).items():
+        lines.append(f"{name}: {value}")
+    request = ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    await writer.drain()
+    # The device server always closes the connection after a response
+    response = await reader.read()
+    elapsed = time.perf_counter() - started
+    writer.close()
+
+    head, _, _ = response.partition(b"\r\n\r\n")
+    status = int(head[9:12]) if len(head) >= 12 else 0
+    etag = None
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"etag":
+            etag = value.strip().decode()
+    return elapsed, status, len(response), etag
+
+
+async def dashboard(port, deadline, interval, results):
+    """Behave like one browser: load the page and history, then poll /data"""
+
+    async def timed(route, path, headers=None):
+        try:
+            elapsed, status, size, etag = await fetch(port, path, headers)
+        except OSError:
+            results.setdefault(route, {"latency": [], "bytes": 0, "errors": 0})["errors"] += 1
+            return None
+        stats = results.setdefault(route, {"latency": [], "bytes": 0, "errors": 0})
+        stats["latency"].append(elapsed)
+        stats["bytes"] += size
+        if status >= 400:
+            stats["errors"] += 1
+        return etag
+
+    await timed("/", "/")
+    await timed("/chart.js", "/chart.js")
+    for field in HISTORY_FIELDS:
+        await timed("/history", f"/history?field={field}&n=120")
+
+    etag = None
+    while time.perf_counter() < deadline:
+        headers = {"If-None-Match": etag} if etag else None
+        etag = await timed("/data", "/data", headers) or etag
+        await asyncio.sleep(interval)
+
+
+async def drive(port, clients, duration, interval):
+    results = {}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(dashboard(port, deadline, interval, results) for _ in range(clients)))
+    return results, time.perf_counter() - started
+
+
+async def sequential(port, paths, count):
+    for path in paths:
+        for _ in range(count):
+            await fetch(port, path)
+
+
+def client_process(mode, port, args, queue):
+    if mode == "load":
+        queue.put(asyncio.run(drive(port, *args)))
+    else:
+        asyncio.run(sequential(port, *args))
+        queue.put(None)
+
+
+def run_client(mode, port, *args):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=client_process, args=(mode, port, args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+# ---- Server side
+
+
+def load_demo(port):
+    """Import demo/code.py with the simulated sensors; this starts the server"""
+    os.environ["SENSORTECH_SIMULATE"] = "1"
+    os.environ["SENSORTECH_HTTP_DEBUG"] = "0"
+    os.environ["SENSORTECH_PORT"] = str(port)
+    # At the end, so demo/code.py can't shadow the standard library's code module
+    sys.path.append(DEMO_DIR)
+    spec = importlib.util.spec_from_file_location("sensortech_demo", os.path.join(DEMO_DIR, "code.py"))
+    demo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(demo)
+    return demo
+
+
+def start_loop(demo, lateness):
+    """Run the demo's tasks plus a lateness probe on a background thread"""
+
+    async def probe():
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(PROBE_INTERVAL)
+            lateness.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+    async def run():
+        asyncio.create_task(probe())
+        await demo.main()
+
+    thread = threading.Thread(target=asyncio.run, args=(run(),), daemon=True)
+    thread.start()
+
+
+def measure_allocations(demo, port):
+    """Peak bytes the server allocates while handling each request, by route"""
+    server = demo.server
+    poll = server.poll
+    find_handler = server._find_handler
+    current = {}
+    allocations = {}
+
+    def tracking_find_handler(method, path):
+        current["path"] = path
+        return find_handler(method, path)
+
+    def tracking_poll():
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = poll()
+        if "path" in current:
+            peak = tracemalloc.get_traced_memory()[1]
+            allocations.setdefault(current.pop("path"), []).append(peak - before)
+        return result
+
+    server._find_handler = tracking_find_handler
+    server.poll = tracking_poll
+    tracemalloc.start()
+    try:
+        run_client("sequential", port, ALLOC_ROUTES, ALLOC_REQUESTS)
+    finally:
+        tracemalloc.stop()
+        server.poll = poll
+        server._find_handler = find_handler
+    return {path: percentile(values, 0.5) for path, values in allocations.items()}
+
+
+def sweep(demo, port, counts, duration, interval):
+    """Server CPU time per request and snapshots encoded, for each number of dashboards
+
+    The server runs on a thread of this process and the dashboards in
+    another process, so this process's CPU time is the server's.
+    """
+    rows = []
+    for clients in counts:
+        builds = demo.publisher.builds
+        cpu = time.process_time()
+        results, elapsed = run_client("load", port, clients, duration, interval)
+        cpu = time.process_time() - cpu
+        requests = sum(len(stats["latency"]) for stats in results.values())
+        rows.append({
+            "clients": clients,
+            "requests": requests,
+            "requests_per_s": round(requests / elapsed, 1),
+            "cpu_us_per_request": round(cpu / max(1, requests) * 1000000),
+            "snapshots_built": demo.publisher.builds - builds,
+        })
+    return rows
+
+
+def summarize(results, elapsed, lateness, allocations):
+    routes = {}
+    total = 0
+    for route, stats in sorted(results.items()):
+        latency = stats["latency"]
+        total += len(latency)
+        routes[route] = {
+            "requests": len(latency),
+            "errors": stats["errors"],
+            "p50_ms": round(percentile(latency, 0.5) * 1000, 3),
+            "p99_ms": round(percentile(latency, 0.99) * 1000, 3),
+            "bytes_per_request": stats["bytes"] // max(1, len(latency)),
+            "alloc_bytes_per_request": allocations.get(route),
+        }
+    if "/chart.js" in results and results["/chart.js"]["latency"]:
+        stats = results["/chart.js"]
+        routes["/chart.js"]["kb_per_s"] = round(stats["bytes"] / sum(stats["latency"]) / 1024, 1)
+    return {
+        "requests_per_s": round(total / elapsed, 1),
+        "loop_jitter_p50_ms": round(percentile(lateness, 0.5) * 1000, 3),
+        "loop_jitter_p99_ms": round(percentile(lateness, 0.99) * 1000, 3),
+        "loop_jitter_max_ms": round(max(lateness) * 1000, 3),
+        "routes": routes,
+    }
+
+
+# ---- Reporting and baselines
+
+
+def report(summary):
+    print(f"requests/s: {summary['requests_per_s']}")
+    print(f"loop jitter p50/p99/max: {summary['loop_jitter_p50_ms']} / "
+          f"{summary['loop_jitter_p99_ms']} / {summary['loop_jitter_max_ms']} ms")
+    print(f"{'route':<12}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}"
+          f"{'bytes':>10}{'alloc':>10}")
+    for route, stats in summary["routes"].items():
+        alloc = stats["alloc_bytes_per_request"]
+        print(f"{route:<12}{stats['requests']:>10}{stats['errors']:>8}{stats['p50_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['bytes_per_request']:>10}"
+              f"{'-' if alloc is None else alloc:>10}")
+    if "sweep" in summary:
+        print(f"\n{'clients':>8}{'requests':>10}{'req/s':>10}{'cpu us/req':>12}{'snapshots':>11}")
+        for row in summary["sweep"]:
+            print(f"{row['clients']:>8}{row['requests']:>10}{row['requests_per_s']:>10}"
+                  f"{row['cpu_us_per_request']:>12}{row['snapshots_built']:>11}")
+
+
+def flatten(summary):
+    """Metric name -> (value, True if bigger is worse)"""
+    flat = {
+        "requests_per_s": (summary["requests_per_s"], False),
+        "loop_jitter_p99_ms": (summary["loop_jitter_p99_ms"], True),
+    }
+    for route, stats in summary["routes"].items():
+        for name in ("p50_ms", "p99_ms", "bytes_per_request", "alloc_bytes_per_request"):
+            if stats.get(name) is not None:
+                flat[f"{route} {name}"] = (stats[name], True)
+    return flat
+
+
+def compare(summary, baseline, tolerance):
+    """Print changes against the baseline; returns the metrics that regressed"""
+    regressions = []
+    old = flatten(baseline)
+    for name, (value, bigger_is_worse) in flatten(summary).items():
+        if name not in old or not old[name][0]:
+            continue
+        before = old[name][0]
+        change = (value - before) / before
+        worse = change > tolerance if bigger_is_worse else change < -tolerance
+        print(f"{'REGRESSED ' if worse else '          '}{name}: {before} -> {value} ({change:+.0%})")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=4, help="simulated dashboards")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of /data polling")
+    parser.add_argument("--interval", type=float, default=0.1,
+                        help="seconds between /data polls per dashboard")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="save this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed fractional change before a metric counts as a regression")
+    parser.add_argument("--json", help="also write this run's results to a file")
+    parser.add_argument("--sweep", help="comma-separated dashboard counts to also run, e.g. 1,5,10,20")
+    args = parser.parse_args()
+
+    # Keep the demo's console output out of the report
+    console = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        port = free_port()
+        demo = load_demo(port)
+        lateness = []
+        start_loop(demo, lateness)
+
+        results, elapsed = run_client("load", port, args.clients, args.duration, args.interval)
+        allocations = measure_allocations(demo, port)
+        if args.sweep:
+            counts = [int(count) for count in args.sweep.split(",")]
+            sweep_rows = sweep(demo, port, counts, args.duration, args.interval)
+    finally:
+        sys.stdout = console
+    summary = summarize(results, elapsed, lateness, allocations)
+    if args.sweep:
+        summary["sweep"] = sweep_rows
+    summary["config"] = {"clients": args.clients, "duration": args.duration,
+                         "interval": args.interval}
+
+    report(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.baseline}:")
+        if compare(summary, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Decode the demo's compressed history to CSV
+
+Reads a stream of blocks from the device's /blocks route, or from a file
+saved from it, and writes one CSV row per snapshot.
+
+    python tools/blocks.py http://192.168.4.1/blocks > history.csv
+    python tools/blocks.py blocks.bin --fields co2,ens_eco2 --from 600 --to 1200
+    python tools/blocks.py http://127.0.0.1:8080/blocks --stats
+"""
+
+import argparse
+import csv
+import os
+import sys
+import urllib.request
+
+# At the end, so demo/code.py can't shadow the standard library's code module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "demo"))
+
+import codec  # noqa: E402
+
+# What the same readings cost in the demo's RAM ring buffers: a u32
+# timestamp plus a u16 or f32 value, call it 7 bytes
+RING_BYTES_PER_VALUE = 7
+
+
+def load(source):
+    if source.startswith(("http://", "https://")):
+        with urllib.request.urlopen(source) as response:
+            return response.read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def split_blocks(data, offset):
+    """Yield each block in data from offset on"""
+    view = memoryview(data)
+    while offset < len(data):
+        length = codec.block_length(data, offset)
+        yield view[offset:offset + length]
+        offset += length
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("source", help="URL of /blocks, or a file saved from it")
+    parser.add_argument("--fields", help="comma-separated fields to decode, default all")
+    parser.add_argument("--from", dest="start", type=int, default=0,
+                        help="first time to include, seconds since boot")
+    parser.add_argument("--to", dest="end", type=int, default=0xFFFFFFFF,
+                        help="last time to include, seconds since boot")
+    parser.add_argument("--stats", action="store_true",
+                        help="report the compression instead of writing CSV")
+    args = parser.parse_args()
+
+    data = load(args.source)
+    fields, offset = codec.read_stream_header(data)
+    names = [name for name, _ in fields]
+    scales = [scale for _, scale in fields]
+    columns = None
+    if args.fields:
+        wanted = args.fields.split(",")
+        unknown = [name for name in wanted if name not in names]
+        if unknown:
+            parser.error(f"Unknown fields: {', '.join(unknown)}")
+        columns = [names.index(name) for name in wanted]
+
+    if args.stats:
+        blocks = rows = values = 0
+        for block in split_blocks(data, offset):
+            blocks += 1
+            for _, row in codec.decode(block, scales):
+                rows += 1
+                values += sum(value is not None for value in row)
+        compressed = len(data) - offset
+        print(f"{blocks} blocks, {rows} rows, {values} values in {compressed} bytes")
+        if rows:
+            ratio = values * RING_BYTES_PER_VALUE / max(1, compressed)
+            print(f"{compressed / rows:.1f} bytes per row, "
+                  f"{ratio:.1f}x smaller than the same values in the ring buffers")
+        return
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["time"] + [names[column] for column in columns or range(len(names))])
+    for block in split_blocks(data, offset):
+        for timestamp, row in codec.decode(block, scales, columns, args.start, args.end):
+            writer.writerow([timestamp] + ["" if value is None else value for value in row])
+
+
+if __name__ == "__main__":
+    main()
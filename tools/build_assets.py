@@ -0,0 +1,36 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Build gzipped copies of the demo's static files
+
+The device serves foo.gz in place of foo to browsers that accept gzip.
+Run this after changing any of the files below, then copy the .gz files
+to CIRCUITPY along with the rest of the demo.
+
+    python tools/build_assets.py
+"""
+
+import gzip
+import os
+import sys
+
+DEMO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "demo")
+
+ASSETS = ["index.html", "chart.js", "chart-fallback.js"]
+
+
+def build(directory):
+    for name in ASSETS:
+        source = os.path.join(directory, name)
+        with open(source, "rb") as f:
+            data = f.read()
+        # mtime=0 keeps the output, and so the device's ETag, stable across rebuilds
+        packed = gzip.compress(data, compresslevel=9, mtime=0)
+        with open(source + ".gz", "wb") as f:
+            f.write(packed)
+        print(f"{name}: {len(data)} -> {len(packed)} bytes")
+
+
+if __name__ == "__main__":
+    build(sys.argv[1] if len(sys.argv) > 1 else DEMO_DIR)
@@ -0,0 +1,202 @@
+# SPDX-FileCopyrightText: 2025 John Romkey
+#
+# SPDX-License-Identifier: CC0-1.0
+
+"""Receive the demo's pushed telemetry and measure what it costs
+
+Stands in for the collector: a UDP listener, or just enough of an MQTT
+broker (CONNECT, QoS 0 PUBLISH, PINGREQ) to take the demo's batches.
+Every few seconds it reports messages and samples per second, bytes on the
+wire per sample, and batches lost or repeated going by the batch numbers.
+
+    python tools/sink.py --udp 9999
+    SENSORTECH_TELEMETRY=udp SENSORTECH_TELEMETRY_PORT=9999 python demo/code.py
+
+    python tools/sink.py --mqtt 1883
+    SENSORTECH_TELEMETRY=mqtt SENSORTECH_TELEMETRY_PORT=1883 python demo/code.py
+
+--drive RATE runs the demo's Telemetry class in this process instead,
+feeding it RATE samples a second, and also reports its CPU time per sample.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+
+# At the end, so demo/code.py can't shadow the standard library's code module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "demo"))
+
+import telemetry  # noqa: E402
+
+# MQTT control packet types
+CONNECT = 1
+PUBLISH = 3
+PINGREQ = 12
+DISCONNECT = 14
+
+
+class Tally:
+    """What's been received since the last report"""
+
+    def __init__(self):
+        self.messages = 0
+        self.samples = 0
+        self.bytes = 0
+        self.lost = 0
+        self.repeated = 0
+        self.bad = 0
+        # boot id -> next batch number expected
+        self.expected = {}
+        self.started = time.monotonic()
+
+    def receive(self, payload, wire_bytes):
+        self.messages += 1
+        self.bytes += wire_bytes
+        try:
+            boot_id, number, entries = telemetry.decode(payload)
+        except (ValueError, struct.error):
+            self.bad += 1
+            return
+        expected = self.expected.get(boot_id)
+        if expected is not None:
+            if number < expected:
+                self.repeated += 1
+                return
+            self.lost += number - expected
+        self.expected[boot_id] = number + 1
+        self.samples += sum(1 for _ in entries)
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        per_sample = self.bytes / self.samples if self.samples else 0
+        print(f"{self.messages / elapsed:.1f} messages/s, {self.samples / elapsed:.1f} samples/s, "
+              f"{per_sample:.1f} bytes/sample, {self.lost} lost, {self.repeated} repeated, {self.bad} bad",
+              flush=True)
+        self.messages = self.samples = self.bytes = 0
+        self.started = time.monotonic()
+
+
+class UDPSink(asyncio.DatagramProtocol):
+    def __init__(self, tally):
+        self.tally = tally
+
+    def datagram_received(self, data, address):
+        # Plus the UDP and IPv4 headers
+        self.tally.receive(data, len(data) + 28)
+
+
+async def read_packet(reader):
+    """Return (type, body, bytes on the wire) for the next MQTT control packet"""
+    first = (await reader.readexactly(1))[0]
+    length = shift = 0
+    size = 1
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        size += 1
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    body = await reader.readexactly(length)
+    return first >> 4, body, size + length
+
+
+def mqtt_client(tally):
+    async def handle(reader, writer):
+        try:
+            while True:
+                kind, body, size = await read_packet(reader)
+                if kind == CONNECT:
+                    writer.write(b"\x20\x02\x00\x00")
+                elif kind == PUBLISH:
+                    topic_length = int.from_bytes(body[:2], "big")
+                    tally.receive(body[2 + topic_length:], size)
+                elif kind == PINGREQ:
+                    writer.write(b"\xd0\x00")
+                elif kind == DISCONNECT:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+def drive(protocol, port, rate, duration, batch):
+    """Feed a Telemetry rate samples a second from another thread; returns its CPU seconds per sample"""
+    sender = telemetry.Telemetry(socket, ("127.0.0.1", port), random.getrandbits(24), protocol=protocol,
+                                 batch=batch, max_age=1, queue=64)
+    cpu = 0.0
+    count = 0
+    start = time.monotonic()
+    next_due = start
+    while time.monotonic() - start < duration:
+        began = time.thread_time()
+        for _ in range(max(1, rate // 100)):
+            count += 1
+            sender.append(count % 11, count, int(time.monotonic() - start), 400 + count % 100)
+        sender.tick()
+        cpu += time.thread_time() - began
+        next_due += max(1, rate // 100) / rate
+        time.sleep(max(0, next_due - time.monotonic()))
+    sender.seal()
+    while sender.queue and time.monotonic() - start < duration + 5:
+        sender.tick()
+        time.sleep(0.01)
+    sender.close()
+    return cpu / count if count else 0
+
+
+async def run(args):
+    tally = Tally()
+    loop = asyncio.get_running_loop()
+    if args.mqtt:
+        protocol, port = "mqtt", args.mqtt
+        await asyncio.start_server(mqtt_client(tally), "127.0.0.1", port)
+    else:
+        protocol, port = "udp", args.udp
+        await loop.create_datagram_endpoint(lambda: UDPSink(tally), local_addr=("127.0.0.1", port))
+    print(f"Listening for {protocol} on port {port}", flush=True)
+
+    driver = None
+    result = {}
+    if args.drive:
+        def target():
+            result["cpu"] = drive(protocol, port, args.drive, args.duration, args.batch)
+        driver = threading.Thread(target=target, daemon=True)
+        driver.start()
+
+    started = time.monotonic()
+    while args.duration is None or time.monotonic() - started < args.duration + (2 if driver else 0):
+        await asyncio.sleep(args.every)
+        tally.report()
+    if driver is not None:
+        driver.join()
+        print(f"Publisher CPU: {result['cpu'] * 1e6:.1f} us/sample")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--udp", type=int, default=9999, help="UDP port to listen on")
+    parser.add_argument("--mqtt", type=int, help="act as an MQTT broker on this port instead")
+    parser.add_argument("--every", type=float, default=5, help="seconds between reports")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--drive", type=int, metavar="RATE", help="push RATE samples/s from this process")
+    parser.add_argument("--batch", type=int, default=32, help="samples per batch with --drive")
+    args = parser.parse_args()
+    if args.drive and args.duration is None:
+        args.duration = 10
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()